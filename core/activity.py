@@ -0,0 +1,116 @@
+"""Merged admin activity stream (claims, POS redemptions, on-chain txs).
+
+Each source is read newest-first with a keyset predicate on ``(timestamp, id)``,
+so a page costs one bounded index range scan per source however far back the
+admin scrolls. The three sorted runs are k-way merged in Python and the last row
+becomes the cursor for the next page.
+"""
+import base64
+import datetime
+import heapq
+import uuid
+from typing import Optional
+
+from django.db import connection
+
+DEFAULT_LIMIT = 15
+MAX_LIMIT = 100
+
+# Each query returns (ts, id, user, detail) newest-first.
+_SOURCES = {
+    "user_register": """
+        SELECT cr.created_at, cr.id, COALESCE(cr.email, cr.phone, 'unknown'), cr.result
+        FROM claim_request cr
+        WHERE cr.created_at IS NOT NULL {before}
+        ORDER BY cr.created_at DESC, cr.id DESC
+        LIMIT %s
+    """,
+    "voucher_redeem": """
+        SELECT pr.reserved_at, pr.id, vt.slug, pr.status
+        FROM pos_redemption pr
+        JOIN voucher_type vt ON vt.id = pr.voucher_type_id
+        WHERE pr.reserved_at IS NOT NULL {before}
+        ORDER BY pr.reserved_at DESC, pr.id DESC
+        LIMIT %s
+    """,
+    "onchain": """
+        SELECT ot.created_at, ot.id, ot.kind, ot.status
+        FROM onchain_tx ot
+        WHERE ot.created_at IS NOT NULL {before}
+        ORDER BY ot.created_at DESC, ot.id DESC
+        LIMIT %s
+    """,
+}
+
+_KEYSET = {
+    "user_register": "AND (cr.created_at, cr.id) < (%s, %s::uuid)",
+    "voucher_redeem": "AND (pr.reserved_at, pr.id) < (%s, %s::uuid)",
+    "onchain": "AND (ot.created_at, ot.id) < (%s, %s::uuid)",
+}
+
+
+def encode_cursor(ts: datetime.datetime, row_id) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (timestamp, uuid); raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts_raw, id_raw = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.datetime.fromisoformat(ts_raw), uuid.UUID(id_raw)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _describe(kind: str, detail: str):
+    if kind == "user_register":
+        return f"Claim voucher ({detail})", "success" if detail == "ok" else "warning"
+    if kind == "voucher_redeem":
+        return f"POS redeem ({detail})", "success" if detail == "committed" else "warning"
+    return f"On-chain tx ({detail})", "success" if detail in ("sent", "confirmed") else "warning"
+
+
+def _fetch(cur, kind: str, before, limit: int):
+    params = []
+    keyset = ""
+    if before:
+        keyset = _KEYSET[kind]
+        params.extend([before[0], str(before[1])])
+    params.append(limit)
+    cur.execute(_SOURCES[kind].format(before=keyset), params)
+    for ts, row_id, who, detail in cur.fetchall():
+        action, status = _describe(kind, detail)
+        yield {
+            "ts": ts,
+            "ref": str(row_id),
+            "type": kind,
+            "user": who,
+            "action": action,
+            "status": status,
+        }
+
+
+def page(cursor: Optional[str] = None, limit: int = DEFAULT_LIMIT):
+    """Return (items, next_cursor). ``items`` are newest-first across all sources."""
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    before = decode_cursor(cursor) if cursor else None
+
+    with connection.cursor() as cur:
+        runs = [list(_fetch(cur, kind, before, limit)) for kind in _SOURCES]
+
+    # UUID string order matches Postgres uuid order, so (ts, ref) is a total order
+    # consistent with the per-source keyset predicate.
+    merged = heapq.merge(*runs, key=lambda it: (it["ts"], it["ref"]), reverse=True)
+    items = []
+    for it in merged:
+        items.append(it)
+        if len(items) == limit:
+            break
+
+    next_cursor = None
+    if len(items) == limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["ts"], last["ref"])
+    return items, next_cursor
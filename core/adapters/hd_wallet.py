@@ -0,0 +1,127 @@
+"""Hierarchical-deterministic custodial wallets (BIP-32/44).
+
+With ``ST_WALLET_MODE = "hd"`` wallet keys are not generated and stored one
+by one: they are derived from a single master mnemonic, kept Fernet-encrypted
+(with ``ST_WALLET_ENCRYPTION_KEY``) in ``ST_WALLET_HD_SEED_FILE``. The
+mnemonic is stretched into the BIP-39 seed once per process.
+
+A user's path on chain ``c`` is ``m/44'/60'/c'/a'/b'``, where ``a`` and ``b``
+are two 31-bit numbers taken from sha256 of the user id. Every level below
+the coin type is hardened: with non-hardened indexes, one exported child key
+plus the parent xpub would give away every other user's key. The chain level
+gives the same user a different wallet (and ``provider_ref``) per chain.
+
+Creating a wallet is pure CPU and writes nothing. The ``provider_ref`` stays a
+hex string (``f"{c:08x}{a:08x}{b:08x}"``, 24 characters). Keystore refs are
+always 32 characters, so ``is_hd_ref`` tells the two apart and keys can be
+re-derived on demand. Derived accounts are kept in a bounded LRU.
+"""
+import collections
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from eth_account import Account
+from eth_account.hdaccount import key_from_seed, seed_from_mnemonic
+
+HD_REF_LEN = 24
+_HD_REF_RE = re.compile(r"[0-9a-f]{%d}" % HD_REF_LEN)
+PATH_TEMPLATE = "m/44'/60'/{}'/{}'/{}'"
+_INDEX_MASK = (1 << 31) - 1  # hardened child indexes are i + 2**31, so i < 2**31
+
+
+def is_hd_ref(provider_ref: str) -> bool:
+    return isinstance(provider_ref, str) and bool(_HD_REF_RE.fullmatch(provider_ref))
+
+
+def ref_for_user(user_external_id: str, chain_id: int) -> str:
+    if not 0 <= chain_id <= _INDEX_MASK:
+        raise ValueError("chain_id does not fit a hardened BIP-32 index")
+    digest = hashlib.sha256(f"hd-wallet:{user_external_id}".encode("utf-8")).digest()
+    a = int.from_bytes(digest[:4], "big") & _INDEX_MASK
+    b = int.from_bytes(digest[4:8], "big") & _INDEX_MASK
+    return f"{chain_id:08x}{a:08x}{b:08x}"
+
+
+def path_for_ref(provider_ref: str) -> str:
+    if not is_hd_ref(provider_ref):
+        raise ValueError("Invalid provider reference")
+    levels = [int(provider_ref[i:i + 8], 16) for i in range(0, HD_REF_LEN, 8)]
+    if any(level > _INDEX_MASK for level in levels):
+        raise ValueError("Invalid provider reference")
+    return PATH_TEMPLATE.format(*levels)
+
+
+class HDKeyring:
+    def __init__(self, seed: bytes, cache_size: int = 1024):
+        self._seed = seed
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def account(self, provider_ref: str):
+        with self._lock:
+            acct = self._cache.get(provider_ref)
+            if acct is not None:
+                self._cache.move_to_end(provider_ref)
+                return acct
+        acct = Account.from_key(key_from_seed(self._seed, path_for_ref(provider_ref)))
+        with self._lock:
+            self._cache[provider_ref] = acct
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return acct
+
+    def create(self, user_external_id: str, chain_id: int):
+        provider_ref = ref_for_user(user_external_id, chain_id)
+        return provider_ref, self.account(provider_ref)
+
+
+def _seed_path() -> Path:
+    path = getattr(settings, "ST_WALLET_HD_SEED_FILE", None)
+    if not path:
+        raise ImproperlyConfigured("ST_WALLET_HD_SEED_FILE is required when ST_WALLET_MODE is 'hd'")
+    return Path(path)
+
+
+def write_seed(mnemonic: str, fernet) -> Path:
+    """Encrypt ``mnemonic`` into ST_WALLET_HD_SEED_FILE (mode 0600, atomic)."""
+    if fernet is None:
+        raise ImproperlyConfigured("ST_WALLET_ENCRYPTION_KEY is required to store the HD master seed")
+    path = _seed_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(fernet.encrypt(mnemonic.encode("utf-8")))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def _load_seed(fernet) -> bytes:
+    if fernet is None:
+        raise ImproperlyConfigured("ST_WALLET_ENCRYPTION_KEY is required to read the HD master seed")
+    path = _seed_path()
+    if not path.exists():
+        raise ImproperlyConfigured(f"HD master seed {path} not found; run: python manage.py init_hd_seed")
+    mnemonic = fernet.decrypt(path.read_bytes()).decode("utf-8")
+    return seed_from_mnemonic(mnemonic, passphrase="")
+
+
+_keyring = None
+_keyring_lock = threading.Lock()
+
+
+def get_keyring(fernet) -> HDKeyring:
+    global _keyring
+    if _keyring is None:
+        with _keyring_lock:
+            if _keyring is None:
+                _keyring = HDKeyring(_load_seed(fernet), getattr(settings, "ST_WALLET_HD_CACHE_SIZE", 1024))
+    return _keyring
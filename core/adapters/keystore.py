@@ -0,0 +1,174 @@
+"""Storage backends for custodial wallet records.
+
+``WalletProviderAdapter`` serialises (and, with ``ST_WALLET_ENCRYPTION_KEY``,
+Fernet-encrypts) each wallet record and stores the opaque bytes here, keyed by
+``provider_ref``:
+
+* ``SQLiteKeystore`` keeps every record in one indexed SQLite file (WAL,
+  ``synchronous=FULL``, so each write is atomic and fsync'd before
+  ``create_wallet`` returns). Create and lookup are one B-tree operation no
+  matter how many wallets exist, and backups copy one file.
+* ``JSONDirKeystore`` is the original layout, one ``<provider_ref>.json``
+  file per wallet. The SQLite store falls back to it for records that have
+  not been moved yet (``python manage.py migrate_wallet_store``).
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+_REF_RE = re.compile(r"[a-fA-F0-9]{16,64}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    ref TEXT PRIMARY KEY,
+    blob BLOB NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+def check_ref(provider_ref: str) -> str:
+    if not isinstance(provider_ref, str) or not _REF_RE.fullmatch(provider_ref):
+        raise ValueError("Invalid provider reference")
+    return provider_ref
+
+
+class JSONDirKeystore:
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, provider_ref: str) -> Path:
+        return self.store_dir / f"{check_ref(provider_ref)}.json"
+
+    def put(self, provider_ref: str, blob: bytes) -> None:
+        path = self._path(provider_ref)
+        path.write_bytes(blob)
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            # On some platforms (e.g. Windows) chmod may be unsupported; ignore.
+            pass
+
+    def get(self, provider_ref: str) -> bytes:
+        path = self._path(provider_ref)
+        if not path.exists():
+            raise FileNotFoundError(f"Wallet record {provider_ref} not found")
+        return path.read_bytes()
+
+    def refs(self) -> Iterator[str]:
+        for path in self.store_dir.glob("*.json"):
+            if _REF_RE.fullmatch(path.stem):
+                yield path.stem
+
+    def put_many(self, items) -> None:
+        for provider_ref, blob in items:
+            self.put(provider_ref, blob)
+
+    def delete(self, provider_ref: str) -> None:
+        self._path(provider_ref).unlink(missing_ok=True)
+
+
+class SQLiteKeystore:
+    def __init__(self, path, fallback: Optional[JSONDirKeystore] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fallback = fallback
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread and process (forked workers must not share one).
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            created = not self.path.exists()
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            if created:
+                try:
+                    os.chmod(self.path, 0o600)  # WAL/SHM files inherit this mode
+                except OSError:
+                    pass
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: the WAL is fsync'd on every commit, so a returned put survives a crash.
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put(self, provider_ref: str, blob: bytes) -> None:
+        # Plain INSERT: provider refs are never reused, so an existing row is an error.
+        self._db().execute(
+            "INSERT INTO records (ref, blob, created) VALUES (?, ?, ?)",
+            (check_ref(provider_ref), blob, time.time()),
+        )
+
+    def put_many(self, items) -> None:
+        """Insert ``(provider_ref, blob)`` pairs in one transaction (one fsync)."""
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT INTO records (ref, blob, created) VALUES (?, ?, ?)",
+                [(check_ref(ref), blob, now) for ref, blob in items],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def get(self, provider_ref: str) -> bytes:
+        row = self._db().execute("SELECT blob FROM records WHERE ref = ?", (check_ref(provider_ref),)).fetchone()
+        if row:
+            return row[0]
+        if self.fallback is not None:
+            return self.fallback.get(provider_ref)
+        raise FileNotFoundError(f"Wallet record {provider_ref} not found")
+
+    def has(self, provider_ref: str) -> bool:
+        return self._db().execute("SELECT 1 FROM records WHERE ref = ?", (check_ref(provider_ref),)).fetchone() is not None
+
+    def refs(self) -> Iterator[str]:
+        for (ref,) in self._db().execute("SELECT ref FROM records ORDER BY ref"):
+            yield ref
+
+    def count(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def compact(self) -> None:
+        """Fold the WAL back into the main file and rebuild it without free pages."""
+        db = self._db()
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db.execute("VACUUM")
+
+
+BACKENDS = ("sqlite", "json")
+
+_keystore = None
+_keystore_lock = threading.Lock()
+
+
+def get_keystore():
+    """Process-wide keystore selected by ``ST_WALLET_KEYSTORE`` (sqlite | json)."""
+    global _keystore
+    if _keystore is None:
+        with _keystore_lock:
+            if _keystore is None:
+                store_dir = getattr(settings, "ST_WALLET_STORE_DIR", None) or Path(getattr(settings, "BASE_DIR", ".")) / "wallet_store"
+                legacy = JSONDirKeystore(store_dir)
+                backend = getattr(settings, "ST_WALLET_KEYSTORE", "sqlite")
+                if backend not in BACKENDS:
+                    raise ImproperlyConfigured(f"ST_WALLET_KEYSTORE must be one of {', '.join(BACKENDS)}")
+                if backend == "json":
+                    _keystore = legacy
+                else:
+                    path = getattr(settings, "ST_WALLET_KEYSTORE_PATH", None) or Path(store_dir) / "keystore.sqlite3"
+                    _keystore = SQLiteKeystore(path, fallback=legacy)
+    return _keystore
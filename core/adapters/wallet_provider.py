@@ -1,15 +1,15 @@
 import json
-import os
-import re
 import secrets
 from datetime import datetime, timezone
-from pathlib import Path
 from typing import Any, Dict, Optional
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from eth_account import Account
 
+from . import hd_wallet
+from .keystore import get_keystore
+
 try:  # Optional encryption support
     from cryptography.fernet import Fernet, InvalidToken
 except Exception:  # pragma: no cover - cryptography may be unavailable in dev
@@ -17,17 +17,19 @@ except Exception:  # pragma: no cover - cryptography may be unavailable in dev
     InvalidToken = Exception
 
 
+# "keystore": random key per wallet, stored encrypted; "hd": derived from one master seed (hd_wallet.py).
+MODES = ("keystore", "hd")
+
+
 class WalletProviderAdapter:
     def __init__(self, provider_name: str, chain_id: int):
         self.provider_name = provider_name
         self.chain_id = chain_id
         self._allow_export = getattr(settings, "ST_ALLOW_KEY_EXPORT", False)
-        store = getattr(settings, "ST_WALLET_STORE_DIR", None)
-        if not store:
-            base = getattr(settings, "BASE_DIR", Path("."))
-            store = base / "wallet_store"
-        self.store_dir = Path(store)
-        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = getattr(settings, "ST_WALLET_MODE", "keystore")
+        if self.mode not in MODES:
+            raise ImproperlyConfigured(f"ST_WALLET_MODE must be one of {', '.join(MODES)}")
+        self.keystore = get_keystore()
 
         enc_key = getattr(settings, "ST_WALLET_ENCRYPTION_KEY", None)
         if enc_key:
@@ -43,31 +45,17 @@ class WalletProviderAdapter:
         else:
             self._fernet = None
 
-    def _record_path(self, provider_ref: str) -> Path:
-        if not re.fullmatch(r"[a-fA-F0-9]{16,64}", provider_ref):
-            raise ValueError("Invalid provider reference")
-        return self.store_dir / f"{provider_ref}.json"
-
-    def _write_secure(self, path: Path, payload: bytes) -> None:
-        path.write_bytes(payload)
-        try:
-            os.chmod(path, 0o600)
-        except OSError:
-            # On some platforms (e.g. Windows) chmod may be unsupported; ignore.
-            pass
-
-    def _save_record(self, provider_ref: str, data: Dict[str, Any]) -> None:
-        path = self._record_path(provider_ref)
+    def _encode_record(self, data: Dict[str, Any]) -> bytes:
         blob = json.dumps(data, indent=2).encode("utf-8")
         if self._fernet:
             blob = self._fernet.encrypt(blob)
-        self._write_secure(path, blob)
+        return blob
+
+    def _save_record(self, provider_ref: str, data: Dict[str, Any]) -> None:
+        self.keystore.put(provider_ref, self._encode_record(data))
 
     def _load_record(self, provider_ref: str) -> Dict[str, Any]:
-        path = self._record_path(provider_ref)
-        if not path.exists():
-            raise FileNotFoundError(f"Wallet record {provider_ref} not found")
-        blob = path.read_bytes()
+        blob = self.keystore.get(provider_ref)
         if self._fernet:
             try:
                 blob = self._fernet.decrypt(blob)
@@ -75,7 +63,7 @@ class WalletProviderAdapter:
                 raise PermissionError("Unable to decrypt wallet record - invalid key") from exc
         return json.loads(blob.decode("utf-8"))
 
-    def create_wallet(self, user_external_id: str):
+    def _new_account(self, user_external_id: Optional[str]):
         account = Account.create()
         provider_ref = secrets.token_hex(16)
         record = {
@@ -87,17 +75,44 @@ class WalletProviderAdapter:
             'created_at': datetime.now(timezone.utc).isoformat(),
             'exportable': self._allow_export,
         }
-        self._save_record(provider_ref, record)
-        address_bytes = bytes.fromhex(account.address[2:])
-        return {
+        meta = {
             'provider_ref': provider_ref,
-            'address_bytes': address_bytes,
+            'address_bytes': bytes.fromhex(account.address[2:]),
             'address_hex': account.address,
             'exportable': self._allow_export,
         }
+        return record, meta
+
+    def _hd_keyring(self):
+        return hd_wallet.get_keyring(self._fernet)
+
+    def create_wallet(self, user_external_id: str):
+        if self.mode == "hd":
+            # Derived, not stored: nothing is written and the key is re-derived on export.
+            provider_ref, account = self._hd_keyring().create(user_external_id, self.chain_id)
+            return {
+                'provider_ref': provider_ref,
+                'address_bytes': bytes.fromhex(account.address[2:]),
+                'address_hex': account.address,
+                'exportable': self._allow_export,
+            }
+        record, meta = self._new_account(user_external_id)
+        self._save_record(meta['provider_ref'], record)
+        return meta
+
+    def create_wallets(self, count: int):
+        """``count`` unassigned wallets (for the pool), stored in one keystore write."""
+        if self.mode == "hd":
+            raise ImproperlyConfigured("The wallet pool is not used with ST_WALLET_MODE = 'hd'")
+        accounts = [self._new_account(None) for _ in range(count)]
+        self.keystore.put_many((meta['provider_ref'], self._encode_record(record)) for record, meta in accounts)
+        return [meta for _, meta in accounts]
 
     def export_key(self, provider_ref: str) -> str:
         if not self._allow_export:
             raise PermissionError('Export key is disabled by policy')
+        # HD refs (24 hex chars) never collide with keystore refs (32), whatever the current mode.
+        if hd_wallet.is_hd_ref(provider_ref):
+            return self._hd_keyring().account(provider_ref).key.hex()
         record = self._load_record(provider_ref)
         return record['private_key']
@@ -1,5 +1,9 @@
+import collections
+
 from django.contrib import admin
+from django.db import transaction
 from .models import AppUser, Wallet, VoucherType, VoucherBalance, QRClaim, POSRedemption, OnchainTx, Policy
+from . import code_filter, counters
 
 @admin.register(AppUser)
 class AppUserAdmin(admin.ModelAdmin):
@@ -30,6 +34,35 @@ class QRClaimAdmin(admin.ModelAdmin):
     search_fields = ("code","event_label")
     list_filter = ("status","voucher_type")
 
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            old = None
+            if change:
+                old = QRClaim.objects.select_for_update().values("voucher_type_id", "status").get(pk=obj.pk)
+            super().save_model(request, obj, form, change)
+            if old is None:
+                counters.codes_created(obj.voucher_type_id, 1, obj.status)
+            elif old["voucher_type_id"] != obj.voucher_type_id:
+                counters.codes_removed(old["voucher_type_id"], 1, old["status"])
+                counters.codes_created(obj.voucher_type_id, 1, obj.status)
+            else:
+                counters.code_status_changed(obj.voucher_type_id, old["status"], obj.status)
+        # Codes typed in here may be old-format, which the claim-code filter never re-checks.
+        code_filter.add([obj.code])
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            old = QRClaim.objects.select_for_update().values("voucher_type_id", "status").get(pk=obj.pk)
+            super().delete_model(request, obj)
+            counters.codes_removed(old["voucher_type_id"], 1, old["status"])
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            removed = collections.Counter(queryset.select_for_update().values_list("voucher_type_id", "status"))
+            super().delete_queryset(request, queryset)
+            for (voucher_type_id, status), count in removed.items():
+                counters.codes_removed(voucher_type_id, count, status)
+
 @admin.register(POSRedemption)
 class POSRedemptionAdmin(admin.ModelAdmin):
     list_display = ("voucher_type","wallet","amount","status","pos_terminal","reserved_at","committed_at")
@@ -0,0 +1,323 @@
+"""Incremental columnar (Parquet) exports for analytics.
+
+Each dataset is read in ``(ts, id)`` keyset batches strictly after the stored
+watermark (``analytics_watermark``) and written as typed Parquet files
+partitioned by local day::
+
+    ST_ANALYTICS_DIR/<dataset>/day=YYYY-MM-DD/part-<first ts>-<first id>.parquet
+
+A run only appends files for rows it has not written before. Part file names
+carry the part's first (ts, id) key. A run that crashed between writing parts
+and saving the watermark leaves parts whose first key is past the watermark;
+the next run deletes those before exporting, so a rerun (with any batch size)
+rewrites their rows once instead of duplicating them. Rows newer than ``lag``
+are left for the next run so transactions that commit late with an older
+timestamp are not skipped.
+
+Rows are exported once, as they were at export time. Columns that change
+later are flagged in the Parquet schema (field metadata ``snapshot: insert``,
+see SNAPSHOT_COLUMNS). The changes that carry a timestamp are exported as
+event datasets keyed on that timestamp: ``code_uses`` (``qr_claim.used_at``)
+and ``redemption_commits`` (``pos_redemption.committed_at``). Joining on
+``id`` and taking the latest event gives the current state. Expiry and
+cancellation have no timestamp column, so only the snapshot records them.
+"""
+import datetime
+import os
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils import timezone
+
+try:  # Optional analytics support
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover - pyarrow may be unavailable in dev
+    pa = None
+    pq = None
+
+DEFAULT_BATCH_SIZE = 50_000
+DEFAULT_LAG = datetime.timedelta(minutes=5)
+
+# dataset -> (keyset ts column, batch query with a {where} slot, [(column, arrow type)])
+DATASETS = {
+    "redemptions": (
+        "pr.reserved_at",
+        """
+        SELECT pr.id::text, pr.voucher_type_id::text, vt.slug, pr.wallet_id::text, pr.amount,
+               pr.status, pr.pos_terminal, pr.reserved_at, pr.committed_at
+        FROM pos_redemption pr
+        JOIN voucher_type vt ON vt.id = pr.voucher_type_id
+        WHERE {where}
+        ORDER BY pr.reserved_at, pr.id
+        LIMIT %s
+        """,
+        [
+            ("id", "string"),
+            ("voucher_type_id", "string"),
+            ("voucher_slug", "string"),
+            ("wallet_id", "string"),
+            ("amount", "int64"),
+            ("status", "string"),
+            ("pos_terminal", "string"),
+            ("reserved_at", "timestamp"),
+            ("committed_at", "timestamp"),
+        ],
+    ),
+    # Guest contact details (email/phone/ip/device) are deliberately left out.
+    "claims": (
+        "cr.created_at",
+        """
+        SELECT cr.id::text, cr.qr_claim_id::text, qc.voucher_type_id::text, cr.result, cr.consent, cr.created_at
+        FROM claim_request cr
+        JOIN qr_claim qc ON qc.id = cr.qr_claim_id
+        WHERE {where}
+        ORDER BY cr.created_at, cr.id
+        LIMIT %s
+        """,
+        [
+            ("id", "string"),
+            ("qr_claim_id", "string"),
+            ("voucher_type_id", "string"),
+            ("result", "string"),
+            ("consent", "bool"),
+            ("created_at", "timestamp"),
+        ],
+    ),
+    "codes": (
+        "qc.created_at",
+        """
+        SELECT qc.id::text, qc.code, qc.voucher_type_id::text, qc.event_label, qc.status,
+               qc.used_by_user::text, qc.used_at, qc.expires_at, qc.created_at
+        FROM qr_claim qc
+        WHERE {where}
+        ORDER BY qc.created_at, qc.id
+        LIMIT %s
+        """,
+        [
+            ("id", "string"),
+            ("code", "string"),
+            ("voucher_type_id", "string"),
+            ("event_label", "string"),
+            ("status", "string"),
+            ("used_by_user", "string"),
+            ("used_at", "timestamp"),
+            ("expires_at", "timestamp"),
+            ("created_at", "timestamp"),
+        ],
+    ),
+    # Change events: one row per code use / committed redemption, keyed on when it happened.
+    "code_uses": (
+        "qc.used_at",
+        """
+        SELECT qc.id::text, qc.code, qc.voucher_type_id::text, qc.status, qc.used_by_user::text, qc.used_at
+        FROM qr_claim qc
+        WHERE {where}
+        ORDER BY qc.used_at, qc.id
+        LIMIT %s
+        """,
+        [
+            ("id", "string"),
+            ("code", "string"),
+            ("voucher_type_id", "string"),
+            ("status", "string"),
+            ("used_by_user", "string"),
+            ("used_at", "timestamp"),
+        ],
+    ),
+    "redemption_commits": (
+        "pr.committed_at",
+        """
+        SELECT pr.id::text, pr.voucher_type_id::text, vt.slug, pr.wallet_id::text, pr.amount,
+               pr.status, pr.pos_terminal, pr.reserved_at, pr.committed_at
+        FROM pos_redemption pr
+        JOIN voucher_type vt ON vt.id = pr.voucher_type_id
+        WHERE {where}
+        ORDER BY pr.committed_at, pr.id
+        LIMIT %s
+        """,
+        [
+            ("id", "string"),
+            ("voucher_type_id", "string"),
+            ("voucher_slug", "string"),
+            ("wallet_id", "string"),
+            ("amount", "int64"),
+            ("status", "string"),
+            ("pos_terminal", "string"),
+            ("reserved_at", "timestamp"),
+            ("committed_at", "timestamp"),
+        ],
+    ),
+}
+
+# Columns whose value may change after the row is written; exported as of insert time.
+SNAPSHOT_COLUMNS = {
+    "redemptions": ("status", "committed_at"),
+    "codes": ("status", "used_by_user", "used_at"),
+}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImproperlyConfigured("pyarrow is required for analytics exports (pip install pyarrow)")
+
+
+def _arrow_type(name: str):
+    if name == "timestamp":
+        return pa.timestamp("us", tz="UTC")
+    return getattr(pa, name)()
+
+
+def schema(dataset: str):
+    _require_pyarrow()
+    snapshot = SNAPSHOT_COLUMNS.get(dataset, ())
+    return pa.schema([
+        pa.field(col, _arrow_type(kind), metadata={"snapshot": "insert"} if col in snapshot else None)
+        for col, kind in DATASETS[dataset][2]
+    ])
+
+
+def output_dir() -> Path:
+    return Path(getattr(settings, "ST_ANALYTICS_DIR", settings.BASE_DIR / "analytics"))
+
+
+def get_watermark(dataset: str):
+    """Return (last_ts, last_id, rows_total); (None, None, 0) before the first run."""
+    with connection.cursor() as cur:
+        cur.execute("SELECT last_ts, last_id, rows_total FROM analytics_watermark WHERE dataset = %s", [dataset])
+        row = cur.fetchone()
+    return row or (None, None, 0)
+
+
+def _save_watermark(dataset: str, last_ts, last_id, added: int) -> None:
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO analytics_watermark (dataset, last_ts, last_id, rows_total, updated_at)
+            VALUES (%s, %s, %s::uuid, %s, NOW())
+            ON CONFLICT (dataset) DO UPDATE SET
+                last_ts = EXCLUDED.last_ts,
+                last_id = EXCLUDED.last_id,
+                rows_total = analytics_watermark.rows_total + EXCLUDED.rows_total,
+                updated_at = NOW()
+            """,
+            [dataset, last_ts, last_id, added],
+        )
+
+
+def reset(dataset: str) -> None:
+    """Forget the watermark and delete the dataset's files (next run is a full export)."""
+    with connection.cursor() as cur:
+        cur.execute("DELETE FROM analytics_watermark WHERE dataset = %s", [dataset])
+    shutil.rmtree(output_dir() / dataset, ignore_errors=True)
+
+
+def _fetch_batch(dataset: str, last_ts, last_id, until, batch_size: int):
+    ts_col, sql, _ = DATASETS[dataset]
+    id_col = ts_col.split(".")[0] + ".id"
+    where = [f"{ts_col} IS NOT NULL", f"{ts_col} < %s"]
+    params = [until]
+    if last_ts is not None:
+        where.append(f"({ts_col}, {id_col}) > (%s, %s::uuid)")
+        params.extend([last_ts, last_id])
+    with connection.cursor() as cur:
+        cur.execute(sql.format(where=" AND ".join(where)), params + [batch_size])
+        return cur.fetchall()
+
+
+_PART_TS_FORMAT = "%Y%m%dT%H%M%S%f"
+
+
+def _part_name(first_ts, first_id: str) -> str:
+    ts = first_ts.astimezone(datetime.timezone.utc).strftime(_PART_TS_FORMAT)
+    return f"part-{ts}-{first_id.replace('-', '')}.parquet"
+
+
+def _part_key(name: str):
+    """(first ts, first id hex) from a part file name; older names carry only an 8-char id prefix."""
+    _, ts, id_hex = name[: -len(".parquet")].split("-", 2)
+    return datetime.datetime.strptime(ts, _PART_TS_FORMAT).replace(tzinfo=datetime.timezone.utc), id_hex
+
+
+def clear_uncommitted(dataset: str, last_ts, last_id) -> int:
+    """Delete parts (and .tmp leftovers) that start past the watermark, i.e. written by a run that did not finish."""
+    root = output_dir() / dataset
+    if not root.is_dir():
+        return 0
+    first_day = f"day={timezone.localtime(last_ts).date().isoformat()}" if last_ts is not None else ""
+    last_hex = str(last_id).replace("-", "") if last_id is not None else ""
+    removed = 0
+    for part_dir in root.iterdir():
+        # Uncommitted rows are newer than the watermark, so only its local day and later can hold them.
+        if not part_dir.is_dir() or part_dir.name < first_day:
+            continue
+        for path in part_dir.iterdir():
+            if path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)
+                continue
+            if not path.name.endswith(".parquet"):
+                continue
+            if last_ts is not None:
+                ts, id_hex = _part_key(path.name)
+                if (ts, id_hex) <= (last_ts, last_hex[: len(id_hex)]):
+                    continue
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def _write_part(dataset: str, day: datetime.date, rows, ts_index: int) -> Path:
+    columns = DATASETS[dataset][2]
+    table = pa.Table.from_arrays(
+        [pa.array([r[i] for r in rows], type=_arrow_type(kind)) for i, (_, kind) in enumerate(columns)],
+        schema=schema(dataset),
+    )
+    first = rows[0]
+    part_dir = output_dir() / dataset / f"day={day.isoformat()}"
+    part_dir.mkdir(parents=True, exist_ok=True)
+    path = part_dir / _part_name(first[ts_index], first[0])
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path)
+    return path
+
+
+def export(dataset: str, *, batch_size: int = DEFAULT_BATCH_SIZE, lag: datetime.timedelta = DEFAULT_LAG) -> dict:
+    """Append rows newer than the watermark; returns {"rows": n, "files": n, "watermark": iso or None}."""
+    _require_pyarrow()
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset {dataset}")
+    ts_index = [col for col, _ in DATASETS[dataset][2]].index(DATASETS[dataset][0].split(".")[1])
+    until = timezone.now() - lag
+    last_ts, last_id, _ = get_watermark(dataset)
+    clear_uncommitted(dataset, last_ts, last_id)
+    rows_written = files_written = 0
+
+    while True:
+        rows = _fetch_batch(dataset, last_ts, last_id, until, batch_size)
+        if not rows:
+            break
+        # Rows are ordered by ts, so each local day is one contiguous run.
+        start = 0
+        while start < len(rows):
+            day = timezone.localtime(rows[start][ts_index]).date()
+            end = start
+            while end < len(rows) and timezone.localtime(rows[end][ts_index]).date() == day:
+                end += 1
+            _write_part(dataset, day, rows[start:end], ts_index)
+            files_written += 1
+            start = end
+        last_ts, last_id = rows[-1][ts_index], rows[-1][0]
+        _save_watermark(dataset, last_ts, last_id, len(rows))
+        rows_written += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return {
+        "rows": rows_written,
+        "files": files_written,
+        "watermark": last_ts.isoformat() if last_ts else None,
+    }
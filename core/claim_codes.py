@@ -0,0 +1,234 @@
+"""Claim code allocation.
+
+New codes are ``<prefix>_<8 base32 chars><3 check chars>``. The 8 characters
+are a value of the ``qr_claim_code_seq`` sequence (core/sql/0008) run through
+a keyed 40-bit Feistel permutation: distinct sequence values give distinct
+codes, so a code is unique by construction and needs no existence query,
+while consecutive codes still look unrelated. Only codes from the older
+formats (md5 / random) can clash; inserts skip or retry past those.
+
+The check characters are a truncated HMAC-SHA256 of everything before them,
+so ``is_acceptable`` rejects mis-scans and guessed codes in pure Python
+before any query (1 in 32768 forgeries get through). Old-format codes pass
+on syntax alone while ``ST_CLAIM_CODE_ACCEPT_LEGACY`` is on.
+
+Bulk creation streams allocated codes into a temp staging table with COPY
+and moves them into ``qr_claim`` with one
+``INSERT ... SELECT ... ON CONFLICT (code) DO NOTHING RETURNING code`` per
+chunk; any shortfall is topped up in the next pass.
+"""
+import base64
+import hashlib
+import hmac
+import re
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from . import counters
+
+# Candidate codes staged per COPY / INSERT round.
+CHUNK_SIZE = 100_000
+# Upper bound for one call (management command).
+MAX_CODES = 1_000_000
+# Upper bound for the admin endpoint: the insert runs inside the request, so
+# bigger batches go through `manage.py gen_claim_qr`.
+HTTP_MAX_CODES = 20_000
+# Give up after this many consecutive passes that inserted nothing.
+MAX_PASSES = 20
+SEQUENCE = "qr_claim_code_seq"
+# 40-bit permutation -> 8 base32 characters (A-Z, 2-7).
+_HALF_BITS = 20
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+# 15-bit HMAC tag -> 3 base32 characters.
+CHECK_CHARS = 3
+_B32 = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+_SUFFIX_RE = re.compile(r"[A-Z2-7]{%d}" % (8 + CHECK_CHARS))
+_LEGACY_RE = re.compile(r"[A-Za-z0-9_-]{1,128}")
+# No "_": it separates the prefix from the body. Upper-case so typed and scanned codes match.
+PREFIX_RE = re.compile(r"[A-Z0-9-]{0,16}")
+
+_keys = None
+
+
+def _key_material():
+    """(Feistel round hashes, check-digit HMAC), derived once from ST_CLAIM_CODE_KEY; callers copy() them."""
+    global _keys
+    if _keys is None:
+        key = hashlib.sha256(f"claim-code:{settings.ST_CLAIM_CODE_KEY}".encode("utf-8")).digest()
+        rounds = [hashlib.blake2b(key=key + bytes([r]), digest_size=4) for r in range(_ROUNDS)]
+        _keys = (rounds, hmac.new(key, b"check", hashlib.sha256))
+    return _keys
+
+
+def _rounds():
+    return _key_material()[0]
+
+
+def check_chars(body: str) -> str:
+    mac = _key_material()[1].copy()
+    mac.update(body.encode("utf-8"))
+    tag = int.from_bytes(mac.digest()[:2], "big")
+    tag >>= 16 - 5 * CHECK_CHARS
+    return "".join(_B32[(tag >> (5 * i)) & 31] for i in reversed(range(CHECK_CHARS)))
+
+
+def verify(code: str) -> bool:
+    """True if ``code`` is a current-format code whose check characters match (no query)."""
+    if not isinstance(code, str) or len(code) > 128 or not _SUFFIX_RE.fullmatch(code.rsplit("_", 1)[-1]):
+        return False
+    body, check = code[:-CHECK_CHARS], code[-CHECK_CHARS:]
+    return hmac.compare_digest(check_chars(body), check)
+
+
+def is_acceptable(code: str) -> bool:
+    """Worth looking up: a verified code, or (in legacy mode) anything shaped like an old code."""
+    if verify(code):
+        return True
+    legacy = getattr(settings, "ST_CLAIM_CODE_ACCEPT_LEGACY", True)
+    return bool(legacy and isinstance(code, str) and _LEGACY_RE.fullmatch(code))
+
+
+def permute(n: int) -> int:
+    """Keyed bijection on [0, 2**40); a balanced Feistel network with blake2b rounds."""
+    left, right = n >> _HALF_BITS, n & _HALF_MASK
+    for base in _rounds():
+        h = base.copy()
+        h.update(right.to_bytes(3, "big"))
+        left, right = right, left ^ (int.from_bytes(h.digest(), "big") & _HALF_MASK)
+    return (left << _HALF_BITS) | right
+
+
+def unpermute(n: int) -> int:
+    left, right = n >> _HALF_BITS, n & _HALF_MASK
+    for base in reversed(_rounds()):
+        h = base.copy()
+        h.update(left.to_bytes(3, "big"))
+        left, right = right ^ (int.from_bytes(h.digest(), "big") & _HALF_MASK), left
+    return (left << _HALF_BITS) | right
+
+
+def sequence_value(code: str):
+    """The ``qr_claim_code_seq`` value a verified code was made from, else None."""
+    if not verify(code):
+        return None
+    body = code[-(8 + CHECK_CHARS):-CHECK_CHARS]
+    return unpermute(int.from_bytes(base64.b32decode(body), "big"))
+
+
+def clean_prefix(prefix) -> str:
+    """Return ``prefix`` if it matches ``PREFIX_RE``; raises ValueError otherwise."""
+    if not isinstance(prefix, str) or not PREFIX_RE.fullmatch(prefix):
+        raise ValueError("Prefix must be up to 16 characters of A-Z, 0-9 and '-'")
+    return prefix
+
+
+def default_prefix(slug: str) -> str:
+    """Prefix used when none is given: the voucher slug, upper-cased and fitted to ``PREFIX_RE``."""
+    return re.sub(r"[^A-Z0-9-]", "-", slug.upper())[:16]
+
+
+def encode_codes(values, prefix: str = "") -> list:
+    """Codes for sequence ``values`` (pure CPU)."""
+    blob = base64.b32encode(b"".join(permute(v).to_bytes(5, "big") for v in values)).decode("ascii")
+    sep = f"{prefix}_" if prefix else ""
+    bodies = [sep + blob[i:i + 8] for i in range(0, len(blob), 8)]
+    return [body + check_chars(body) for body in bodies]
+
+
+def allocate(n: int = 1, prefix: str = "") -> list:
+    """``n`` new codes; one round trip for the sequence values."""
+    clean_prefix(prefix)
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT nextval('{SEQUENCE}') FROM generate_series(1, %s)", [n])
+        values = [row[0] for row in cur.fetchall()]
+    return encode_codes(values, prefix)
+
+
+def create_claim(voucher_type, *, prefix: str = None, **fields):
+    """
+    Insert one ``QRClaim`` with a freshly allocated code (``prefix`` defaults
+    to ``default_prefix(slug)``) and count it; retries past an old-format clash
+    inside a savepoint, so the caller's transaction stays usable.
+    """
+    from . import code_filter
+    from .models import QRClaim
+    from django.utils import timezone
+
+    fields.setdefault("status", "new")
+    fields.setdefault("created_at", timezone.now())
+    prefix = default_prefix(voucher_type.slug) if prefix is None else clean_prefix(prefix)
+    for attempt in range(MAX_PASSES):
+        code = allocate(1, prefix)[0]
+        try:
+            with transaction.atomic():
+                claim = QRClaim.objects.create(code=code, voucher_type=voucher_type, **fields)
+                counters.codes_created(voucher_type.id, 1, fields["status"])
+            code_filter.add([code])
+            return claim
+        except IntegrityError:
+            if attempt == MAX_PASSES - 1:
+                raise
+
+
+def _insert_chunk(cur, voucher_type_id, codes, expires_at) -> list:
+    cur.execute("TRUNCATE qr_claim_stage")
+    with cur.copy("COPY qr_claim_stage (id, code) FROM STDIN") as copy:
+        for code in codes:
+            copy.write_row((uuid.uuid4(), code))
+    cur.execute(
+        """
+        INSERT INTO qr_claim (id, code, voucher_type_id, status, expires_at, created_at)
+        SELECT id, code, %s::uuid, 'new', %s::timestamptz, NOW() FROM qr_claim_stage
+        ON CONFLICT (code) DO NOTHING
+        RETURNING code
+        """,
+        [str(voucher_type_id), expires_at],
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def iter_create_codes(voucher_type_id, count: int, *, prefix: str = "", expires_at=None, chunk_size: int = CHUNK_SIZE, make_codes=None):
+    """
+    Insert ``count`` new ``qr_claim`` rows; yields each chunk of created codes.
+
+    Runs in one transaction (all or nothing) and records the codes in the
+    dashboard counters. ``make_codes(n)`` overrides the code source.
+    """
+    from . import code_filter
+
+    if count < 1 or count > MAX_CODES:
+        raise ValueError(f"count must be between 1 and {MAX_CODES}")
+    clean_prefix(prefix)
+    make_codes = make_codes or (lambda n: allocate(n, prefix))
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS qr_claim_stage (id uuid, code varchar(128)) ON COMMIT DROP"
+            )
+            created = idle = 0
+            while created < count:
+                chunk = min(count - created, chunk_size)
+                inserted = _insert_chunk(cur, voucher_type_id, make_codes(chunk), expires_at)
+                created += len(inserted)
+                if inserted:
+                    code_filter.add(inserted)
+                    yield inserted
+                # Old-format clashes only shrink a pass; a run of empty passes means something is wrong.
+                idle = 0 if inserted else idle + 1
+                if idle >= MAX_PASSES:
+                    raise RuntimeError(f"Could not allocate {count} unique codes ({created} created)")
+        counters.codes_created(voucher_type_id, created)
+
+
+def create_codes(voucher_type_id, count: int, *, prefix: str = "", expires_at=None, preview: int = 10):
+    """Insert ``count`` codes; returns ``(created, first ``preview`` codes)``."""
+    created, sample = 0, []
+    for codes in iter_create_codes(voucher_type_id, count, prefix=prefix, expires_at=expires_at):
+        created += len(codes)
+        if len(sample) < preview:
+            sample.extend(codes[:preview - len(sample)])
+    return created, sample
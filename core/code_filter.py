@@ -0,0 +1,225 @@
+"""In-memory Bloom filter of existing claim codes.
+
+Scanner endpoints and ``claim_done`` ask ``might_exist(code)`` before
+querying ``qr_claim``; a miss answers "no such code" without Postgres. Each
+process builds its filter in a background thread on first use (one streaming
+scan of ``qr_claim.code``), adds the codes it creates itself, and re-scans the
+recently inserted rows every REFRESH_SECONDS. "Recently" is judged on the
+database clock alone: ``qr_claim.inserted_at`` defaults to the inserting
+transaction's NOW() and is compared with the scan's clock_timestamp().
+
+A miss is only trusted when the filter is known to hold the code if it exists:
+
+* old-format codes are only created by hand in the Django admin, which adds
+  them to its own process's filter; other processes pick them up at their
+  next re-scan;
+* current-format codes carry their ``qr_claim_code_seq`` value. A refresh
+  started at ``t`` records the sequence's ``last_value``. Once a later scan
+  starts at least SETTLE_SECONDS after ``t``, every code up to that value is
+  committed and scanned, so misses at or below it are trusted. Newer codes,
+  including ones created by other processes moments ago, fall through to the
+  database.
+"""
+import collections
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import claim_codes, exports
+
+log = logging.getLogger(__name__)
+
+# Re-scan recently created codes at most this often.
+REFRESH_SECONDS = 60
+# Longest a code-inserting transaction may stay open (the claim path waits for the mint).
+SETTLE_SECONDS = 600
+
+
+class BloomFilter:
+    """Plain Bloom filter over strings; k positions by double hashing one blake2b digest."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0  # distinct items added (approximate: a false positive is not counted)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> bool:
+        """Set ``item``'s bits; True if any was unset (a new item, counted)."""
+        bits = self.bits
+        new = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def fill_ratio(self) -> float:
+        return int.from_bytes(self.bits, "little").bit_count() / self.size
+
+    def false_positive_rate(self) -> float:
+        """Current estimate from the share of bits set (tracks duplicates and overfill)."""
+        return self.fill_ratio() ** self.hashes
+
+
+class LiveCodeFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._scan_started = None  # DB clock at the start of the last completed scan
+        self._history = collections.deque()  # (scan started, sequence last_value)
+        self._trusted_upto = 0
+        self._refreshing = False
+        self._refreshed_at = 0.0
+        self.lookups = 0
+        self.misses = 0
+        self.error = None
+
+    # ---------------- lookups ----------------
+
+    def might_exist(self, code: str) -> bool:
+        self._maybe_refresh()
+        bloom = self._bloom
+        if bloom is None:
+            return True
+        self.lookups += 1
+        if code in bloom:
+            return True
+        seq = claim_codes.sequence_value(code)
+        if seq is not None and seq > self._trusted_upto:
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, codes) -> None:
+        bloom = self._bloom
+        if bloom is not None:
+            for code in codes:
+                bloom.add(code)
+
+    # ---------------- building ----------------
+
+    def _maybe_refresh(self) -> None:
+        if self._refreshing or time.monotonic() - self._refreshed_at < REFRESH_SECONDS:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name="claim-code-filter", daemon=True).start()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+            self.error = None
+        except Exception as exc:
+            self.error = str(exc)
+            log.exception("claim code filter refresh failed")
+        finally:
+            connection.close()
+            self._refreshed_at = time.monotonic()
+            self._refreshing = False
+
+    def refresh(self) -> None:
+        """Scan all codes (first run, or when over capacity) or those inserted since the last scan."""
+        with connection.cursor() as cur:
+            cur.execute(
+                f"SELECT clock_timestamp(), CASE WHEN is_called THEN last_value ELSE last_value - 1 END "
+                f"FROM {claim_codes.SEQUENCE}"
+            )
+            started, last_value = cur.fetchone()
+
+        bloom = self._bloom
+        if bloom is None or bloom.count > bloom.capacity:
+            with connection.cursor() as cur:
+                cur.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = 'qr_claim'")
+                row = cur.fetchone()
+            estimate = row[0] if row else 0
+            bloom = BloomFilter(max(self.capacity, estimate * 2), self.error_rate)
+            rows = exports.stream_query("SELECT code FROM qr_claim")
+        else:
+            since = self._scan_started - datetime.timedelta(seconds=SETTLE_SECONDS)
+            rows = exports.stream_query("SELECT code FROM qr_claim WHERE inserted_at >= %s", [since])
+        for (code,) in rows:
+            bloom.add(code)
+
+        with self._lock:
+            self._bloom = bloom
+            self._scan_started = started
+            self._history.append((started, last_value))
+            cutoff = started - datetime.timedelta(seconds=SETTLE_SECONDS)
+            while len(self._history) > 1 and self._history[1][0] <= cutoff:
+                self._history.popleft()
+            if self._history[0][0] <= cutoff:
+                self._trusted_upto = self._history[0][1]
+
+    def stats(self) -> dict:
+        bloom = self._bloom
+        return {
+            "ready": bloom is not None,
+            "items": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else self.capacity,
+            "memory_bytes": len(bloom.bits) if bloom else 0,
+            "hashes": bloom.hashes if bloom else None,
+            "fill_ratio": round(bloom.fill_ratio(), 4) if bloom else None,
+            "false_positive_rate": bloom.false_positive_rate() if bloom else None,
+            "target_false_positive_rate": self.error_rate,
+            "trusted_sequence_upto": self._trusted_upto,
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "error": self.error,
+        }
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_filter():
+    """Process-wide filter, or None when ST_CLAIM_CODE_FILTER is off."""
+    global _filter
+    if not getattr(settings, "ST_CLAIM_CODE_FILTER", True):
+        return None
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = LiveCodeFilter(
+                    getattr(settings, "ST_CLAIM_CODE_FILTER_CAPACITY", 1_000_000),
+                    getattr(settings, "ST_CLAIM_CODE_FILTER_ERROR_RATE", 0.001),
+                )
+    return _filter
+
+
+def might_exist(code: str) -> bool:
+    """False only if ``code`` is certainly not in qr_claim; True means "ask the database"."""
+    live = get_filter()
+    return live.might_exist(code) if live else True
+
+
+def add(codes) -> None:
+    live = get_filter()
+    if live:
+        live.add(codes)
@@ -0,0 +1,259 @@
+"""Cheap table totals for the admin dashboards.
+
+Writers call ``bump()`` inside the same transaction as their INSERT/DELETE so the
+counter never drifts from the real table. Each counter is spread over STRIPES
+``stat_counter`` rows (``(key, stripe)``) and a writer updates a random one, so
+concurrent signups do not queue on a single row lock; readers sum the stripes
+with one index lookup. If a counter was never seeded we fall back to the planner
+estimate in ``pg_class.reltuples`` instead of a sequential ``COUNT(*)``.
+
+Tables in DAILY_TABLES also keep a ``<table>:new:<local date>`` counter per day,
+so "created in the last N days" is a sum of N counters (``recent_total``).
+SUMMED_COUNTERS hold column sums (circulating balance, redeemed amounts) the
+same way; their writers pass the amount as the delta.
+
+core/sql/0001 seeds every counter from its table on first apply.
+"""
+import datetime
+import random
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+# Tables whose totals are tracked. Keys double as stat_counter.key values.
+COUNTED_TABLES = ("app_user", "wallet", "voucher_type")
+# Tables that also get per-day creation counters.
+DAILY_TABLES = ("app_user",)
+# Column sums: key -> (table, aggregate). Seeded with the same expressions in core/sql/0001.
+SUMMED_COUNTERS = {
+    "voucher_balance": ("voucher_balance", "COALESCE(SUM(balance), 0)"),
+    "pos_redemption:reserved": ("pos_redemption", "COALESCE(SUM(amount) FILTER (WHERE status = 'reserved'), 0)"),
+    "pos_redemption:committed": ("pos_redemption", "COALESCE(SUM(amount) FILTER (WHERE status = 'committed'), 0)"),
+}
+STRIPES = 16
+
+
+def daily_key(key: str, day: datetime.date) -> str:
+    return f"{key}:new:{day.isoformat()}"
+
+
+def bump(key: str, delta: int = 1, *, daily: bool = False) -> None:
+    """Adjust a counter (and today's counter when ``daily``); call inside the writer's transaction."""
+    deltas = {key: delta}
+    if daily:
+        deltas[daily_key(key, timezone.localdate())] = delta
+    bump_many(deltas)
+
+
+def bump_many(deltas: dict) -> None:
+    """Adjust several counters ({key: delta}) in one statement; call inside the writer's transaction."""
+    deltas = {k: d for k, d in deltas.items() if d}
+    if not deltas:
+        return
+    stripe = random.randrange(STRIPES)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO stat_counter (key, stripe, value, updated_at)
+            VALUES {", ".join(["(%s, %s, %s, NOW())"] * len(deltas))}
+            ON CONFLICT (key, stripe)
+            DO UPDATE SET value = stat_counter.value + EXCLUDED.value, updated_at = NOW()
+            """,
+            [v for k, d in deltas.items() for v in (k, stripe, d)],
+        )
+
+
+def _estimate(table: str) -> int:
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+            [table],
+        )
+        row = cur.fetchone()
+    # reltuples is -1 for a table that has never been vacuumed/analyzed.
+    if not row or row[0] is None or row[0] < 0:
+        return 0
+    return int(row[0])
+
+
+def get_totals(*keys: str) -> dict:
+    """Return {key: total} for the given counters, estimating any that are unseeded."""
+    keys = keys or COUNTED_TABLES
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT key, SUM(value) FROM stat_counter WHERE key = ANY(%s) GROUP BY key",
+            [list(keys)],
+        )
+        found = {k: int(v) for k, v in cur.fetchall()}
+    for key in keys:
+        if key not in found:
+            # No estimate for a sum; 0 until apply_sql / rebuild_counters seeds it.
+            found[key] = 0 if key in SUMMED_COUNTERS else _estimate(key)
+    return found
+
+
+def get_total(key: str) -> int:
+    return get_totals(key)[key]
+
+
+def recent_total(key: str, days: int) -> int:
+    """Rows of ``key`` (a DAILY_TABLES entry) created over the last ``days`` local calendar days."""
+    today = timezone.localdate()
+    keys = [daily_key(key, today - datetime.timedelta(days=i)) for i in range(days)]
+    with connection.cursor() as cur:
+        cur.execute("SELECT COALESCE(SUM(value), 0) FROM stat_counter WHERE key = ANY(%s)", [keys])
+        return int(cur.fetchone()[0])
+
+
+def rebuild(keys=None) -> dict:
+    """Recount tables exactly and overwrite their counters (one-off/repair)."""
+    keys = list(keys or (*COUNTED_TABLES, *SUMMED_COUNTERS))
+    result = {}
+    with connection.cursor() as cur:
+        for key in keys:
+            if key in COUNTED_TABLES:
+                table, aggregate = key, "COUNT(*)"
+            elif key in SUMMED_COUNTERS:
+                table, aggregate = SUMMED_COUNTERS[key]
+            else:
+                raise ValueError(f"Unknown counter {key}")
+            # Lock out concurrent writers so the snapshot and the counter agree.
+            cur.execute(f"LOCK TABLE {table} IN SHARE MODE")
+            cur.execute(f"SELECT {aggregate} FROM {table}")
+            total = cur.fetchone()[0]
+            cur.execute("DELETE FROM stat_counter WHERE key = %s", [key])
+            cur.execute(
+                "INSERT INTO stat_counter (key, stripe, value, updated_at) VALUES (%s, 0, %s, NOW())",
+                [key, total],
+            )
+            result[key] = total
+            if key in DAILY_TABLES:
+                cur.execute("DELETE FROM stat_counter WHERE key LIKE %s", [f"{key}:new:%"])
+                cur.execute(
+                    f"""
+                    INSERT INTO stat_counter (key, stripe, value, updated_at)
+                    SELECT %s || day, 0, COUNT(*), NOW()
+                    FROM (SELECT (created_at AT TIME ZONE %s)::date AS day FROM {key} WHERE created_at IS NOT NULL) d
+                    GROUP BY day
+                    """,
+                    [f"{key}:new:", settings.TIME_ZONE],
+                )
+    return result
+
+
+# ---------------- Per-campaign QR claim code counters ----------------
+
+CODE_STATUS_COLUMNS = {
+    "new": "new_codes",
+    "used": "used_codes",
+    "expired": "expired_codes",
+    "claimed": "claimed_codes",
+}
+
+
+def _apply_code_deltas(voucher_type_id, deltas: dict) -> None:
+    columns = list(deltas)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO voucher_code_stats (voucher_type_id, {", ".join(columns)}, updated_at)
+            VALUES (%s, {", ".join(["%s"] * len(columns))}, NOW())
+            ON CONFLICT (voucher_type_id) DO UPDATE SET
+                {", ".join(f"{c} = voucher_code_stats.{c} + EXCLUDED.{c}" for c in columns)},
+                updated_at = NOW()
+            """,
+            [str(voucher_type_id), *deltas.values()],
+        )
+
+
+def codes_created(voucher_type_id, count: int = 1, status: str = "new") -> None:
+    """Record newly inserted qr_claim rows; call inside the inserting transaction."""
+    if count <= 0:
+        return
+    deltas = {"total_codes": count}
+    if status in CODE_STATUS_COLUMNS:
+        deltas[CODE_STATUS_COLUMNS[status]] = count
+    _apply_code_deltas(voucher_type_id, deltas)
+
+
+def codes_removed(voucher_type_id, count: int = 1, status: str = "new") -> None:
+    """Record deleted qr_claim rows; call inside the deleting transaction."""
+    if count <= 0:
+        return
+    deltas = {"total_codes": -count}
+    if status in CODE_STATUS_COLUMNS:
+        deltas[CODE_STATUS_COLUMNS[status]] = -count
+    _apply_code_deltas(voucher_type_id, deltas)
+
+
+def code_status_changed(voucher_type_id, old_status: str, new_status: str) -> None:
+    """Move one code between status buckets; call inside the updating transaction."""
+    if old_status == new_status:
+        return
+    deltas = {}
+    if old_status in CODE_STATUS_COLUMNS:
+        deltas[CODE_STATUS_COLUMNS[old_status]] = -1
+    if new_status in CODE_STATUS_COLUMNS:
+        deltas[CODE_STATUS_COLUMNS[new_status]] = 1
+    if deltas:
+        _apply_code_deltas(voucher_type_id, deltas)
+
+
+_EMPTY_CODE_STATS = {"total_codes": 0, **{c: 0 for c in CODE_STATUS_COLUMNS.values()}}
+
+
+def get_code_stats(voucher_type_ids) -> dict:
+    """Return {voucher_type_id (str): {total_codes, new_codes, ...}} in one lookup."""
+    ids = [str(v) for v in voucher_type_ids]
+    stats = {vid: dict(_EMPTY_CODE_STATS) for vid in ids}
+    if not ids:
+        return stats
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT voucher_type_id, total_codes, new_codes, used_codes, expired_codes, claimed_codes
+            FROM voucher_code_stats
+            WHERE voucher_type_id = ANY(%s::uuid[])
+            """,
+            [ids],
+        )
+        for vid, total, new, used, expired, claimed in cur.fetchall():
+            stats[str(vid)] = {
+                "total_codes": total,
+                "new_codes": new,
+                "used_codes": used,
+                "expired_codes": expired,
+                "claimed_codes": claimed,
+            }
+    return stats
+
+
+def rebuild_code_stats() -> int:
+    """Recount qr_claim per voucher type and overwrite voucher_code_stats."""
+    with connection.cursor() as cur:
+        cur.execute("LOCK TABLE qr_claim IN SHARE MODE")
+        cur.execute(
+            """
+            INSERT INTO voucher_code_stats
+                (voucher_type_id, total_codes, new_codes, used_codes, expired_codes, claimed_codes, updated_at)
+            SELECT vt.id,
+                   COUNT(qc.id),
+                   COUNT(qc.id) FILTER (WHERE qc.status = 'new'),
+                   COUNT(qc.id) FILTER (WHERE qc.status = 'used'),
+                   COUNT(qc.id) FILTER (WHERE qc.status = 'expired'),
+                   COUNT(qc.id) FILTER (WHERE qc.status = 'claimed'),
+                   NOW()
+            FROM voucher_type vt
+            LEFT JOIN qr_claim qc ON qc.voucher_type_id = vt.id
+            GROUP BY vt.id
+            ON CONFLICT (voucher_type_id) DO UPDATE SET
+                total_codes = EXCLUDED.total_codes,
+                new_codes = EXCLUDED.new_codes,
+                used_codes = EXCLUDED.used_codes,
+                expired_codes = EXCLUDED.expired_codes,
+                claimed_codes = EXCLUDED.claimed_codes,
+                updated_at = NOW()
+            """
+        )
+        return cur.rowcount
@@ -0,0 +1,265 @@
+"""Background export jobs.
+
+Admins enqueue an export (``enqueue``); the ``run_export_jobs`` worker claims
+queued jobs with ``FOR UPDATE SKIP LOCKED``, writes the file under
+``ST_EXPORT_DIR`` in chunks while committing ``rows_done`` as it goes, and
+publishes it with an atomic rename. The console polls the job for progress
+and downloads the finished file with HTTP Range support, so export size is
+no longer bounded by the request timeout.
+"""
+import datetime
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import counters, exports, qr_sheets, timeseries
+from .models import ExportJob, ExportJobStatus, VoucherType
+
+# kind -> (file extension, content type)
+KINDS = {
+    "redemptions_csv": ("csv", "text/csv"),
+    "voucher_codes_csv": ("csv", "text/csv"),
+    "voucher_qr_pdf": ("pdf", "application/pdf"),
+    "voucher_qr_sheets": ("pdf", "application/pdf"),
+}
+
+# Commit rows_done at most this often while writing.
+PROGRESS_EVERY = 5000
+MAX_DAYS = 3660
+
+
+def export_dir() -> Path:
+    path = Path(getattr(settings, "ST_EXPORT_DIR", settings.BASE_DIR / "exports"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def job_path(job: ExportJob) -> Path:
+    ext, _ = KINDS[job.kind]
+    return export_dir() / f"{job.id}.{ext}"
+
+
+def content_type(job: ExportJob) -> str:
+    return KINDS[job.kind][1]
+
+
+def _clean_params(kind: str, params: dict) -> dict:
+    if kind == "redemptions_csv":
+        days = int(params.get("days") or 30)
+        if days < 1 or days > MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {MAX_DAYS}")
+        return {"days": days}
+    if kind == "voucher_codes_csv":
+        slug = (params.get("slug") or "").strip()
+        if not VoucherType.objects.filter(slug=slug).exists():
+            raise ValueError("Voucher not found")
+        return {"slug": slug, "q": (params.get("q") or "").strip(), "status": params.get("status") or ""}
+    if kind == "voucher_qr_sheets":
+        slug = (params.get("slug") or "").strip()
+        if not VoucherType.objects.filter(slug=slug).exists():
+            raise ValueError("Voucher not found")
+        status = "new" if params.get("status") is None else params.get("status")
+        return {"slug": slug, "status": status}
+    if kind == "voucher_qr_pdf":
+        slugs = [s for s in params.get("vouchers") or [] if s]
+        if not slugs:
+            raise ValueError("No vouchers selected")
+        return {"vouchers": slugs}
+    raise ValueError(f"Unknown export kind {kind}")
+
+
+def enqueue(kind: str, params: dict, requested_by: str = None) -> ExportJob:
+    """Validate ``params`` for ``kind`` and queue a job; raises ValueError on bad input."""
+    now = timezone.now()
+    return ExportJob.objects.create(
+        id=uuid.uuid4(),
+        kind=kind,
+        params=_clean_params(kind, params or {}),
+        status=ExportJobStatus.QUEUED,
+        requested_by=requested_by,
+        created_at=now,
+        updated_at=now,
+    )
+
+
+def claim_next():
+    """Mark the oldest queued job running and return it (None if the queue is empty)."""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE export_job
+            SET status = %s, started_at = NOW(), updated_at = NOW(), rows_done = 0, error = NULL
+            WHERE id = (
+                SELECT id FROM export_job
+                WHERE status = %s
+                ORDER BY created_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+            """,
+            [ExportJobStatus.RUNNING, ExportJobStatus.QUEUED],
+        )
+        row = cur.fetchone()
+    return ExportJob.objects.get(pk=row[0]) if row else None
+
+
+def requeue_stale(minutes: int) -> int:
+    """Requeue running jobs whose worker stopped reporting progress ``minutes`` ago."""
+    return ExportJob.objects.filter(
+        status=ExportJobStatus.RUNNING,
+        updated_at__lt=timezone.now() - datetime.timedelta(minutes=minutes),
+    ).update(status=ExportJobStatus.QUEUED, updated_at=timezone.now())
+
+
+def _set_progress(job: ExportJob, rows_done: int, **fields) -> None:
+    job.rows_done = rows_done
+    fields.update(rows_done=rows_done, updated_at=timezone.now())
+    ExportJob.objects.filter(pk=job.pk).update(**fields)
+
+
+def _reporter(job: ExportJob, every: int = PROGRESS_EVERY):
+    """Progress callback that records every count but only commits every ``every``."""
+    def report(done):
+        job.rows_done = done
+        if done % every == 0:
+            _set_progress(job, done)
+    return report
+
+
+def _counted(job: ExportJob, rows):
+    """Pass ``rows`` through, committing progress every PROGRESS_EVERY rows."""
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if done % PROGRESS_EVERY == 0:
+            _set_progress(job, done)
+    job.rows_done = done
+
+
+def _write_csv(job: ExportJob, out, header, rows) -> None:
+    for chunk in exports.iter_csv(header, _counted(job, rows)):
+        out.write(chunk.encode("utf-8"))
+
+
+def _run_redemptions_csv(job: ExportJob, out) -> str:
+    days = job.params["days"]
+    now = timezone.now()
+    start = now - datetime.timedelta(days=days)
+    _set_progress(job, 0, rows_total=timeseries.count_between("redemptions", start, now))
+    _write_csv(job, out, exports.REDEMPTION_HEADER, exports.redemption_rows(start, hold=True))
+    return f"redemptions_{days}d.csv"
+
+
+def _run_voucher_codes_csv(job: ExportJob, out) -> str:
+    voucher = VoucherType.objects.get(slug=job.params["slug"])
+    q, status = job.params.get("q", ""), job.params.get("status", "")
+    if not q:
+        stats = counters.get_code_stats([voucher.id])[str(voucher.id)]
+        total = stats.get(counters.CODE_STATUS_COLUMNS.get(status, ""), None) if status else stats["total_codes"]
+        _set_progress(job, 0, rows_total=total)
+    _write_csv(job, out, exports.VOUCHER_CODE_HEADER, exports.voucher_code_rows(voucher, q, status))
+    return f'{voucher.slug}_voucher_codes_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv'
+
+
+def _run_voucher_qr_pdf(job: ExportJob, out) -> str:
+    vouchers = list(VoucherType.objects.filter(slug__in=job.params["vouchers"], active=True))
+    if not vouchers:
+        raise ValueError("No active vouchers found")
+    _set_progress(job, 0, rows_total=len(vouchers))
+    exports.write_voucher_qr_pdf(vouchers, out, progress=lambda done: _set_progress(job, done))
+    return exports.voucher_qr_pdf_filename()
+
+
+def _run_voucher_qr_sheets(job: ExportJob, out) -> str:
+    voucher = VoucherType.objects.get(slug=job.params["slug"])
+    status = job.params.get("status", "new")
+    stats = counters.get_code_stats([voucher.id])[str(voucher.id)]
+    total = stats.get(counters.CODE_STATUS_COLUMNS.get(status, ""), None) if status else stats["total_codes"]
+    _set_progress(job, 0, rows_total=total)
+    cards = qr_sheets.iter_rendered(qr_sheets.iter_campaign_codes(voucher, status))
+    qr_sheets.write_sheets(cards, out, title=voucher.name, progress=_reporter(job, every=500))
+    return f'{voucher.slug}_qr_cards_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+
+
+_RUNNERS = {
+    "redemptions_csv": _run_redemptions_csv,
+    "voucher_codes_csv": _run_voucher_codes_csv,
+    "voucher_qr_pdf": _run_voucher_qr_pdf,
+    "voucher_qr_sheets": _run_voucher_qr_sheets,
+}
+
+
+def run(job: ExportJob) -> ExportJob:
+    """Write ``job``'s file and mark it done (or failed, with the error recorded)."""
+    final = job_path(job)
+    partial = final.with_name(final.name + ".part")
+    try:
+        with open(partial, "wb") as out:
+            file_name = _RUNNERS[job.kind](job, out)
+        os.replace(partial, final)
+    except Exception as exc:
+        partial.unlink(missing_ok=True)
+        ExportJob.objects.filter(pk=job.pk).update(
+            status=ExportJobStatus.FAILED,
+            error=str(exc)[:2000],
+            updated_at=timezone.now(),
+            finished_at=timezone.now(),
+        )
+        job.refresh_from_db()
+        raise
+
+    ExportJob.objects.filter(pk=job.pk).update(
+        status=ExportJobStatus.DONE,
+        rows_done=job.rows_done,
+        file_name=file_name,
+        file_size=final.stat().st_size,
+        updated_at=timezone.now(),
+        finished_at=timezone.now(),
+    )
+    job.refresh_from_db()
+    return job
+
+
+def purge(days: int) -> int:
+    """Delete finished/failed jobs (and their files) older than ``days``."""
+    jobs = list(ExportJob.objects.filter(
+        status__in=[ExportJobStatus.DONE, ExportJobStatus.FAILED],
+        created_at__lt=timezone.now() - datetime.timedelta(days=days),
+    ))
+    for job in jobs:
+        job_path(job).unlink(missing_ok=True)
+    ExportJob.objects.filter(pk__in=[j.pk for j in jobs]).delete()
+    return len(jobs)
+
+
+def etag(job: ExportJob) -> str:
+    return f'"{job.id.hex}-{job.file_size}"'
+
+
+def as_dict(job: ExportJob) -> dict:
+    progress = None
+    if job.status == ExportJobStatus.DONE:
+        progress = 100.0
+    elif job.rows_total:
+        progress = round(min(job.rows_done / job.rows_total, 1) * 100, 1)
+    return {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "rows_done": job.rows_done,
+        "rows_total": job.rows_total,
+        "progress": progress,
+        "file_name": job.file_name,
+        "file_size": job.file_size,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "status_url": f"/adv1/console/exports/{job.id}.json",
+        "download_url": f"/adv1/console/exports/{job.id}/download" if job.status == ExportJobStatus.DONE else None,
+    }
@@ -0,0 +1,351 @@
+"""Streaming CSV exports.
+
+Rows are read through a named (server-side) Postgres cursor in ``itersize``
+batches and written to the client through ``StreamingHttpResponse``, so memory
+stays flat and the first bytes go out before the query has finished.
+
+The row sources below are shared by the synchronous admin endpoints and the
+background worker in ``core.export_jobs``.
+"""
+import csv
+import io
+import os
+import re
+import uuid
+import zipfile
+from io import BytesIO
+
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+DEFAULT_ITERSIZE = 2000
+# Rows buffered per chunk handed to the WSGI server.
+FLUSH_ROWS = 500
+# Bytes per read when serving a finished export file.
+FILE_BLOCK_SIZE = 64 * 1024
+
+
+def stream_query(sql: str, params=None, *, itersize: int = DEFAULT_ITERSIZE, hold: bool = False):
+    """
+    Yield rows of ``sql`` from a named server-side cursor.
+
+    With ``hold=True`` the cursor is declared WITH HOLD in autocommit mode
+    instead of inside a transaction, so the caller can commit other writes
+    (e.g. job progress) while it is being read.
+    """
+    if hold:
+        connection.ensure_connection()
+        with connection.connection.cursor(name=f"export_{uuid.uuid4().hex}", withhold=True) as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params or [])
+            yield from cur
+        return
+    # DECLARE needs a transaction block; it is closed when the generator is.
+    with transaction.atomic():
+        connection.ensure_connection()
+        with connection.connection.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params or [])
+            yield from cur
+
+
+def iter_csv(header, rows):
+    """Encode ``rows`` as CSV text chunks of roughly FLUSH_ROWS lines each."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= FLUSH_ROWS:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+            pending = 0
+    if pending:
+        yield buf.getvalue()
+
+
+def csv_response(filename: str, header, rows) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(iter_csv(header, rows), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    # Let reverse proxies pass chunks straight through instead of buffering.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# ---------------- Row sources ----------------
+
+REDEMPTION_HEADER = ["reservation_id", "voucher_slug", "amount", "status", "terminal", "reserved_at", "committed_at"]
+VOUCHER_CODE_HEADER = ["Code", "Status", "Used By", "Used At", "Expires At", "Created At"]
+
+
+def redemption_rows(start, *, hold: bool = False):
+    return stream_query(
+        """
+        SELECT pr.id, vt.slug, pr.amount, pr.status, pr.pos_terminal, pr.reserved_at, pr.committed_at
+        FROM pos_redemption pr
+        JOIN voucher_type vt ON vt.id = pr.voucher_type_id
+        WHERE pr.reserved_at >= %s
+        ORDER BY pr.reserved_at DESC
+        """,
+        [start],
+        hold=hold,
+    )
+
+
+def redemption_queryset(start):
+    from .models import POSRedemption
+
+    return POSRedemption.objects.filter(reserved_at__gte=start)
+
+
+def voucher_code_queryset(voucher, q: str = "", status: str = ""):
+    from .models import QRClaim
+
+    qs = QRClaim.objects.filter(voucher_type=voucher)
+    if q:
+        qs = qs.filter(code__icontains=q)
+    if status:
+        qs = qs.filter(status=status)
+    return qs
+
+
+def exceeds(queryset, limit: int) -> bool:
+    """True if ``queryset`` has more than ``limit`` rows; counts at most ``limit + 1``."""
+    return queryset[: limit + 1].count() > limit
+
+
+def voucher_code_rows(voucher, q: str = "", status: str = ""):
+    qs = voucher_code_queryset(voucher, q, status).order_by("-created_at")
+
+    # One joined projection (LEFT JOIN app_user for the email) instead of a
+    # used_by_user lookup per row; iterator() reads through a server-side
+    # cursor in chunk_size batches and skips the queryset result cache
+    projection = qs.values_list(
+        "code", "status", "used_by_user__email", "used_at", "expires_at", "created_at",
+    ).iterator(chunk_size=DEFAULT_ITERSIZE)
+
+    def fmt(value):
+        return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+    return (
+        [code, code_status, email or "", fmt(used_at), fmt(expires_at), fmt(created_at)]
+        for code, code_status, email, used_at, expires_at, created_at in projection
+    )
+
+
+def write_voucher_qr_pdf(vouchers, out, progress=None) -> None:
+    """Render one QR page section per voucher type into ``out``; ``progress(n)`` is called per voucher."""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    from .qrcode_utils import render_qr_png
+
+    doc = SimpleDocTemplate(out, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
+
+    # Styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        textColor=colors.darkgreen
+    )
+
+    voucher_style = ParagraphStyle(
+        'VoucherTitle',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=10,
+        alignment=TA_CENTER,
+        textColor=colors.darkblue
+    )
+
+    # Build content
+    story = []
+
+    # Title
+    story.append(Paragraph("Furama Resort - Voucher QR Codes", title_style))
+    story.append(Spacer(1, 20))
+
+    for done, voucher in enumerate(vouchers, start=1):
+        # Create a sample QR claim for this voucher
+        # In a real implementation, you might want to generate multiple QR codes per voucher
+        qr_data = f"voucher:{voucher.slug}:claim"
+
+        # Generate QR code image
+        qr_png = render_qr_png(qr_data, profile="print")
+
+        # Use BytesIO instead of temporary file to avoid Windows path issues
+        qr_image_buffer = BytesIO(qr_png)
+
+        try:
+            # Add voucher title
+            story.append(Paragraph(f"{voucher.name}", voucher_style))
+            story.append(Spacer(1, 10))
+
+            # Add QR code image using BytesIO
+            qr_image = Image(qr_image_buffer, width=2*inch, height=2*inch)
+            qr_image.hAlign = 'CENTER'
+            story.append(qr_image)
+            story.append(Spacer(1, 10))
+
+            # Add voucher details
+            details = [
+                ['Voucher Code:', voucher.slug],
+                ['Description:', voucher.description or 'StayToken reward'],
+                ['Token ID:', str(voucher.token_id)],
+                ['Status:', 'Active' if voucher.active else 'Inactive'],
+            ]
+
+            details_table = Table(details, colWidths=[1.5*inch, 3*inch])
+            details_table.setStyle(TableStyle([
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ]))
+
+            story.append(details_table)
+            story.append(Spacer(1, 20))
+
+        finally:
+            # Close the BytesIO buffer
+            qr_image_buffer.close()
+
+        if progress:
+            progress(done)
+
+    # Build PDF
+    doc.build(story)
+
+
+def voucher_qr_pdf_filename() -> str:
+    return f'voucher_qr_codes_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+
+
+# ---------------- Streaming zip ----------------
+
+class _ZipSink:
+    """Write-only, unseekable file for ZipFile; ``drain`` hands back what was written so far."""
+
+    def __init__(self):
+        self._parts = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        self.size = 0
+        return data
+
+
+def iter_zip(members):
+    """
+    Encode ``(arcname, data, compress)`` members as a zip, yielding ~FILE_BLOCK_SIZE chunks.
+
+    ZipFile falls back to data descriptors on an unseekable sink, so only the
+    current member and the central directory entries are held in memory; Zip64
+    kicks in automatically past 65535 members.
+    """
+    sink = _ZipSink()
+    now = timezone.localtime().timetuple()[:6]
+    with zipfile.ZipFile(sink, "w") as zf:
+        for arcname, data, compress in members:
+            info = zipfile.ZipInfo(arcname, date_time=now)
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            zf.writestr(info, data)
+            if sink.size >= FILE_BLOCK_SIZE:
+                yield sink.drain()
+    yield sink.drain()
+
+
+def zip_response(filename: str, members) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(iter_zip(members), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# ---------------- Serving finished export files ----------------
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: str, size: int):
+    """Return (start, end) inclusive for a single ``bytes=`` range, None to ignore it, or False if unsatisfiable."""
+    m = _RANGE_RE.match((header or "").strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        # Multi-range and malformed headers are ignored; the full file is sent.
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        # Suffix range: the last N bytes.
+        start = max(size - int(m.group(2)), 0)
+        end = size - 1
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
+
+
+def _iter_file(path, start: int, length: int):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = fh.read(min(FILE_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def file_response(request, path, filename: str, content_type: str, etag: str):
+    """Serve ``path`` with ``Accept-Ranges`` so interrupted downloads can resume (206 / 416)."""
+    size = os.path.getsize(path)
+    byte_range = None
+    if request.headers.get("Range"):
+        if_range = request.headers.get("If-Range")
+        # A stale If-Range (file changed since the partial download) gets the whole file.
+        if not if_range or if_range == etag:
+            byte_range = _parse_range(request.headers["Range"], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_iter_file(path, start, end - start + 1), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    else:
+        response = StreamingHttpResponse(_iter_file(path, 0, size), content_type=content_type)
+        response["Content-Length"] = str(size)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
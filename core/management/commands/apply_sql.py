@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+SQL_DIR = Path(__file__).resolve().parents[2] / "sql"
+
+
+class Command(BaseCommand):
+    help = "Apply the DDL files in core/sql (models are managed=False, so Django migrations do not create these objects)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "files",
+            nargs="*",
+            help="Only apply these files (name or prefix, e.g. 0001). Default: all, in order.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the statements instead of executing them.",
+        )
+
+    def handle(self, *args, **options):
+        wanted = options["files"]
+        paths = sorted(SQL_DIR.glob("*.sql"))
+        if wanted:
+            paths = [p for p in paths if any(p.name.startswith(w) for w in wanted)]
+        if not paths:
+            self.stdout.write("No SQL files to apply.")
+            return
+
+        for path in paths:
+            sql = path.read_text(encoding="utf-8")
+            if options["dry_run"]:
+                self.stdout.write(f"-- {path.name}")
+                self.stdout.write(sql)
+                continue
+            # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+            if "CONCURRENTLY" in sql.upper():
+                with connection.cursor() as cur:
+                    for statement in _split_statements(sql):
+                        cur.execute(statement)
+            else:
+                with transaction.atomic(), connection.cursor() as cur:
+                    # Date arithmetic in the DDL (e.g. counter seeding) uses the project's local days.
+                    cur.execute("SELECT set_config('TimeZone', %s, true)", [settings.TIME_ZONE])
+                    cur.execute(sql)
+            self.stdout.write(self.style.SUCCESS(f"Applied {path.name}"))
+
+
+def _split_statements(sql: str):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    for statement in "\n".join(lines).split(";"):
+        if statement.strip():
+            yield statement
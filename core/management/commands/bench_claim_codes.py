@@ -0,0 +1,68 @@
+import secrets
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core import claim_codes
+from core.models import QRClaim, VoucherType
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _legacy_insert(voucher, n: int, prefix: str) -> None:
+    # What admin_voucher_generate_codes did before: random code, exists() + create() per code.
+    for code in (f"{prefix}_{secrets.token_hex(4).upper()}" for _ in range(n)):
+        if not QRClaim.objects.filter(code=code).exists():
+            QRClaim.objects.create(code=code, voucher_type=voucher, status="new", created_at=timezone.now())
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark claim-code encoding and bulk creation (COPY + INSERT ... ON CONFLICT) against the per-code loop. "
+        "Inserts are rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slug", required=True, help="voucher_type.slug to insert codes for")
+        parser.add_argument("--count", type=int, default=1_000_000)
+        parser.add_argument("--legacy", type=int, default=1000, help="Codes for the per-code baseline (0 to skip).")
+        parser.add_argument("--prefix", default="BENCH")
+        parser.add_argument("--keep", action="store_true", help="Commit the bulk-inserted codes.")
+
+    def handle(self, *args, **opts):
+        try:
+            voucher = VoucherType.objects.get(slug=opts["slug"])
+        except VoucherType.DoesNotExist:
+            raise CommandError("Voucher type not found")
+        count, prefix = opts["count"], opts["prefix"]
+
+        started = time.perf_counter()
+        claim_codes.encode_codes(range(1, count + 1), prefix)
+        gen = time.perf_counter() - started
+        self.stdout.write(f"{'encode':<10} {count:>10,} codes {gen:>8.2f}s {count / gen:>12,.0f}/s")
+
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                created = sum(len(c) for c in claim_codes.iter_create_codes(voucher.id, count, prefix=prefix))
+                bulk = time.perf_counter() - started
+                self.stdout.write(f"{'bulk':<10} {created:>10,} codes {bulk:>8.2f}s {created / bulk:>12,.0f}/s")
+
+                if opts["legacy"]:
+                    with transaction.atomic():
+                        started = time.perf_counter()
+                        _legacy_insert(voucher, opts["legacy"], prefix + "L")
+                        legacy = time.perf_counter() - started
+                        transaction.set_rollback(True)
+                    n = opts["legacy"]
+                    self.stdout.write(f"{'legacy':<10} {n:>10,} codes {legacy:>8.2f}s {n / legacy:>12,.0f}/s")
+                    self.stdout.write(f"speed-up: {(created / bulk) / (n / legacy):.0f}x")
+
+                if not opts["keep"]:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write("Rolled back.")
@@ -0,0 +1,102 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core import exports
+from core.models import QRClaim, VoucherType
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _seed(count: int) -> VoucherType:
+    """Synthetic campaign with ``count`` codes, every other one used by its own user."""
+    slug = f"bench-export-{uuid.uuid4().hex[:8]}"
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO voucher_type (id, slug, name, erc1155_contract, token_id, active, created_at)
+            VALUES (gen_random_uuid(), %s, 'Export benchmark', '0x0', 0, TRUE, NOW())
+            RETURNING id
+            """,
+            [slug],
+        )
+        vt_id = cur.fetchone()[0]
+        cur.execute(
+            """
+            INSERT INTO app_user (id, email, full_name, is_active, created_at, updated_at)
+            SELECT gen_random_uuid(), %s || g || '@bench.invalid', 'Bench', TRUE, NOW(), NOW()
+            FROM generate_series(1, %s) g
+            """,
+            [slug, count // 2],
+        )
+        cur.execute(
+            """
+            WITH users AS (
+                SELECT id, row_number() OVER () AS n FROM app_user WHERE email LIKE %s
+            )
+            INSERT INTO qr_claim (id, code, voucher_type_id, status, used_by_user, used_at, created_at)
+            SELECT gen_random_uuid(), %s || '_' || g, %s,
+                   CASE WHEN u.id IS NULL THEN 'new' ELSE 'used' END,
+                   u.id, CASE WHEN u.id IS NULL THEN NULL ELSE NOW() END,
+                   NOW() - g * INTERVAL '1 second'
+            FROM generate_series(1, %s) g
+            LEFT JOIN users u ON g %% 2 = 0 AND u.n = g / 2
+            """,
+            [f"{slug}%@bench.invalid", slug, vt_id, count],
+        )
+        cur.execute("ANALYZE qr_claim")
+    return VoucherType.objects.get(id=vt_id)
+
+
+def _legacy_rows(voucher, limit: int):
+    # What admin_voucher_export_codes did before: full objects, used_by_user fetched per row.
+    for code in QRClaim.objects.filter(voucher_type=voucher).order_by("-created_at")[:limit]:
+        yield [code.code, code.status, code.used_by_user.email if code.used_by_user else ""]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the voucher code CSV export on a synthetic campaign (default 100k codes, half used) "
+        "against the per-row used_by_user lookup. The synthetic data is rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100_000)
+        parser.add_argument("--legacy", type=int, default=2000, help="Rows for the per-row baseline (0 to skip).")
+        parser.add_argument("--keep", action="store_true", help="Commit the synthetic campaign.")
+
+    def _measure(self, label, rows):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            size = sum(len(chunk) for chunk in rows)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<10} {elapsed:>8.2f}s {len(ctx.captured_queries):>8,} queries {size:>12,} bytes")
+        return elapsed
+
+    def handle(self, *args, **opts):
+        count = opts["count"]
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                voucher = _seed(count)
+                self.stdout.write(f"Seeded {count:,} codes in {time.perf_counter() - started:.1f}s")
+
+                csv_chunks = exports.iter_csv(exports.VOUCHER_CODE_HEADER, exports.voucher_code_rows(voucher))
+                export = self._measure("export", csv_chunks)
+                self.stdout.write(f"           {count / export:,.0f} rows/s")
+
+                if opts["legacy"]:
+                    n = opts["legacy"]
+                    legacy = self._measure("legacy", exports.iter_csv(["Code", "Status", "Used By"], _legacy_rows(voucher, n)))
+                    self.stdout.write(f"           {n / legacy:,.0f} rows/s ({n:,} rows)")
+                    self.stdout.write(f"speed-up: {(count / export) / (n / legacy):.0f}x")
+
+                if not opts["keep"]:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write("Rolled back.")
@@ -0,0 +1,42 @@
+import io
+import time
+
+import qrcode
+from django.core.management.base import BaseCommand
+
+from core.qrcode_utils import FORMATS, PROFILES, render_qr
+
+
+def _legacy_png(data: str) -> bytes:
+    # What render_qr_png did before: qrcode.make + PIL PNG encode (box 10, border 4).
+    buf = io.BytesIO()
+    qrcode.make(data).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Benchmark QR render time and output size per format/profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--iterations", type=int, default=200)
+        parser.add_argument("--data", default="wallet:0x" + "ab" * 20, help="QR payload to render.")
+
+    def handle(self, *args, **opts):
+        n, data = opts["iterations"], opts["data"]
+        cases = [("legacy pil png", lambda: _legacy_png(data))]
+        for profile in PROFILES:
+            for fmt in FORMATS:
+                cases.append((f"{profile} {fmt}", lambda f=fmt, p=profile: render_qr(data, f, p)))
+
+        self.stdout.write(f"{'case':<16} {'ms/render':>10} {'bytes':>8}")
+        for label, fn in cases:
+            try:
+                out = fn()
+            except ImportError as exc:
+                self.stdout.write(f"{label:<16} skipped ({exc})")
+                continue
+            started = time.perf_counter()
+            for _ in range(n):
+                fn()
+            ms = (time.perf_counter() - started) * 1000 / n
+            self.stdout.write(f"{label:<16} {ms:>10.3f} {len(out):>8}")
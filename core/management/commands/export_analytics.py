@@ -0,0 +1,51 @@
+import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+
+from core import analytics_export
+
+
+class Command(BaseCommand):
+    help = "Append new redemptions/claims/codes to day-partitioned Parquet files in ST_ANALYTICS_DIR."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "datasets",
+            nargs="*",
+            help=f"Datasets to export (default: {', '.join(analytics_export.DATASETS)}).",
+        )
+        parser.add_argument("--batch-size", type=int, default=analytics_export.DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--lag-minutes",
+            type=int,
+            default=int(analytics_export.DEFAULT_LAG.total_seconds() // 60),
+            help="Leave rows newer than this for the next run.",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Drop the watermark and existing files first and re-export everything.",
+        )
+
+    def handle(self, *args, **options):
+        datasets = options["datasets"] or list(analytics_export.DATASETS)
+        unknown = [d for d in datasets if d not in analytics_export.DATASETS]
+        if unknown:
+            self.stderr.write(f"Unknown dataset(s): {', '.join(unknown)}")
+            return
+
+        lag = datetime.timedelta(minutes=options["lag_minutes"])
+        for dataset in datasets:
+            if options["full"]:
+                analytics_export.reset(dataset)
+            try:
+                result = analytics_export.export(dataset, batch_size=options["batch_size"], lag=lag)
+            except ImproperlyConfigured as exc:
+                self.stderr.write(str(exc))
+                return
+            self.stdout.write(
+                f"  {dataset}: {result['rows']:,} rows in {result['files']} files "
+                f"(watermark {result['watermark'] or '-'})"
+            )
+        self.stdout.write(self.style.SUCCESS("Analytics export complete."))
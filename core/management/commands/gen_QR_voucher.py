@@ -1,7 +1,7 @@
 import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from core.qrcode_utils import get_or_make_cached_png
+from core.qrcode_utils import cached_qr_path
 from core.models import VoucherType
 
 class Command(BaseCommand):
@@ -22,7 +22,7 @@ class Command(BaseCommand):
             
             # Create QR code PNG
             qr_data = f"voucher:{slug}:claim"
-            png_path = get_or_make_cached_png(f"voucher_{slug}.png", qr_data)
+            png_path = cached_qr_path(f"voucher_{slug}", qr_data)
             
             self.stdout.write(self.style.SUCCESS(f"Generated QR code for {slug}"))
             self.stdout.write(f"PNG saved to: {png_path}")
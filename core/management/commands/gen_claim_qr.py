@@ -1,8 +1,8 @@
-import csv, os, secrets, uuid
-from django.core.management.base import BaseCommand
+import csv, os
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.db import connection
-from core.qrcode_utils import get_or_make_cached_png
+from core import claim_codes, qr_batch
 
 class Command(BaseCommand):
     help = "Sinh QR claim một lần cho một voucher_type slug"
@@ -10,10 +10,17 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--slug", required=True, help="voucher_type.slug")
         parser.add_argument("--count", type=int, default=10)
+        parser.add_argument("--prefix", default="", help="Tiền tố mã (PREFIX_XXXXXXXXCCC), [A-Z0-9-]{0,16}")
+        parser.add_argument("--no-qr", action="store_true", help="Chỉ tạo mã + CSV, không render QR")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="QR render processes.")
 
     def handle(self, *args, **opts):
         slug = opts["slug"]
         count = opts["count"]
+        try:
+            claim_codes.clean_prefix(opts["prefix"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
 
         # lấy id voucher_type
         with connection.cursor() as cur:
@@ -28,26 +35,28 @@ class Command(BaseCommand):
         os.makedirs(out_dir, exist_ok=True)
         csv_path = os.path.join(out_dir, f"{slug}_qr.csv")
 
-        rows = []
-        for _ in range(count):
-            code = secrets.token_urlsafe(8)
-            new_id = uuid.uuid4()
-            with connection.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO qr_claim (id, code, voucher_type_id, status, created_at)
-                    VALUES (%s, %s, %s, 'new', NOW())
-                    """,
-                    [str(new_id), code, str(vtid)],
-                )
-            # Tạo QR file cho link claim
-            claim_url = f"/claim/{code}/"
-            get_or_make_cached_png(f"claim_{code}.png", claim_url)
-            rows.append({"code": code, "claim_url": claim_url})
-
-        with open(csv_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=["code","claim_url"])
-            writer.writeheader()
-            writer.writerows(rows)
-
-        self.stdout.write(self.style.SUCCESS(f"Generated {count} QR codes -> {csv_path}"))
+        # Một transaction, COPY theo chunk; CSV ghi dần nên không giữ hết mã trong RAM
+        created = 0
+        try:
+            with open(csv_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["code", "claim_url"])
+                for codes in claim_codes.iter_create_codes(vtid, count, prefix=opts["prefix"]):
+                    writer.writerows((code, f"/claim/{code}/") for code in codes)
+                    created += len(codes)
+                    self.stdout.write(f"  {created:,} codes")
+        except Exception:
+            # transaction đã rollback -> CSV không còn đúng
+            os.remove(csv_path)
+            raise
+
+        # Tạo QR file cho link claim (chỉ render ảnh còn thiếu, song song)
+        if not opts["no_qr"]:
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                next(reader)
+                items = ((code, f"claim_{code}", url) for code, url in reader)
+                for _ in qr_batch.iter_cached(items, workers=opts["workers"]):
+                    pass
+
+        self.stdout.write(self.style.SUCCESS(f"Generated {created} QR codes -> {csv_path}"))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from eth_account import Account
+
+from core.adapters import hd_wallet
+from core.adapters.wallet_provider import WalletProviderAdapter
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the master mnemonic for ST_WALLET_MODE = 'hd' and store it Fernet-encrypted "
+        "(ST_WALLET_ENCRYPTION_KEY) in ST_WALLET_HD_SEED_FILE. Every HD wallet is derived from it: "
+        "back it up offline, and never replace it once wallets exist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--words", type=int, default=24, choices=(12, 15, 18, 21, 24))
+        parser.add_argument("--mnemonic", help="Store this existing mnemonic (restore) instead of generating one.")
+        parser.add_argument("--show", action="store_true", help="Print the mnemonic once for the offline backup.")
+        parser.add_argument("--force", action="store_true", help="Overwrite an existing seed file.")
+
+    def handle(self, *args, **opts):
+        path = settings.ST_WALLET_HD_SEED_FILE
+        if path.exists() and not opts["force"]:
+            raise CommandError(f"{path} already exists; wallets derived from it would be lost (use --force to overwrite)")
+        fernet = WalletProviderAdapter(settings.ST_PROVIDER, settings.ST_CHAIN_ID)._fernet
+
+        Account.enable_unaudited_hdwallet_features()
+        if opts["mnemonic"]:
+            mnemonic = " ".join(opts["mnemonic"].split())
+            account = Account.from_mnemonic(mnemonic)  # validates words and checksum
+        else:
+            account, mnemonic = Account.create_with_mnemonic(num_words=opts["words"])
+
+        hd_wallet.write_seed(mnemonic, fernet)
+        self.stdout.write(self.style.SUCCESS(f"Master seed written to {path} (root account {account.address})"))
+        if opts["show"]:
+            self.stdout.write(mnemonic)
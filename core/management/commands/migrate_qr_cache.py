@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from core.qr_cache import get_store
+from core.qrcode_utils import is_cached_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete QR cache files under old keys (flat ST_QR_CACHE_DIR files and shard files not named "
+        "<name>-<profile>.<fmt>), rebuild the cache index and apply the size budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stats", action="store_true", help="Only print cache statistics.")
+
+    def handle(self, *args, **options):
+        store = get_store()
+        if not options["stats"]:
+            removed = store.remove_flat()
+            indexed = store.reindex(keep=is_cached_name)
+            evicted = store.evict()
+            self.stdout.write(f"  removed {removed:,} flat files, indexed {indexed:,}, evicted {evicted:,}")
+
+        stats = store.stats()
+        ratio = "-" if stats["hit_ratio"] is None else f"{stats['hit_ratio']:.1%}"
+        self.stdout.write(
+            f"  {stats['files']:,} files / {stats['bytes']:,} bytes "
+            f"(budget {stats['max_files'] or '∞'} files / {stats['max_bytes'] or '∞'} bytes, {stats['policy']})"
+        )
+        self.stdout.write(f"  hits {stats['hits']:,}, misses {stats['misses']:,}, hit ratio {ratio}, evictions {stats['evictions']:,}")
+        self.stdout.write(self.style.SUCCESS("QR cache OK."))
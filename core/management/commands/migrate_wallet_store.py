@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.adapters.keystore import JSONDirKeystore, SQLiteKeystore, get_keystore
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the per-wallet JSON files in ST_WALLET_STORE_DIR into the SQLite keystore "
+        "(ST_WALLET_KEYSTORE_PATH). Records are copied as stored (still encrypted) and read back before "
+        "the JSON file is considered migrated. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delete", action="store_true", help="Remove each JSON file once its copy is verified.")
+        parser.add_argument("--compact", action="store_true", help="Checkpoint and VACUUM the keystore afterwards.")
+
+    def handle(self, *args, **opts):
+        store = get_keystore()
+        if not isinstance(store, SQLiteKeystore):
+            raise CommandError("ST_WALLET_KEYSTORE is not 'sqlite'; nothing to migrate into.")
+        legacy = store.fallback or JSONDirKeystore(settings.ST_WALLET_STORE_DIR)
+
+        copied = skipped = deleted = 0
+        for ref in legacy.refs():
+            blob = legacy.get(ref)
+            if store.has(ref):
+                if store.get(ref) != blob:
+                    raise CommandError(f"{ref}: keystore record differs from the JSON file; left both in place")
+                skipped += 1
+            else:
+                store.put(ref, blob)
+                if store.get(ref) != blob:
+                    raise CommandError(f"{ref}: read-back mismatch after copy")
+                copied += 1
+            if opts["delete"]:
+                legacy.delete(ref)
+                deleted += 1
+
+        if opts["compact"]:
+            store.compact()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Keystore {store.path}: {store.count():,} records "
+                f"(copied {copied:,}, already present {skipped:,}, JSON files removed {deleted:,})"
+            )
+        )
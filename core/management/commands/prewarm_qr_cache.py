@@ -0,0 +1,79 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import qr_batch
+from core.qrcode_utils import DEFAULT_PROFILE, FORMATS, PROFILES
+
+MARKER_NAME = ".prewarm.json"
+# Save the resume marker every this many items.
+MARKER_EVERY = 1000
+
+
+def _csv(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Render missing QR cache images for every wallet, positive voucher balance and open claim code "
+        "in a process pool. Interrupted runs resume from a marker in ST_QR_CACHE_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sources", default=",".join(qr_batch.SOURCES), help="Comma list of: " + ", ".join(qr_batch.SOURCES))
+        parser.add_argument("--formats", default="png", help="Comma list of: " + ", ".join(FORMATS))
+        parser.add_argument("--profiles", default=DEFAULT_PROFILE, help="Comma list of: " + ", ".join(PROFILES))
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="QR render processes.")
+        parser.add_argument("--reset", action="store_true", help="Ignore the resume marker and start from the beginning.")
+
+    def handle(self, *args, **opts):
+        sources, formats, profiles = _csv(opts["sources"]), _csv(opts["formats"]), _csv(opts["profiles"])
+        for value, allowed in ((sources, qr_batch.SOURCES), (formats, FORMATS), (profiles, PROFILES)):
+            unknown = set(value) - set(allowed)
+            if unknown:
+                raise CommandError(f"Unknown value(s): {', '.join(sorted(unknown))}")
+
+        marker_path = settings.ST_QR_CACHE_DIR / MARKER_NAME
+        marker = {}
+        if marker_path.exists() and not opts["reset"]:
+            marker = json.loads(marker_path.read_text())
+
+        def save_marker():
+            tmp = marker_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(marker))
+            os.replace(tmp, marker_path)
+
+        started = time.monotonic()
+        total_rendered = 0
+        for source in sources:
+            for fmt in formats:
+                for profile in profiles:
+                    slot = f"{source}:{fmt}:{profile}"
+                    after = marker.get(slot)
+                    self.stdout.write(f"{slot}" + (f" (resuming after {after})" if after else ""))
+
+                    seen = rendered = 0
+                    slot_started = time.monotonic()
+                    items = qr_batch.SOURCES[source](after)
+                    for key, _, was_rendered in qr_batch.iter_cached(items, fmt=fmt, profile=profile, workers=opts["workers"]):
+                        seen += 1
+                        rendered += was_rendered
+                        if seen % MARKER_EVERY == 0:
+                            marker[slot] = key
+                            save_marker()
+                            rate = seen / max(time.monotonic() - slot_started, 0.001)
+                            self.stdout.write(f"  {seen:,} checked, {rendered:,} rendered ({rate:,.0f}/s)")
+
+                    # Finished: the next run walks this source from the start again.
+                    marker.pop(slot, None)
+                    save_marker()
+                    total_rendered += rendered
+                    self.stdout.write(f"  done: {seen:,} checked, {rendered:,} rendered")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {total_rendered:,} QR image(s) in {time.monotonic() - started:.1f}s"
+        ))
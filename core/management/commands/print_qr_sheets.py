@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import qr_sheets
+from core.models import VoucherType
+
+
+class Command(BaseCommand):
+    help = "Render print-ready A4 QR card sheets (with cut marks) for every claim code of a campaign."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slug", required=True, help="voucher_type.slug")
+        parser.add_argument("--status", default="new", help="Only codes with this status ('' for all). Default: new.")
+        parser.add_argument("--cols", type=int, default=qr_sheets.DEFAULT_COLS)
+        parser.add_argument("--rows", type=int, default=qr_sheets.DEFAULT_ROWS)
+        parser.add_argument("--pages-per-file", type=int, default=qr_sheets.DEFAULT_PAGES_PER_FILE)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="QR render processes.")
+        parser.add_argument("--out", help="Output directory (default: BASE_DIR/claim_qr/<slug>_cards).")
+
+    def handle(self, *args, **opts):
+        try:
+            voucher = VoucherType.objects.get(slug=opts["slug"])
+        except VoucherType.DoesNotExist:
+            self.stderr.write("Voucher type not found")
+            return
+
+        out_dir = opts["out"] or os.path.join(settings.BASE_DIR, "claim_qr", f"{voucher.slug}_cards")
+        started = time.monotonic()
+
+        def progress(done):
+            if done % 1000 == 0:
+                self.stdout.write(f"  {done:,} cards")
+
+        cards = qr_sheets.iter_rendered(
+            qr_sheets.iter_campaign_codes(voucher, opts["status"]),
+            workers=opts["workers"],
+        )
+        paths = qr_sheets.write_volumes(
+            cards,
+            out_dir,
+            f"{voucher.slug}_cards",
+            title=voucher.name,
+            cols=opts["cols"],
+            rows=opts["rows"],
+            pages_per_file=opts["pages_per_file"],
+            progress=progress,
+        )
+        if not paths:
+            self.stdout.write("No codes to print.")
+            return
+        for path in paths:
+            self.stdout.write(f"  {path}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(paths)} PDF file(s) in {time.monotonic() - started:.1f}s"))
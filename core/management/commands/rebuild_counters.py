@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import counters
+
+
+class Command(BaseCommand):
+    help = "Recount tracked tables exactly and reset stat_counter and voucher_code_stats."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "keys",
+            nargs="*",
+            help=f"Counters to rebuild (default: {', '.join([*counters.COUNTED_TABLES, *counters.SUMMED_COUNTERS])}).",
+        )
+        parser.add_argument(
+            "--skip-codes",
+            action="store_true",
+            help="Do not rebuild the per-campaign voucher_code_stats rows.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                totals = counters.rebuild(options["keys"] or None)
+                campaigns = None if options["skip_codes"] else counters.rebuild_code_stats()
+        except ValueError as exc:
+            self.stderr.write(str(exc))
+            return
+        for key, total in totals.items():
+            self.stdout.write(f"  {key}: {total:,}")
+        if campaigns is not None:
+            self.stdout.write(f"  voucher_code_stats: {campaigns:,} campaigns")
+        self.stdout.write(self.style.SUCCESS("Counters rebuilt."))
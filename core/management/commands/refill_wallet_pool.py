@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import wallet_pool
+
+
+class Command(BaseCommand):
+    help = "Top up the pool of pre-generated custodial wallets once it falls below the low watermark."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chain-id", type=int, default=settings.ST_CHAIN_ID)
+        parser.add_argument("--target", type=int, default=settings.ST_WALLET_POOL_TARGET, help="Fill up to this many.")
+        parser.add_argument("--low", type=int, default=settings.ST_WALLET_POOL_LOW, help="Refill when below this many.")
+        parser.add_argument("--loop", action="store_true", help="Keep checking instead of exiting after one pass.")
+        parser.add_argument("--sleep", type=float, default=30.0, help="Seconds between checks with --loop.")
+
+    def handle(self, *args, **options):
+        if getattr(settings, "ST_WALLET_MODE", "keystore") == "hd":
+            self.stdout.write("ST_WALLET_MODE is 'hd': wallets are derived on login, the pool is not used.")
+            return
+        chain_id = options["chain_id"]
+        while True:
+            available = wallet_pool.size(settings.ST_PROVIDER, chain_id)
+            if available < options["low"]:
+                self.stdout.write(f"Pool has {available:,} wallets; filling to {options['target']:,} ...")
+                started = time.monotonic()
+                added = wallet_pool.refill(
+                    chain_id,
+                    options["target"],
+                    progress=lambda n: self.stdout.write(f"  {n:,} generated"),
+                )
+                self.stdout.write(self.style.SUCCESS(f"  added {added:,} wallets in {time.monotonic() - started:.1f}s"))
+            elif not options["loop"]:
+                self.stdout.write(f"Pool has {available:,} wallets (low watermark {options['low']:,}); nothing to do.")
+            if not options["loop"]:
+                return
+            time.sleep(options["sleep"])
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import export_jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background export jobs (CSV/PDF) into ST_EXPORT_DIR."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit instead of polling.")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds between polls when the queue is empty.")
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=30,
+            help="Requeue running jobs with no progress for this long (crashed worker).",
+        )
+        parser.add_argument("--purge-days", type=int, help="Delete finished jobs and files older than N days, then exit.")
+
+    def handle(self, *args, **options):
+        if options["purge_days"] is not None:
+            removed = export_jobs.purge(options["purge_days"])
+            self.stdout.write(self.style.SUCCESS(f"Purged {removed} export jobs."))
+            return
+
+        requeued = export_jobs.requeue_stale(options["stale_minutes"])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale jobs.")
+
+        while True:
+            job = export_jobs.claim_next()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["sleep"])
+                continue
+
+            self.stdout.write(f"Running {job.kind} {job.id} ...")
+            try:
+                job = export_jobs.run(job)
+            except Exception as exc:
+                self.stderr.write(f"  failed: {exc}")
+                continue
+            self.stdout.write(self.style.SUCCESS(f"  done: {job.rows_done:,} rows, {job.file_size:,} bytes"))
@@ -14,6 +14,13 @@ class ExportStatus(models.TextChoices):
     DENIED = "denied", "Denied"
 
 
+class ExportJobStatus(models.TextChoices):
+    QUEUED = "queued", "Queued"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
 class PosRedeemStatus(models.TextChoices):
     RESERVED = "reserved", "Reserved"
     COMMITTED = "committed", "Committed"
@@ -94,6 +101,14 @@ class Wallet(models.Model):
         db_table = "wallet"
         managed = False
         unique_together = (("provider", "provider_ref"), ("chain_id", "address"))
+        # core/sql/0014; external wallets are transfer targets and may repeat.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "chain_id"],
+                condition=~models.Q(provider="external"),
+                name="uq_wallet_user_chain",
+            ),
+        ]
         indexes = [
             models.Index(fields=["user"], name="idx_wallet_user_py"),
             models.Index(fields=["chain_id"], name="idx_wallet_chain_py"),
@@ -297,6 +312,40 @@ class Policy(models.Model):
         return self.key
 
 
+class StatCounter(models.Model):
+    # Maintained by core.counters; DDL in core/sql/0001_stat_counter.sql and 0011_stat_counter_stripes.sql
+    pk = models.CompositePrimaryKey("key", "stripe")
+    key = models.CharField(max_length=64)
+    stripe = models.SmallIntegerField(db_default=0)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "stat_counter"
+        managed = False
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class VoucherCodeStats(models.Model):
+    # Maintained by core.counters; DDL in core/sql/0003_voucher_code_stats.sql
+    voucher_type = models.OneToOneField("VoucherType", primary_key=True, on_delete=models.CASCADE, db_column="voucher_type_id", related_name="code_stats")
+    total_codes = models.BigIntegerField(default=0, db_default=0)
+    new_codes = models.BigIntegerField(default=0, db_default=0)
+    used_codes = models.BigIntegerField(default=0, db_default=0)
+    expired_codes = models.BigIntegerField(default=0, db_default=0)
+    claimed_codes = models.BigIntegerField(default=0, db_default=0)
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "voucher_code_stats"
+        managed = False
+
+    def __str__(self):
+        return f"{self.voucher_type_id}: {self.used_codes}/{self.total_codes} used"
+
+
 # =========================
 # POS / Merchant (bổ sung)
 # =========================
@@ -350,3 +399,28 @@ class POSTerminalVoucher(models.Model):
 
     def __str__(self):
         return f"{self.terminal_id} ↔ {self.voucher_type_id}"
+
+
+class ExportJob(models.Model):
+    # Run by core.export_jobs / run_export_jobs; DDL in core/sql/0006_export_job.sql
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=32)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=ExportJobStatus.choices, default=ExportJobStatus.QUEUED)
+    rows_done = models.BigIntegerField(default=0)
+    rows_total = models.BigIntegerField(null=True, blank=True)
+    file_name = models.TextField(null=True, blank=True)
+    file_size = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    requested_by = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "export_job"
+        managed = False
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
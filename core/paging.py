@@ -0,0 +1,188 @@
+"""Keyset (cursor) pagination for the admin list pages.
+
+Pages are ordered by ``(<timestamp field> DESC, id DESC)`` and fetched with a
+row-value predicate on the last/first row shown, so page N costs the same index
+range scan as page 1 and no ``OFFSET`` or per-request ``COUNT(*)`` is issued.
+Totals are optional: pass an exact number you already have (e.g. from
+``core.counters``), ``"estimate"`` for a planner estimate, or nothing.
+"""
+import base64
+import datetime
+import json
+import uuid
+from typing import Optional
+
+from django.db import connection
+from django.db.models import BooleanField, F
+from django.db.models.expressions import RawSQL
+
+# Below this planner estimate an exact COUNT(*) is cheap enough to run instead.
+EXACT_COUNT_THRESHOLD = 10_000
+
+
+def encode_cursor(ts: Optional[datetime.datetime], row_id) -> str:
+    raw = json.dumps([ts.isoformat() if ts else None, str(row_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (timestamp or None, uuid); raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts_raw, id_raw = json.loads(base64.urlsafe_b64decode(padded))
+        ts = datetime.datetime.fromisoformat(ts_raw) if ts_raw else None
+        return ts, uuid.UUID(id_raw)
+    except Exception as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def estimate_count(queryset) -> int:
+    """Planner row estimate for ``queryset``; exact when the estimate is small."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cur:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]["Plan"]["Plan Rows"])
+    if estimate <= EXACT_COUNT_THRESHOLD:
+        return queryset.order_by().count()
+    return estimate
+
+
+class KeysetPage:
+    def __init__(self, object_list, *, has_next, has_previous, next_cursor, previous_cursor, total, total_is_estimate, truncated=False):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+        # True when a single page was cut at ``limit``: more rows match than are shown.
+        self.truncated = truncated
+
+    @classmethod
+    def single(cls, rows, limit=None):
+        """
+        Wrap an already-limited result list (e.g. ranked search hits) as one page.
+        Fetch ``limit + 1`` rows and pass ``limit`` so the extra row marks the page as truncated.
+        """
+        rows = list(rows)
+        truncated = limit is not None and len(rows) > limit
+        if truncated:
+            rows = rows[:limit]
+        return cls(
+            rows, has_next=False, has_previous=False, next_cursor=None, previous_cursor=None,
+            total=None if truncated else len(rows), total_is_estimate=False, truncated=truncated,
+        )
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    ``field`` is the timestamp column to order by. Set ``nullable=False`` when the
+    queryset already excludes NULLs so the plain ``DESC`` index can be used;
+    otherwise rows with a NULL timestamp come last, as a separate segment paged
+    by id, so each query stays a single index range (no ``OR ... IS NULL``).
+    """
+
+    def __init__(self, queryset, per_page: int, *, field: str = "created_at", nullable: bool = True, total=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.nullable = nullable
+        self.total = total
+
+    def _column(self):
+        meta = self.queryset.model._meta
+        return f'"{meta.db_table}"."{meta.get_field(self.field).column}"', f'"{meta.db_table}"."{meta.pk.column}"'
+
+    def _row_cmp(self, op: str, ts, row_id):
+        """``(field, pk) <op> (ts, row_id)`` as a filter expression."""
+        col, pk = self._column()
+        return RawSQL(f"({col}, {pk}) {op} (%s, %s)", [ts, row_id], output_field=BooleanField())
+
+    def _dated(self):
+        if self.nullable:
+            return self.queryset.filter(**{f"{self.field}__isnull": False})
+        return self.queryset
+
+    def _undated(self):
+        return self.queryset.filter(**{f"{self.field}__isnull": True})
+
+    def _forward(self, qs):
+        return qs.order_by(F(self.field).desc(nulls_last=True) if self.nullable else F(self.field).desc(), "-pk")
+
+    def _backward(self, qs):
+        return qs.order_by(F(self.field).asc(nulls_first=True) if self.nullable else F(self.field).asc(), "pk")
+
+    def _after(self, ts, row_id, limit: int) -> list:
+        """Up to ``limit`` rows following (ts, row_id), or the first rows when row_id is None."""
+        if row_id is not None and ts is None:
+            # Already inside the NULL segment
+            return list(self._undated().filter(pk__lt=row_id).order_by("-pk")[:limit])
+        qs = self._dated()
+        if row_id is not None:
+            qs = qs.filter(self._row_cmp("<", ts, row_id))
+        rows = list(self._forward(qs)[:limit])
+        if self.nullable and len(rows) < limit:
+            rows += self._undated().order_by("-pk")[:limit - len(rows)]
+        return rows
+
+    def _before(self, ts, row_id, limit: int) -> list:
+        """Up to ``limit`` rows preceding (ts, row_id), nearest first."""
+        rows = []
+        if ts is None:
+            rows = list(self._undated().filter(pk__gt=row_id).order_by("pk")[:limit])
+            qs = self._dated()
+        else:
+            qs = self._dated().filter(self._row_cmp(">", ts, row_id))
+        if len(rows) < limit:
+            rows += self._backward(qs)[:limit - len(rows)]
+        return rows
+
+    def _cursor_for(self, obj):
+        return encode_cursor(getattr(obj, self.field), obj.pk)
+
+    def _total(self):
+        if self.total == "estimate":
+            return estimate_count(self.queryset), True
+        return self.total, False
+
+    def page(self, after: Optional[str] = None, before: Optional[str] = None) -> KeysetPage:
+        """Page following cursor ``after`` or preceding cursor ``before`` (first page if neither)."""
+        limit = self.per_page + 1
+        if before:
+            rows = self._before(*decode_cursor(before), limit)
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            has_next = True
+        else:
+            rows = self._after(*(decode_cursor(after) if after else (None, None)), limit)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = bool(after)
+
+        total, is_estimate = self._total()
+        return KeysetPage(
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self._cursor_for(rows[-1]) if rows else None,
+            previous_cursor=self._cursor_for(rows[0]) if rows else None,
+            total=total,
+            total_is_estimate=is_estimate,
+        )
+
+    def page_from_request(self, request) -> KeysetPage:
+        try:
+            return self.page(after=request.GET.get("after") or None, before=request.GET.get("before") or None)
+        except ValueError:
+            return self.page()
@@ -1,6 +1,51 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import connection
 
+TERMINAL_DIRECTORY_KEY = "pos:terminal_directory"
+
+
+def _load_terminal_directory():
+    with connection.cursor() as cur:
+        cur.execute("""
+            SELECT pt.id, pt.code, pt.active, m.id, m.name, m.category, m.active
+            FROM pos_terminal pt
+            JOIN merchant m ON m.id = pt.merchant_id
+        """)
+        rows = cur.fetchall()
+    by_code = {}
+    for term_id, code, active, merchant_id, merchant, category, merchant_active in rows:
+        by_code[code] = {
+            "id": term_id,
+            "code": code,
+            "merchant_id": merchant_id,
+            "merchant": merchant,
+            "category": category,
+            "active": bool(active and merchant_active),
+        }
+    return {"by_code": by_code}
+
+
+def get_terminal_directory():
+    """Terminals + merchants keyed by code, cached for ST_TERMINAL_CACHE_SECONDS.
+
+    For admin display only: the cache may be per process and up to the TTL
+    stale, so authentication (``get_terminal_by_api_key``) never reads it.
+    """
+    directory = cache.get(TERMINAL_DIRECTORY_KEY)
+    if directory is None:
+        directory = _load_terminal_directory()
+        cache.set(TERMINAL_DIRECTORY_KEY, directory, getattr(settings, "ST_TERMINAL_CACHE_SECONDS", 60))
+    return directory
+
+
+def invalidate_terminal_directory():
+    """Call after creating/editing/deleting a terminal or merchant (clears this process' cache)."""
+    cache.delete(TERMINAL_DIRECTORY_KEY)
+
+
 def get_terminal_by_api_key(api_key: str):
+    # Always the database: a rotated key or deactivated terminal/merchant takes effect immediately.
     if not api_key:
         return None
     with connection.cursor() as cur:
@@ -24,3 +69,33 @@ def terminal_allows_voucher(terminal_id, voucher_type_id) -> bool:
             LIMIT 1
         """, [str(terminal_id), str(voucher_type_id)])
         return cur.fetchone() is not None
+
+
+def merchant_redemption_totals(since, limit: int = 5):
+    """Top merchants by committed amount since ``since``, aggregated in SQL via the terminal code join."""
+    with connection.cursor() as cur:
+        cur.execute("""
+            SELECT m.name,
+                   string_agg(DISTINCT pr.pos_terminal, ', ' ORDER BY pr.pos_terminal) AS terminals,
+                   COALESCE(SUM(pr.amount), 0) AS total_amount,
+                   COALESCE(SUM(pr.amount) FILTER (WHERE pr.status = 'committed'), 0) AS committed_amount,
+                   COUNT(*) AS redemption_count
+            FROM pos_redemption pr
+            LEFT JOIN pos_terminal pt ON pt.code = pr.pos_terminal
+            LEFT JOIN merchant m ON m.id = pt.merchant_id
+            WHERE pr.reserved_at >= %s AND pr.pos_terminal IS NOT NULL
+            GROUP BY m.id, m.name
+            ORDER BY committed_amount DESC
+            LIMIT %s
+        """, [since, limit])
+        rows = cur.fetchall()
+    return [
+        {
+            "merchant": name or "Unknown merchant",
+            "terminal": terminals,
+            "committed_amount": committed,
+            "total_amount": total,
+            "redemption_count": count,
+        }
+        for name, terminals, total, committed, count in rows
+    ]
@@ -0,0 +1,158 @@
+"""Bulk QR rendering in a process pool.
+
+``iter_pool`` runs a task over fixed-size batches in a spawn-context
+``ProcessPoolExecutor`` with a bounded number of batches in flight and yields
+results in input order. ``iter_cached`` builds on it for the QR cache: for each
+``(name, data)`` spec it renders only the files missing from the store, writes
+them from the parent process (single index writer) and yields cache paths.
+"""
+import collections
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import exports
+from .qr_cache import get_store
+from .qrcode_utils import (
+    DEFAULT_PROFILE,
+    cached_name,
+    claim_qr_spec,
+    render_qr,
+    voucher_qr_spec,
+    wallet_qr_spec,
+)
+
+# Items per pool task.
+RENDER_BATCH = 64
+
+
+def batches(iterable, size: int = RENDER_BATCH):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_pool(items, task, *, workers: int = None, batch_size: int = RENDER_BATCH):
+    """Yield ``(batch, task(batch))`` in input order, running ``task`` in worker processes."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for batch in batches(items, batch_size):
+            yield batch, task(batch)
+        return
+
+    # spawn: render workers must not inherit the parent's open DB connection.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Keep a small window in flight instead of Executor.map, which would
+        # submit (and buffer the results of) every item at once.
+        pending = collections.deque()
+        for batch in batches(items, batch_size):
+            pending.append((batch, pool.submit(task, batch)))
+            if len(pending) >= workers * 2:
+                done_batch, future = pending.popleft()
+                yield done_batch, future.result()
+        while pending:
+            done_batch, future = pending.popleft()
+            yield done_batch, future.result()
+
+
+def _render_missing(batch) -> list:
+    """Pool task over ``[(key, filename, job)]``; ``job`` is ``(data, fmt, profile)``, or None if already cached."""
+    return [render_qr(*job) if job else None for _, _, job in batch]
+
+
+def iter_cached(items, *, fmt: str = "png", profile: str = DEFAULT_PROFILE, workers: int = None, batch_size: int = RENDER_BATCH):
+    """
+    Yield ``(key, path, rendered)`` for each ``(key, name, data)`` item, in order.
+
+    Files already in the cache are not re-rendered; ``rendered`` tells which
+    ones were produced by this call. ``key`` is passed through untouched
+    (resume markers, zip member names).
+    """
+    store = get_store()
+
+    def tagged():
+        for key, name, data in items:
+            filename = cached_name(name, fmt, profile)
+            job = None if store.path_for(filename).exists() else (data, fmt, profile)
+            yield key, filename, job
+
+    for batch, results in iter_pool(tagged(), _render_missing, workers=workers, batch_size=batch_size):
+        for (key, filename, job), body in zip(batch, results):
+            path = store.put(filename, body) if job else store.path_for(filename)
+            yield key, path, job is not None
+
+
+def read_cached(path, data: str, fmt: str = "png", profile: str = DEFAULT_PROFILE) -> bytes:
+    """Bytes of a file yielded by ``iter_cached``; re-renders if eviction removed it in the meantime."""
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return render_qr(data, fmt, profile)
+
+
+# ---------------- Sources ----------------
+# Each source yields ``(key, name, data)`` in key order; ``after`` resumes past a
+# key recorded earlier (keyset pagination, so a resumed run skips the prefix in SQL).
+
+def wallet_items(after=None):
+    sql = "SELECT id::text, encode(address, 'hex') FROM wallet WHERE address IS NOT NULL"
+    params = []
+    if after:
+        sql += " AND id > %s::uuid"
+        params.append(after)
+    for wallet_id, addr_hex in exports.stream_query(sql + " ORDER BY id", params):
+        yield (wallet_id, *wallet_qr_spec(addr_hex.lower()))
+
+
+def voucher_balance_items(after=None):
+    sql = """
+        SELECT vb.wallet_id::text, vb.voucher_type_id::text, vt.slug, encode(w.address, 'hex')
+        FROM voucher_balance vb
+        JOIN voucher_type vt ON vt.id = vb.voucher_type_id AND vt.active
+        JOIN wallet w ON w.id = vb.wallet_id
+        WHERE vb.balance > 0
+    """
+    params = []
+    if after:
+        sql += " AND (vb.wallet_id, vb.voucher_type_id) > (%s::uuid, %s::uuid)"
+        params.extend(after)
+    for wallet_id, voucher_type_id, slug, addr_hex in exports.stream_query(sql + " ORDER BY vb.wallet_id, vb.voucher_type_id", params):
+        yield ([wallet_id, voucher_type_id], *voucher_qr_spec(slug, addr_hex.lower()))
+
+
+def claim_items(after=None, *, voucher_type_id=None, status: str = "new"):
+    """Claim codes; ``status='new'`` also skips codes already past ``expires_at``."""
+    sql = "SELECT id::text, code FROM qr_claim WHERE TRUE"
+    params = []
+    if voucher_type_id:
+        sql += " AND voucher_type_id = %s::uuid"
+        params.append(str(voucher_type_id))
+    if status:
+        sql += " AND status = %s"
+        params.append(status)
+    if status == "new":
+        sql += " AND (expires_at IS NULL OR expires_at > NOW())"
+    if after:
+        sql += " AND id > %s::uuid"
+        params.append(after)
+    for claim_id, code in exports.stream_query(sql + " ORDER BY id", params):
+        yield (claim_id, *claim_qr_spec(code))
+
+
+SOURCES = {
+    "wallets": wallet_items,
+    "balances": voucher_balance_items,
+    "claims": claim_items,
+}
+
+
+def claim_images(voucher_type_id, *, status: str = "new", fmt: str = "png", profile: str = DEFAULT_PROFILE, workers: int = None):
+    """Yield ``(code, image bytes)`` for a campaign's claim codes, filling the cache as it goes."""
+    items = ((data, name, data) for _, name, data in claim_items(voucher_type_id=voucher_type_id, status=status))
+    for code, path, _ in iter_cached(items, fmt=fmt, profile=profile, workers=workers):
+        yield code, read_cached(path, code, fmt, profile)
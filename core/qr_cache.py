@@ -0,0 +1,374 @@
+"""Bounded, sharded on-disk store for rendered QR PNGs.
+
+Files live under ``ST_QR_CACHE_DIR/<h[:2]>/<h[2:4]>/<filename>`` (``h`` = sha1
+of the filename), so no directory grows past a few hundred entries. A small
+SQLite index next to the shards tracks size, hit count and last access per
+file plus running totals, which lets the store enforce ``ST_QR_CACHE_MAX_BYTES``
+and ``ST_QR_CACHE_MAX_FILES`` with LRU or LFU eviction without walking the
+tree. Writes go to a temp file and are published with ``os.replace``.
+
+Rendering is single-flight per key: concurrent requests in one process wait
+on the first one's render, and processes serialize on a striped ``flock``
+(``.locks/<h[:3]>.lock``) and re-check the shard after acquiring it, so a
+burst of requests for a new QR costs one render.
+
+Hits are buffered in memory and flushed every few seconds, so serving a
+cached file does not cost an index write per request.
+"""
+import atexit
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no flock on Windows; in-process single-flight only
+    fcntl = None
+
+INDEX_NAME = "index.sqlite3"
+POLICIES = ("lru", "lfu")
+# Evict down to this fraction of the budget so we don't evict on every put.
+EVICT_TO = 0.9
+EVICT_BATCH = 500
+FLUSH_SECONDS = 5.0
+FLUSH_PENDING = 500
+# Followers give up waiting on an in-process render after this and render themselves.
+RENDER_WAIT_SECONDS = 30
+LOCK_DIR = ".locks"
+_FILENAME_RE = re.compile(r"[A-Za-z0-9_.-]+")
+_SHARD_RE = re.compile(r"[0-9a-f]{2}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_access REAL NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_lfu ON entries (hits, last_access);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+class QRCacheStore:
+    def __init__(self, root, *, max_bytes: int = 0, max_files: int = 0, policy: str = "lru"):
+        if policy not in POLICIES:
+            raise ValueError(f"QR cache policy must be one of {', '.join(POLICIES)}")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.policy = policy
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending_hits = {}
+        self._pending_access = {}
+        self._pending_counts = {"hits": 0, "misses": 0}
+        self._last_flush = time.monotonic()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    # ---------------- index ----------------
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread and process (forked workers must not share one).
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.root / INDEX_NAME, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _bump_counters(self, db, **deltas) -> None:
+        db.executemany(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            [(name, delta) for name, delta in deltas.items() if delta],
+        )
+
+    def _counters(self) -> dict:
+        return dict(self._db().execute("SELECT name, value FROM counters").fetchall())
+
+    # ---------------- paths ----------------
+
+    def path_for(self, key: str) -> Path:
+        if not _FILENAME_RE.fullmatch(key or "") or key == INDEX_NAME:
+            raise ValueError("Invalid QR cache filename")
+        h = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.root / h[:2] / h[2:4] / key
+
+    # ---------------- hit accounting ----------------
+
+    def _record(self, key: str, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+                self._pending_access[key] = time.time()
+                self._pending_counts["hits"] += 1
+            else:
+                self._pending_counts["misses"] += 1
+            due = (
+                len(self._pending_hits) >= FLUSH_PENDING
+                or time.monotonic() - self._last_flush >= FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered hit counts / access times to the index."""
+        with self._lock:
+            hits, self._pending_hits = self._pending_hits, {}
+            access, self._pending_access = self._pending_access, {}
+            counts, self._pending_counts = self._pending_counts, {"hits": 0, "misses": 0}
+            self._last_flush = time.monotonic()
+        if not hits and not any(counts.values()):
+            return
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "UPDATE entries SET hits = hits + ?, last_access = MAX(last_access, ?) WHERE key = ?",
+                [(n, access[k], k) for k, n in hits.items()],
+            )
+            self._bump_counters(db, **counts)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    # ---------------- read / write ----------------
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path_for(key)
+        hit = path.exists()
+        self._record(key, hit)
+        return path if hit else None
+
+    def put(self, key: str, data: bytes) -> Path:
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self._index(key, len(data), time.time())
+        self.evict_if_needed()
+        return path
+
+    def get_or_create(self, key: str, render: Callable[[], bytes]) -> Path:
+        path = self.get(key)
+        if path:
+            return path
+
+        with self._inflight_lock:
+            done = self._inflight.get(key)
+            leader = done is None
+            if leader:
+                done = self._inflight[key] = threading.Event()
+        if not leader:
+            done.wait(RENDER_WAIT_SECONDS)
+            path = self.path_for(key)
+            if path.exists():
+                return path
+            # The leader failed or timed out; render under the file lock ourselves.
+            return self._render_locked(key, render)
+
+        try:
+            return self._render_locked(key, render)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    @contextlib.contextmanager
+    def _file_lock(self, key: str):
+        if fcntl is None:
+            yield
+            return
+        h = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        lock_dir = self.root / LOCK_DIR
+        lock_dir.mkdir(exist_ok=True)
+        fd = os.open(lock_dir / f"{h[:3]}.lock", os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the flock
+
+    def _render_locked(self, key: str, render: Callable[[], bytes]) -> Path:
+        with self._file_lock(key):
+            # Another process may have published it while we waited for the lock.
+            path = self.path_for(key)
+            if path.exists():
+                return path
+            return self.put(key, render())
+
+    def _index(self, key: str, size: int, now: float) -> None:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT size FROM entries WHERE key = ?", [key]).fetchone()
+            db.execute(
+                "INSERT INTO entries (key, size, hits, last_access, created) VALUES (?, ?, 0, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET size = excluded.size, last_access = excluded.last_access",
+                [key, size, now, now],
+            )
+            if row:
+                self._bump_counters(db, bytes=size - row[0], renders=1)
+            else:
+                self._bump_counters(db, bytes=size, files=1, renders=1)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    # ---------------- eviction ----------------
+
+    def _over_budget(self, totals: dict, fraction: float = 1.0) -> bool:
+        return bool(
+            (self.max_bytes and totals.get("bytes", 0) > self.max_bytes * fraction)
+            or (self.max_files and totals.get("files", 0) > self.max_files * fraction)
+        )
+
+    def evict_if_needed(self) -> int:
+        if not self._over_budget(self._counters()):
+            return 0
+        self.flush()
+        return self.evict()
+
+    def evict(self) -> int:
+        """Delete least-recently (lru) or least-frequently (lfu) used files until under EVICT_TO of the budget."""
+        order = "last_access" if self.policy == "lru" else "hits, last_access"
+        evicted = 0
+        db = self._db()
+        while True:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                totals = self._counters()
+                files, size = totals.get("files", 0), totals.get("bytes", 0)
+                rows = []
+                for key, entry_size in db.execute(f"SELECT key, size FROM entries ORDER BY {order} LIMIT ?", [EVICT_BATCH]):
+                    if not self._over_budget({"files": files, "bytes": size}, EVICT_TO):
+                        break
+                    rows.append((key, entry_size))
+                    files -= 1
+                    size -= entry_size
+                if not rows:
+                    db.execute("COMMIT")
+                    break
+                db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in rows])
+                self._bump_counters(db, bytes=-sum(s for _, s in rows), files=-len(rows), evictions=len(rows))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            # Unlink after the index commit; open FileResponses keep their fd.
+            for key, _ in rows:
+                self.path_for(key).unlink(missing_ok=True)
+            evicted += len(rows)
+        return evicted
+
+    # ---------------- maintenance ----------------
+
+    def _iter_shard_files(self):
+        for first in self.root.iterdir():
+            if not (first.is_dir() and _SHARD_RE.fullmatch(first.name)):
+                continue
+            for second in first.iterdir():
+                if not (second.is_dir() and _SHARD_RE.fullmatch(second.name)):
+                    continue
+                yield from second.iterdir()
+
+    def reindex(self, keep: Optional[Callable[[str], bool]] = None) -> int:
+        """Rebuild the index from the shard tree (drops stale temp files, and files ``keep`` rejects)."""
+        entries = []
+        stale_before = time.time() - 3600
+        for path in self._iter_shard_files():
+            st = path.stat()
+            if path.name.endswith(".tmp"):
+                if st.st_mtime < stale_before:
+                    path.unlink(missing_ok=True)
+                continue
+            if keep is not None and not keep(path.name):
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((path.name, st.st_size, st.st_mtime, st.st_mtime))
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM entries")
+            db.executemany("INSERT OR REPLACE INTO entries (key, size, hits, last_access, created) VALUES (?, ?, 0, ?, ?)", entries)
+            db.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('files', ?)", [len(entries)])
+            db.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('bytes', ?)", [sum(e[1] for e in entries)])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return len(entries)
+
+    def remove_flat(self) -> int:
+        """Delete files left directly in the cache root by the old flat layout.
+
+        They are keyed by the pre-profile names (``wallet_<addr>.png``), which
+        nothing requests any more, so moving them into shards would only spend
+        the budget until eviction.
+        """
+        removed = 0
+        for path in list(self.root.iterdir()):
+            if not path.is_file() or path.name.startswith(INDEX_NAME) or not _FILENAME_RE.fullmatch(path.name):
+                continue
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        self.flush()
+        totals = self._counters()
+        hits, misses = totals.get("hits", 0), totals.get("misses", 0)
+        return {
+            "files": totals.get("files", 0),
+            "bytes": totals.get("bytes", 0),
+            "max_files": self.max_files,
+            "max_bytes": self.max_bytes,
+            "policy": self.policy,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "evictions": totals.get("evictions", 0),
+            "renders": totals.get("renders", 0),
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> QRCacheStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = QRCacheStore(
+                    settings.ST_QR_CACHE_DIR,
+                    max_bytes=getattr(settings, "ST_QR_CACHE_MAX_BYTES", 0),
+                    max_files=getattr(settings, "ST_QR_CACHE_MAX_FILES", 0),
+                    policy=getattr(settings, "ST_QR_CACHE_POLICY", "lru"),
+                )
+                atexit.register(_store.flush)
+    return _store
@@ -0,0 +1,144 @@
+"""Print-ready QR card sheets for every claim code of a campaign.
+
+Codes are read with a server-side cursor, their QR PNGs are rendered in a
+process pool (bounded number of batches in flight, results kept in code
+order) and drawn ``cols x rows`` per A4 page with cut marks. Pages are
+written with a reportlab canvas as the cards arrive; ``write_volumes`` closes
+a PDF every ``pages_per_file`` pages so memory stays bounded for 10k+ cards.
+"""
+import io
+from pathlib import Path
+
+from .qr_batch import RENDER_BATCH, iter_pool
+from .qrcode_utils import render_qr_png
+
+DEFAULT_COLS = 3
+DEFAULT_ROWS = 4
+DEFAULT_PAGES_PER_FILE = 100
+
+
+def render_batch(payloads) -> list:
+    """Pool task: render a batch of QR payloads to print-profile PNG bytes (module-level so it pickles)."""
+    return [render_qr_png(p, profile="print") for p in payloads]
+
+
+def iter_rendered(codes, *, workers: int = None, batch_size: int = RENDER_BATCH):
+    """Yield ``(code, png)`` in input order, rendering in a process pool."""
+    for batch, pngs in iter_pool(codes, render_batch, workers=workers, batch_size=batch_size):
+        yield from zip(batch, pngs)
+
+
+def iter_campaign_codes(voucher, status: str = "new"):
+    from . import exports
+
+    sql = "SELECT code FROM qr_claim WHERE voucher_type_id = %s"
+    params = [str(voucher.id)]
+    if status:
+        sql += " AND status = %s"
+        params.append(status)
+    sql += " ORDER BY created_at, id"
+    for (code,) in exports.stream_query(sql, params, hold=True):
+        yield code
+
+
+class SheetWriter:
+    """Draw cards onto A4 pages of one PDF; call ``add`` per card and ``close`` at the end."""
+
+    def __init__(self, out, *, title: str = "", cols: int = DEFAULT_COLS, rows: int = DEFAULT_ROWS):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import mm
+        from reportlab.pdfgen import canvas
+
+        self.canvas = canvas.Canvas(out, pagesize=A4)
+        self.title = title
+        self.cols = cols
+        self.rows = rows
+        self.page_w, self.page_h = A4
+        self.margin = 10 * mm
+        self.mark = 4 * mm
+        self.cell_w = (self.page_w - 2 * self.margin) / cols
+        self.cell_h = (self.page_h - 2 * self.margin) / rows
+        self.on_page = 0
+        self.pages = 0
+
+    def _cut_marks(self):
+        c = self.canvas
+        c.setLineWidth(0.3)
+        left, right = self.margin, self.page_w - self.margin
+        bottom, top = self.margin, self.page_h - self.margin
+        for i in range(self.cols + 1):
+            x = left + i * self.cell_w
+            c.line(x, top + 1, x, top + self.mark)
+            c.line(x, bottom - 1, x, bottom - self.mark)
+        for j in range(self.rows + 1):
+            y = bottom + j * self.cell_h
+            c.line(left - 1, y, left - self.mark, y)
+            c.line(right + 1, y, right + self.mark, y)
+
+    def add(self, code: str, png: bytes):
+        from reportlab.lib.utils import ImageReader
+
+        if self.on_page == 0:
+            self._cut_marks()
+        col = self.on_page % self.cols
+        row = self.on_page // self.cols
+        x = self.margin + col * self.cell_w
+        y = self.page_h - self.margin - (row + 1) * self.cell_h
+
+        c = self.canvas
+        side = min(self.cell_w, self.cell_h) * 0.7
+        c.drawImage(ImageReader(io.BytesIO(png)), x + (self.cell_w - side) / 2, y + self.cell_h - side - 6, side, side)
+        c.setFont("Helvetica-Bold", 9)
+        c.drawCentredString(x + self.cell_w / 2, y + 18, code)
+        if self.title:
+            c.setFont("Helvetica", 7)
+            c.drawCentredString(x + self.cell_w / 2, y + 8, self.title[:60])
+
+        self.on_page += 1
+        if self.on_page == self.cols * self.rows:
+            self._end_page()
+
+    def _end_page(self):
+        self.canvas.showPage()
+        self.on_page = 0
+        self.pages += 1
+
+    def close(self) -> int:
+        if self.on_page:
+            self._end_page()
+        self.canvas.save()
+        return self.pages
+
+
+def write_sheets(cards, out, *, title: str = "", cols: int = DEFAULT_COLS, rows: int = DEFAULT_ROWS, progress=None) -> int:
+    """Write every ``(code, png)`` card into a single PDF ``out``; returns the page count."""
+    writer = SheetWriter(out, title=title, cols=cols, rows=rows)
+    for done, (code, png) in enumerate(cards, start=1):
+        writer.add(code, png)
+        if progress:
+            progress(done)
+    return writer.close()
+
+
+def write_volumes(cards, out_dir, basename: str, *, title: str = "", cols: int = DEFAULT_COLS,
+                  rows: int = DEFAULT_ROWS, pages_per_file: int = DEFAULT_PAGES_PER_FILE, progress=None) -> list:
+    """Like ``write_sheets`` but start a new ``<basename>_NNN.pdf`` every ``pages_per_file`` pages."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    per_file = pages_per_file * cols * rows
+    paths = []
+    writer = None
+    for done, (code, png) in enumerate(cards, start=1):
+        if writer is None:
+            path = out_dir / f"{basename}_{len(paths) + 1:03d}.pdf"
+            writer = SheetWriter(str(path), title=title, cols=cols, rows=rows)
+            paths.append(path)
+        writer.add(code, png)
+        if done % per_file == 0:
+            writer.close()
+            writer = None
+        if progress:
+            progress(done)
+    if writer is not None:
+        writer.close()
+    return paths
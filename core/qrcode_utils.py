@@ -1,32 +1,141 @@
-import io
-import os
+import hashlib
 import re
-from pathlib import Path
+import struct
+import zlib
 
 import qrcode
-from django.conf import settings
-from django.http import HttpResponse
-
-def render_qr_png(data: str) -> bytes:
-    img = qrcode.make(data)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
-
-def qr_response(data: str) -> HttpResponse:
-    png = render_qr_png(data)
-    return HttpResponse(png, content_type="image/png")
-
-def get_or_make_cached_png(filename: str, data: str) -> str:
-    """Lưu file PNG QR vào ST_QR_CACHE_DIR, trả path filesystem."""
-    cache_dir = Path(settings.ST_QR_CACHE_DIR)
-    cache_dir.mkdir(parents=True, exist_ok=True)
-
-    if not re.fullmatch(r"[A-Za-z0-9_.-]+", filename):
-        raise ValueError("Invalid QR cache filename")
-
-    path = cache_dir / filename
-    if not path.exists():
-        png = render_qr_png(data)
-        path.write_bytes(png)
-    return str(path)
+from qrcode import constants
+
+from .qr_cache import get_store
+
+# Bump when rendering changes so clients holding an old ETag refetch.
+QR_RENDER_VERSION = "2"
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+ERROR_CORRECTION = {
+    "L": constants.ERROR_CORRECT_L,
+    "M": constants.ERROR_CORRECT_M,
+    "Q": constants.ERROR_CORRECT_Q,
+    "H": constants.ERROR_CORRECT_H,
+}
+# box_size = pixels per module (PNG) / nominal px per module (SVG); border in modules.
+PROFILES = {
+    "screen": {"box_size": 6, "border": 4, "error_correction": "M"},
+    "print": {"box_size": 16, "border": 4, "error_correction": "Q"},
+}
+DEFAULT_PROFILE = "screen"
+
+
+def qr_matrix(data: str, *, border: int = 4, error_correction: str = "M"):
+    """Module matrix (rows of bools, quiet zone included); needs no PIL."""
+    qr = qrcode.QRCode(error_correction=ERROR_CORRECTION[error_correction], box_size=1, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _png_chunk(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+
+
+def matrix_to_png(matrix, box_size: int) -> bytes:
+    """1-bit grayscale PNG, encoded directly (no PIL); the smallest lossless form of a QR."""
+    size = len(matrix) * box_size
+    pad = -size % 8
+    lines = []
+    for row in matrix:
+        bits = "".join(("0" if dark else "1") * box_size for dark in row) + "1" * pad
+        line = b"\x00" + int(bits, 2).to_bytes((size + pad) // 8, "big")
+        lines.append(line * box_size)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)),
+        _png_chunk(b"IDAT", zlib.compress(b"".join(lines), 9)),
+        _png_chunk(b"IEND", b""),
+    ])
+
+
+def matrix_to_svg(matrix, box_size: int) -> bytes:
+    """One <path> of horizontal runs in module units; scales crisply to any print size."""
+    n = len(matrix)
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < n:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < n and row[x]:
+                x += 1
+            runs.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {n} {n}" '
+        f'width="{n * box_size}" height="{n * box_size}" shape-rendering="crispEdges">'
+        f'<rect width="{n}" height="{n}" fill="#fff"/><path fill="#000" d="{"".join(runs)}"/></svg>'
+    ).encode("utf-8")
+
+
+def profile_options(profile: str = DEFAULT_PROFILE, **overrides) -> dict:
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown QR profile {profile}")
+    options = dict(PROFILES[profile])
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return options
+
+
+def render_qr(data: str, fmt: str = "png", profile: str = DEFAULT_PROFILE, **overrides) -> bytes:
+    """Render ``data`` as ``fmt`` (png|svg) using a size profile; box_size/border/error_correction override it."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown QR format {fmt}")
+    options = profile_options(profile, **overrides)
+    matrix = qr_matrix(data, border=options["border"], error_correction=options["error_correction"])
+    if fmt == "svg":
+        return matrix_to_svg(matrix, options["box_size"])
+    return matrix_to_png(matrix, options["box_size"])
+
+
+def qr_etag(data: str, fmt: str = "png", profile: str = DEFAULT_PROFILE) -> str:
+    """Strong ETag for the rendered ``data``; output is deterministic, so no file read is needed."""
+    options = profile_options(profile)
+    key = f"{QR_RENDER_VERSION}:{fmt}:{options['box_size']}:{options['border']}:{options['error_correction']}:{data}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+# (cache name, payload) for each QR the /qr/* views serve; shared with the pre-warm/zip tools.
+def wallet_qr_spec(addr_hex: str):
+    return f"wallet_{addr_hex}", f"wallet:0x{addr_hex}"
+
+
+def voucher_qr_spec(slug: str, addr_hex: str):
+    return f"voucher_{slug}_{addr_hex}", f"voucher:{slug}:0x{addr_hex}"
+
+
+def claim_qr_spec(code: str):
+    return f"qr_claim_{code}", code  # QRClaim code is the data itself
+
+
+def voucher_admin_qr_spec(slug: str):
+    return f"voucher_{slug}", f"voucher:{slug}:claim"
+
+
+def cached_name(name: str, fmt: str = "png", profile: str = DEFAULT_PROFILE) -> str:
+    return f"{name}-{profile}.{fmt}"
+
+
+_CACHED_NAME_RE = re.compile(rf"[A-Za-z0-9_.-]+-(?:{'|'.join(PROFILES)})\.(?:{'|'.join(FORMATS)})")
+
+
+def is_cached_name(filename: str) -> bool:
+    """True for names ``cached_name`` produces (anything else in the cache is an old key)."""
+    return bool(_CACHED_NAME_RE.fullmatch(filename))
+
+
+def render_qr_png(data: str, profile: str = DEFAULT_PROFILE) -> bytes:
+    return render_qr(data, "png", profile)
+
+def cached_qr_path(name: str, data: str, fmt: str = "png", profile: str = DEFAULT_PROFILE) -> str:
+    """Cached render of ``data`` stored as ``<name>-<profile>.<fmt>``; returns the filesystem path."""
+    filename = cached_name(name, fmt, profile)
+    return str(get_store().get_or_create(filename, lambda: render_qr(data, fmt, profile)))
@@ -0,0 +1,119 @@
+"""Admin search for guests and claim codes.
+
+Backed by the pg_trgm GIN and text_pattern_ops indexes in
+``core/sql/0005_trigram_search.sql``. Each search tries the cheapest exact
+lookup first, then an anchored prefix scan, and only then a ranked trigram
+``ILIKE '%q%'`` match, so a leading wildcard never turns into a sequential scan.
+"""
+import re
+
+from .models import AppUser, QRClaim
+
+DEFAULT_LIMIT = 50
+# pg_trgm cannot use the index for patterns with fewer than 3 characters.
+MIN_TRIGRAM_LENGTH = 3
+
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+_PHONE_RE = re.compile(r"\+?[0-9][0-9 .-]*")
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_users(q: str, limit: int = DEFAULT_LIMIT) -> list:
+    q = (q or "").strip()
+    if not q:
+        return []
+
+    # Exact email: unique (CITEXT) index lookup.
+    if _EMAIL_RE.fullmatch(q):
+        user = AppUser.objects.filter(email=q).first()
+        if user:
+            return [user]
+
+    # Phone numbers are typed from the start: anchored prefix scan.
+    if _PHONE_RE.fullmatch(q):
+        digits = re.sub(r"[ .-]", "", q)
+        users = list(AppUser.objects.raw(
+            """
+            SELECT * FROM app_user
+            WHERE phone LIKE %s
+            ORDER BY created_at DESC NULLS LAST, id DESC
+            LIMIT %s
+            """,
+            [_like_escape(digits) + "%", limit],
+        ))
+        if users or len(digits) < MIN_TRIGRAM_LENGTH:
+            return users
+
+    if len(q) < MIN_TRIGRAM_LENGTH:
+        pattern = _like_escape(q) + "%"
+        return list(AppUser.objects.raw(
+            """
+            SELECT * FROM app_user
+            WHERE full_name ILIKE %s OR email::text ILIKE %s
+            ORDER BY created_at DESC NULLS LAST, id DESC
+            LIMIT %s
+            """,
+            [pattern, pattern, limit],
+        ))
+
+    pattern = "%" + _like_escape(q) + "%"
+    return list(AppUser.objects.raw(
+        """
+        SELECT * FROM app_user
+        WHERE full_name ILIKE %s OR email::text ILIKE %s OR phone ILIKE %s
+        ORDER BY GREATEST(
+                     similarity(COALESCE(full_name, ''), %s),
+                     similarity(COALESCE(email::text, ''), %s),
+                     similarity(COALESCE(phone, ''), %s)
+                 ) DESC,
+                 created_at DESC NULLS LAST
+        LIMIT %s
+        """,
+        [pattern, pattern, pattern, q, q, q, limit],
+    ))
+
+
+def search_codes(voucher_type_id, q: str, *, status: str = "", limit: int = DEFAULT_LIMIT) -> list:
+    q = (q or "").strip()
+    if not q:
+        return []
+
+    base = QRClaim.objects.filter(voucher_type_id=voucher_type_id).select_related("used_by_user")
+    if status:
+        base = base.filter(status=status)
+
+    # Exact code (scanned or pasted): unique index lookup. Generated codes are upper-case.
+    exact = list(base.filter(code__in={q, q.upper()}))
+    if exact:
+        return exact
+
+    # Anchored prefix: text_pattern_ops btree range scan.
+    prefix = list(base.filter(code__startswith=q).order_by("code")[:limit])
+    if not prefix and q.upper() != q:
+        prefix = list(base.filter(code__startswith=q.upper()).order_by("code")[:limit])
+    if prefix or len(q) < MIN_TRIGRAM_LENGTH:
+        return prefix
+
+    params = [str(voucher_type_id), "%" + _like_escape(q) + "%"]
+    status_sql = ""
+    if status:
+        status_sql = "AND qc.status = %s"
+        params.append(status)
+    params.extend([q, limit])
+    ids = [
+        row.id
+        for row in QRClaim.objects.raw(
+            f"""
+            SELECT qc.id FROM qr_claim qc
+            WHERE qc.voucher_type_id = %s AND qc.code ILIKE %s {status_sql}
+            ORDER BY similarity(qc.code, %s) DESC, qc.created_at DESC NULLS LAST
+            LIMIT %s
+            """,
+            params,
+        )
+    ]
+    by_id = base.in_bulk(ids)
+    return [by_id[i] for i in ids if i in by_id]
@@ -3,7 +3,7 @@ import uuid
 from typing import Optional
 
 from django.conf import settings
-from django.db import connection, transaction
+from django.db import IntegrityError, connection, transaction
 from django.utils import timezone
 
 from .models import (
@@ -18,6 +18,7 @@ from .models import (
 )
 from .adapters.wallet_provider import WalletProviderAdapter
 from .adapters.erc1155_client import ERC1155Client
+from . import claim_codes, counters, wallet_pool
 
 
 def _ip_hash(ip: str) -> Optional[str]:
@@ -98,7 +99,7 @@ def get_or_create_user(full_name: str, email: Optional[str], phone: Optional[str
 
     new_id = uuid.uuid4()
     now = timezone.now()
-    with connection.cursor() as cur:
+    with transaction.atomic(), connection.cursor() as cur:
         cur.execute(
             """
             INSERT INTO app_user (id, email, phone, full_name, is_active, created_at, updated_at)
@@ -106,6 +107,7 @@ def get_or_create_user(full_name: str, email: Optional[str], phone: Optional[str
             """,
             [str(new_id), email, phone, full_name],
         )
+        counters.bump("app_user", daily=True)
     return AppUser.objects.get(id=new_id)
 
 
@@ -114,30 +116,68 @@ def get_or_create_wallet(user: AppUser, chain_id: int) -> Wallet:
     if wallet:
         return wallet
 
-    adapter = WalletProviderAdapter(settings.ST_PROVIDER, chain_id)
-    meta = adapter.create_wallet(user_external_id=str(user.id))
+    # Pre-generated key: one statement instead of keygen + encrypt + fsync on the login path
+    # (HD wallets are derived without I/O, so the pool only serves keystore mode.)
+    if getattr(settings, "ST_WALLET_POOL", True) and getattr(settings, "ST_WALLET_MODE", "keystore") != "hd":
+        wallet = _take_pooled_wallet(user, chain_id)
+        if wallet:
+            return wallet
 
-    new_id = uuid.uuid4()
-    with connection.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO wallet (id, user_id, provider, provider_ref, chain_id, address, exportable, export_status, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
-            """,
-            [
-                str(new_id),
-                str(user.id),
-                settings.ST_PROVIDER,
-                meta["provider_ref"],
-                chain_id,
-                meta["address_bytes"],
-                meta["exportable"],
-                "not_allowed",
-            ],
-        )
+    try:
+        with transaction.atomic():
+            # A concurrent first login of this user waits here, then finds its wallet on the re-check.
+            wallet_pool.lock_user(user.id, chain_id)
+            wallet = Wallet.objects.filter(user=user, chain_id=chain_id).first()
+            if wallet:
+                return wallet
+
+            adapter = WalletProviderAdapter(settings.ST_PROVIDER, chain_id)
+            meta = adapter.create_wallet(user_external_id=str(user.id))
+
+            new_id = uuid.uuid4()
+            with connection.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO wallet (id, user_id, provider, provider_ref, chain_id, address, exportable, export_status, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                    """,
+                    [
+                        str(new_id),
+                        str(user.id),
+                        settings.ST_PROVIDER,
+                        meta["provider_ref"],
+                        chain_id,
+                        meta["address_bytes"],
+                        meta["exportable"],
+                        "not_allowed",
+                    ],
+                )
+            counters.bump("wallet")
+    except IntegrityError:
+        # A pooled take() for this user committed between our re-check and the INSERT.
+        wallet = Wallet.objects.filter(user=user, chain_id=chain_id).first()
+        if wallet:
+            return wallet
+        raise
     return Wallet.objects.get(id=new_id)
 
 
+def _take_pooled_wallet(user: AppUser, chain_id: int) -> Optional[Wallet]:
+    try:
+        if connection.in_atomic_block:
+            # Savepoint so a lost race does not abort the caller's transaction.
+            with transaction.atomic():
+                return wallet_pool.take(user, chain_id)
+        # Autocommit: the statement is its own transaction, no BEGIN/COMMIT round trips.
+        return wallet_pool.take(user, chain_id)
+    except IntegrityError:
+        # A concurrent first login of this user committed its wallet first.
+        wallet = Wallet.objects.filter(user=user, chain_id=chain_id).first()
+        if wallet:
+            return wallet
+        raise
+
+
 def get_or_create_external_wallet(user: AppUser, chain_id: int, address_hex: str) -> Wallet:
     normalized = _normalize_evm_address(address_hex)
     address_bytes = bytes.fromhex(normalized)
@@ -150,7 +190,7 @@ def get_or_create_external_wallet(user: AppUser, chain_id: int, address_hex: str
     # Create new external wallet for this address
     provider_ref = f"external:{normalized}"[:128]
     new_id = uuid.uuid4()
-    with connection.cursor() as cur:
+    with transaction.atomic(), connection.cursor() as cur:
         cur.execute(
             """
             INSERT INTO wallet (id, user_id, provider, provider_ref, chain_id, address, exportable, export_status, created_at)
@@ -158,6 +198,7 @@ def get_or_create_external_wallet(user: AppUser, chain_id: int, address_hex: str
             """,
             [str(new_id), str(user.id), "external", provider_ref, chain_id, address_bytes],
         )
+        counters.bump("wallet")
     return Wallet.objects.get(id=new_id)
 
 
@@ -192,6 +233,7 @@ def issue_voucher(user: AppUser, voucher: VoucherType, amount: int = 1) -> Walle
                 """,
                 [amount, str(wallet.id), str(voucher.id)],
             )
+        counters.bump("voucher_balance", amount)
         # Note: QRClaim record is created in views_claim.py instead of transfer log
     return wallet
 
@@ -230,6 +272,7 @@ def debit_voucher(
             """,
             [amount, str(wallet.id), str(voucher.id)],
         )
+        counters.bump("voucher_balance", -amount)
 
         transfer_id = uuid.uuid4()
         # Note: Transfer logging removed - using QRClaim for tracking instead
@@ -285,36 +328,8 @@ def transfer_voucher_ownership(
 
 def create_qr_claim_for_user(user: AppUser, voucher_type: VoucherType) -> 'QRClaim':
     """Create a new QRClaim for a user and voucher type (same format as mint)"""
-    from .models import QRClaim
-    from django.utils import timezone
-    import hashlib
-    
-    # Generate unique code using same format as mint process
-    timestamp = int(timezone.now().timestamp())
-    hash_input = f"{user.id}_{timestamp}_{voucher_type.slug}"
-    hash_short = hashlib.md5(hash_input.encode()).hexdigest()[:8]
-    
-    # Format: slug_8char_hash (same as mint)
-    code = f"{voucher_type.slug}_{hash_short}"
-    
-    # Ensure code is unique
-    while QRClaim.objects.filter(code=code).exists():
-        timestamp = int(timezone.now().timestamp())
-        hash_input = f"{user.id}_{timestamp}_{voucher_type.slug}"
-        hash_short = hashlib.md5(hash_input.encode()).hexdigest()[:8]
-        code = f"{voucher_type.slug}_{hash_short}"
-    
-    # Create QRClaim with same fields as mint
-    qr_claim = QRClaim.objects.create(
-        code=code,
-        voucher_type=voucher_type,
-        used_by_user=user,
-        used_at=None,
-        status="new",
-        created_at=timezone.now()
-    )
-    
-    return qr_claim
+    # Format: slug_XXXXXXXXCCC (8 code + 3 check chars), unique by construction (see core.claim_codes)
+    return claim_codes.create_claim(voucher_type, used_by_user=user, used_at=None)
 
 
 def enqueue_onchain(kind: str, voucher: VoucherType, to_wallet: Wallet, amount: int = 1) -> OnchainTx:
@@ -458,12 +473,17 @@ def mint_erc1155_now(wallet: Wallet, voucher: VoucherType, amount: int = 1, *, w
 
 
 def finish_qr_claim(qr: QRClaim, user: AppUser):
-    with connection.cursor() as cur:
+    with transaction.atomic(), connection.cursor() as cur:
         cur.execute(
             """
-            UPDATE qr_claim
+            UPDATE qr_claim q
             SET status='claimed', used_by_user=%s, used_at=NOW()
-            WHERE id=%s
+            FROM (SELECT id, status FROM qr_claim WHERE id=%s FOR UPDATE) old
+            WHERE q.id = old.id
+            RETURNING q.voucher_type_id, old.status
             """,
             [str(user.id), str(qr.id)],
         )
+        row = cur.fetchone()
+        if row:
+            counters.code_status_changed(row[0], row[1], "claimed")
@@ -0,0 +1,39 @@
+-- Exact row counters maintained by the service-layer writers (core/counters.py).
+-- Seeded below on first apply; repair with: python manage.py rebuild_counters
+CREATE TABLE IF NOT EXISTS stat_counter (
+    key        TEXT PRIMARY KEY,
+    value      BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Seed each counter from its table the first time this runs, so a counter never
+-- starts at the first bump(). The SHARE lock waits for in-flight writers (whose
+-- bump() rows then count as "already seeded") and keeps the value exact; seeded
+-- keys are left alone. Keys as in counters.COUNTED_TABLES / SUMMED_COUNTERS /
+-- DAILY_TABLES; apply_sql runs this in settings.TIME_ZONE, so the day keys match
+-- timezone.localdate().
+DO $$
+DECLARE
+    c RECORD;
+BEGIN
+    FOR c IN SELECT * FROM (VALUES
+        ('app_user', 'app_user', 'COUNT(*)'),
+        ('wallet', 'wallet', 'COUNT(*)'),
+        ('voucher_type', 'voucher_type', 'COUNT(*)'),
+        ('voucher_balance', 'voucher_balance', 'COALESCE(SUM(balance), 0)'),
+        ('pos_redemption:reserved', 'pos_redemption', $q$COALESCE(SUM(amount) FILTER (WHERE status = 'reserved'), 0)$q$),
+        ('pos_redemption:committed', 'pos_redemption', $q$COALESCE(SUM(amount) FILTER (WHERE status = 'committed'), 0)$q$)
+    ) AS v (key, tbl, aggregate) LOOP
+        CONTINUE WHEN to_regclass(c.tbl) IS NULL;
+        EXECUTE format('LOCK TABLE %I IN SHARE MODE', c.tbl);
+        CONTINUE WHEN EXISTS (SELECT 1 FROM stat_counter WHERE key = c.key);
+        EXECUTE format('INSERT INTO stat_counter (key, value) SELECT %L, %s FROM %I', c.key, c.aggregate, c.tbl);
+        IF c.key = 'app_user' THEN
+            INSERT INTO stat_counter (key, value)
+            SELECT 'app_user:new:' || to_char(created_at, 'YYYY-MM-DD'), COUNT(*)
+            FROM app_user WHERE created_at IS NOT NULL
+            GROUP BY 1
+            ON CONFLICT DO NOTHING;
+        END IF;
+    END LOOP;
+END $$;
@@ -0,0 +1,10 @@
+-- Keyset indexes for the merged admin activity stream (core/activity.py).
+-- INCLUDE columns let each page be answered with index-only range scans.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_creq_created_id
+    ON claim_request (created_at DESC, id DESC) INCLUDE (email, phone, result);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_posr_reserved_id
+    ON pos_redemption (reserved_at DESC, id DESC) INCLUDE (voucher_type_id, status);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_otx_created_id
+    ON onchain_tx (created_at DESC, id DESC) INCLUDE (kind, status);
@@ -0,0 +1,37 @@
+-- Per-campaign QR claim code counters maintained by core/counters.py.
+-- Seeded below on first apply; repair with: python manage.py rebuild_counters
+CREATE TABLE IF NOT EXISTS voucher_code_stats (
+    voucher_type_id UUID PRIMARY KEY REFERENCES voucher_type(id) ON DELETE CASCADE,
+    total_codes     BIGINT NOT NULL DEFAULT 0,
+    new_codes       BIGINT NOT NULL DEFAULT 0,
+    used_codes      BIGINT NOT NULL DEFAULT 0,
+    expired_codes   BIGINT NOT NULL DEFAULT 0,
+    claimed_codes   BIGINT NOT NULL DEFAULT 0,
+    updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Seed campaigns that have no row yet (all of them on first apply) from qr_claim,
+-- under a SHARE lock so in-flight code writers finish first and the counts are exact.
+-- Campaigns without codes get a zero row, so later runs skip the lock.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM voucher_type vt
+        WHERE NOT EXISTS (SELECT 1 FROM voucher_code_stats s WHERE s.voucher_type_id = vt.id)
+    ) THEN
+        LOCK TABLE qr_claim IN SHARE MODE;
+        INSERT INTO voucher_code_stats
+            (voucher_type_id, total_codes, new_codes, used_codes, expired_codes, claimed_codes)
+        SELECT vt.id,
+               COUNT(qc.id),
+               COUNT(qc.id) FILTER (WHERE qc.status = 'new'),
+               COUNT(qc.id) FILTER (WHERE qc.status = 'used'),
+               COUNT(qc.id) FILTER (WHERE qc.status = 'expired'),
+               COUNT(qc.id) FILTER (WHERE qc.status = 'claimed')
+        FROM voucher_type vt
+        LEFT JOIN qr_claim qc ON qc.voucher_type_id = vt.id
+        WHERE NOT EXISTS (SELECT 1 FROM voucher_code_stats s WHERE s.voucher_type_id = vt.id)
+        GROUP BY vt.id
+        ON CONFLICT (voucher_type_id) DO NOTHING;
+    END IF;
+END $$;
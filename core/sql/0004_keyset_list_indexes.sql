@@ -0,0 +1,10 @@
+-- Keyset pagination indexes for the admin list pages (core/paging.py).
+-- Orders match KeysetPaginator: timestamp DESC NULLS LAST, id DESC.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_created_id
+    ON app_user (created_at DESC NULLS LAST, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_qr_vtype_created_id
+    ON qr_claim (voucher_type_id, created_at DESC NULLS LAST, id DESC);
+
+-- admin_pos_redemptions_page filters reserved_at >= since (non-null) and uses
+-- idx_posr_reserved_id from 0002_activity_keyset_indexes.sql.
@@ -0,0 +1,22 @@
+-- Admin search indexes (core/search.py). pg_trgm serves ILIKE '%q%' on the
+-- GIN indexes; text_pattern_ops serves anchored LIKE 'q%' prefix scans.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_name_trgm
+    ON app_user USING gin (full_name gin_trgm_ops);
+
+-- email is CITEXT; the trigram opclass needs the text cast.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_email_trgm
+    ON app_user USING gin ((email::text) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_phone_trgm
+    ON app_user USING gin (phone gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_phone_prefix
+    ON app_user (phone text_pattern_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_qr_code_trgm
+    ON qr_claim USING gin (code gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_qr_code_prefix
+    ON qr_claim (code text_pattern_ops);
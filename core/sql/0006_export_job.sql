@@ -0,0 +1,21 @@
+-- Background export jobs run by: python manage.py run_export_jobs
+-- Files land in ST_EXPORT_DIR as <id>.<ext>; see core/export_jobs.py.
+CREATE TABLE IF NOT EXISTS export_job (
+    id           UUID PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    params       JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status       TEXT NOT NULL DEFAULT 'queued',
+    rows_done    BIGINT NOT NULL DEFAULT 0,
+    rows_total   BIGINT,
+    file_name    TEXT,
+    file_size    BIGINT,
+    error        TEXT,
+    requested_by TEXT,
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at   TIMESTAMPTZ,
+    updated_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at  TIMESTAMPTZ
+);
+
+-- Worker claim (oldest queued first) and stale-job sweeps.
+CREATE INDEX IF NOT EXISTS idx_export_job_status_created ON export_job (status, created_at);
@@ -0,0 +1,14 @@
+-- Incremental Parquet exports (python manage.py export_analytics, core/analytics_export.py).
+-- One row per dataset: the (ts, id) of the last row written.
+CREATE TABLE IF NOT EXISTS analytics_watermark (
+    dataset     TEXT PRIMARY KEY,
+    last_ts     TIMESTAMPTZ,
+    last_id     UUID,
+    rows_total  BIGINT NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- qr_claim has no global (created_at, id) index; claim_request and pos_redemption
+-- reuse the (ts DESC, id DESC) indexes from 0002_activity_keyset_indexes.sql.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_qr_created_id
+    ON qr_claim (created_at, id);
@@ -0,0 +1,5 @@
+-- Source numbers for new claim codes (core/claim_codes.py). Each nextval is
+-- permuted with a keyed Feistel network and base32-encoded, so codes are
+-- unique by construction without an existence query. CACHE hands each
+-- connection a block of values; gaps are harmless.
+CREATE SEQUENCE IF NOT EXISTS qr_claim_code_seq AS BIGINT MINVALUE 1 MAXVALUE 1099511627775 CACHE 100;
@@ -0,0 +1,3 @@
+-- The live-code filter (core/code_filter.py) treats last_value as "every code
+-- up to here has been handed out"; per-session CACHE blocks would break that.
+ALTER SEQUENCE qr_claim_code_seq CACHE 1;
@@ -0,0 +1,13 @@
+-- Pre-generated custodial wallets (core/wallet_pool.py). Keys are already in
+-- the keystore; get_or_create_wallet moves one row into wallet in a single
+-- statement. Refilled by: python manage.py refill_wallet_pool
+CREATE TABLE IF NOT EXISTS wallet_pool (
+    provider_ref TEXT PRIMARY KEY,
+    provider     TEXT NOT NULL,
+    chain_id     INTEGER NOT NULL,
+    address      BYTEA NOT NULL,
+    exportable   BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_wallet_pool_take ON wallet_pool (provider, chain_id, created_at);
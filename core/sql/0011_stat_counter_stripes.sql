@@ -0,0 +1,13 @@
+-- Striped counters (core/counters.py): each key is spread over several rows,
+-- one of which a writer updates at random, and readers SUM them. Moves the
+-- primary key from (key) to (key, stripe); existing values become stripe 0.
+ALTER TABLE stat_counter ADD COLUMN IF NOT EXISTS stripe SMALLINT NOT NULL DEFAULT 0;
+
+DO $$
+BEGIN
+    IF (SELECT array_length(conkey, 1) FROM pg_constraint
+        WHERE conrelid = 'stat_counter'::regclass AND contype = 'p') = 1 THEN
+        ALTER TABLE stat_counter DROP CONSTRAINT stat_counter_pkey;
+        ALTER TABLE stat_counter ADD CONSTRAINT stat_counter_pkey PRIMARY KEY (key, stripe);
+    END IF;
+END $$;
@@ -0,0 +1,7 @@
+-- Keyset indexes for the change-event analytics datasets (core/analytics_export.py):
+-- code_uses reads qr_claim by (used_at, id), redemption_commits pos_redemption by (committed_at, id).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_qr_used_id
+    ON qr_claim (used_at, id) WHERE used_at IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_posr_committed_id
+    ON pos_redemption (committed_at, id) WHERE committed_at IS NOT NULL;
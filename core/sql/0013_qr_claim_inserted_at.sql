@@ -0,0 +1,7 @@
+-- DB-clock insert time for the claim-code filter's incremental re-scan (core/code_filter.py).
+-- created_at is set by the application, so comparing it with a clock_timestamp() watermark
+-- misses rows from app servers whose clock lags the database. The column is not on the
+-- Django model: every insert takes the default (transaction start on the DB clock).
+ALTER TABLE qr_claim ADD COLUMN IF NOT EXISTS inserted_at timestamptz NOT NULL DEFAULT NOW();
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_qr_inserted_at ON qr_claim (inserted_at);
@@ -0,0 +1,7 @@
+-- One custodial wallet per (user, chain). wallet_pool.take() relies on this instead of an
+-- advisory lock: two concurrent first logins of the same user can both pass the NOT EXISTS
+-- guard under READ COMMITTED, and the second INSERT then fails here rather than giving the
+-- user two wallets. External wallets are transfer targets that may share a user and chain.
+-- If this fails on an existing database, resolve the duplicate rows it reports first.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_wallet_user_chain
+    ON wallet (user_id, chain_id) WHERE provider <> 'external';
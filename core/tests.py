@@ -1,3 +1,1430 @@
-from django.test import TestCase
+import datetime
+import io
+import itertools
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import activity, analytics_export, claim_codes, code_filter, counters, export_jobs, exports, paging, pos_utils, qr_batch, qr_cache, qr_sheets, qrcode_utils, search, services, timeseries, wallet_pool
+from .adapters import hd_wallet, keystore
+from .models import AppUser, ClaimRequest, ExportJob, Merchant, OnchainTx, POSRedemption, POSTerminal, QRClaim, StatCounter, VoucherBalance, VoucherCodeStats, VoucherType, Wallet
+
+
+class UnmanagedModelsTestCase(TestCase):
+    """The models are managed=False, so the test database has no tables for them; create the ones a test needs."""
+
+    models = ()
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.models:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.models):
+                editor.delete_model(model)
+
+    def login_staff(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create(username="staff", is_staff=True))
+
+
+class VoucherCodeExportTests(UnmanagedModelsTestCase):
+    models = (AppUser, VoucherType, QRClaim)
+
+    def setUp(self):
+        self.voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+
+    def _add_codes(self, n):
+        now = timezone.now()
+        for _ in range(n):
+            user = AppUser.objects.create(email=f"{uuid.uuid4().hex}@example.com", created_at=now)
+            QRClaim.objects.create(
+                code=uuid.uuid4().hex, voucher_type=self.voucher, status="used", used_by_user=user, used_at=now, created_at=now,
+            )
+
+    def _export(self):
+        with CaptureQueriesContext(connection) as ctx:
+            rows = list(exports.voucher_code_rows(self.voucher))
+        return rows, len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_used_codes(self):
+        self._add_codes(3)
+        rows, few = self._export()
+        self.assertEqual(len(rows), 3)
+        self._add_codes(30)
+        rows, many = self._export()
+        self.assertEqual(len(rows), 33)
+        self.assertEqual(few, many)
+        self.assertEqual(many, 1)
+
+    def test_rows_carry_the_user_email(self):
+        self._add_codes(1)
+        QRClaim.objects.create(code="UNUSED", voucher_type=self.voucher, status="new", created_at=timezone.now())
+        rows, _ = self._export()
+        emails = {row[0]: row[2] for row in rows}
+        self.assertEqual(emails["UNUSED"], "")
+        self.assertEqual(sum(1 for e in emails.values() if e.endswith("@example.com")), 1)
+
+
+class HDWalletTests(SimpleTestCase):
+    mnemonic = "abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.seed = hd_wallet.seed_from_mnemonic(cls.mnemonic, passphrase="")
+
+    def test_ref_is_deterministic_per_user_and_differs_per_chain(self):
+        ref = hd_wallet.ref_for_user("user-1", 8453)
+        self.assertEqual(hd_wallet.ref_for_user("user-1", 8453), ref)
+        self.assertEqual(len(ref), hd_wallet.HD_REF_LEN)
+        self.assertNotEqual(hd_wallet.ref_for_user("user-2", 8453), ref)
+        other_chain = hd_wallet.ref_for_user("user-1", 1)
+        self.assertNotEqual(other_chain, ref)
+        # Same user levels, different chain level.
+        self.assertEqual(other_chain[8:], ref[8:])
+        with self.assertRaises(ValueError):
+            hd_wallet.ref_for_user("user-1", 1 << 31)
+
+    def test_path_round_trips_and_rejects_unhardenable_indexes(self):
+        ref = hd_wallet.ref_for_user("user-1", 8453)
+        path = hd_wallet.path_for_ref(ref)
+        chain, a, b = (int(level.rstrip("'")) for level in path.split("/")[3:])
+        self.assertEqual(path, f"m/44'/60'/8453'/{a}'/{b}'")
+        self.assertEqual(f"{chain:08x}{a:08x}{b:08x}", ref)
+        self.assertEqual(hd_wallet.path_for_ref(f"{0:08x}{(1 << 31) - 1:08x}{0:08x}"), f"m/44'/60'/0'/{(1 << 31) - 1}'/0'")
+        for bad in (f"{1 << 31:08x}{0:08x}{0:08x}", f"{0:08x}{0:08x}{0xFFFFFFFF:08x}", "g" * 24, ref[:-1], None):
+            with self.assertRaises(ValueError):
+                hd_wallet.path_for_ref(bad)
+
+    def test_keystore_refs_are_never_hd_refs(self):
+        self.assertTrue(hd_wallet.is_hd_ref(hd_wallet.ref_for_user("user-1", 8453)))
+        for _ in range(100):
+            self.assertFalse(hd_wallet.is_hd_ref(uuid.uuid4().hex))
+        self.assertFalse(hd_wallet.is_hd_ref("0" * 32))
+        self.assertFalse(hd_wallet.is_hd_ref(None))
+
+    def test_account_re_derives_the_same_address(self):
+        keyring = hd_wallet.HDKeyring(self.seed)
+        ref, account = keyring.create("user-1", 8453)
+        self.assertIs(keyring.account(ref), account)
+        fresh = hd_wallet.HDKeyring(self.seed).account(ref)
+        self.assertEqual((fresh.address, fresh.key), (account.address, account.key))
+        # Cross-check the derivation against eth_account's own mnemonic path handling.
+        with mock.patch.object(hd_wallet.Account, "_use_unaudited_hdwallet_features", True):
+            expected = hd_wallet.Account.from_mnemonic(self.mnemonic, account_path=hd_wallet.path_for_ref(ref))
+        self.assertEqual(account.address, expected.address)
+        self.assertNotEqual(keyring.account(hd_wallet.ref_for_user("user-1", 1)).address, account.address)
+
+    def test_account_cache_is_bounded_lru(self):
+        keyring = hd_wallet.HDKeyring(self.seed, cache_size=2)
+        refs = [hd_wallet.ref_for_user(f"user-{i}", 1) for i in range(3)]
+        first = keyring.account(refs[0])
+        keyring.account(refs[1])
+        keyring.account(refs[0])  # most recently used again
+        keyring.account(refs[2])  # evicts refs[1]
+        self.assertEqual(list(keyring._cache), [refs[0], refs[2]])
+        self.assertIs(keyring.account(refs[0]), first)
+        with mock.patch.object(hd_wallet, "key_from_seed", wraps=hd_wallet.key_from_seed) as derive:
+            keyring.account(refs[1])
+        derive.assert_called_once()
+        self.assertEqual(len(keyring._cache), 2)
+
+
+class KeystoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = pathlib.Path(tmp.name)
+        self.legacy = keystore.JSONDirKeystore(self.root / "json")
+        self.store = keystore.SQLiteKeystore(self.root / "keystore.sqlite3", fallback=self.legacy)
+        self.refs = [uuid.uuid4().hex for _ in range(3)]
+
+    def test_sqlite_round_trip(self):
+        self.store.put(self.refs[0], b"record-0")
+        self.store.put_many([(self.refs[1], b"record-1"), (self.refs[2], b"record-2")])
+        self.assertEqual(self.store.get(self.refs[1]), b"record-1")
+        self.assertTrue(self.store.has(self.refs[0]))
+        self.assertEqual(list(self.store.refs()), sorted(self.refs))
+        self.assertEqual(self.store.count(), 3)
+        # A second connection (another process) sees the committed rows.
+        self.assertEqual(keystore.SQLiteKeystore(self.store.path).get(self.refs[2]), b"record-2")
+
+    def test_missing_records_fall_back_to_the_json_files(self):
+        self.legacy.put(self.refs[0], b"legacy")
+        self.assertEqual(self.store.get(self.refs[0]), b"legacy")
+        self.assertFalse(self.store.has(self.refs[0]))
+        with self.assertRaises(FileNotFoundError):
+            self.store.get(self.refs[1])
+        with self.assertRaises(FileNotFoundError):
+            keystore.SQLiteKeystore(self.root / "other.sqlite3").get(self.refs[0])
+
+    def test_put_rejects_duplicate_and_malformed_refs(self):
+        self.store.put(self.refs[0], b"first")
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.store.put(self.refs[0], b"second")
+        self.assertEqual(self.store.get(self.refs[0]), b"first")
+        for ref in ("../etc/passwd", "abc", None):
+            with self.assertRaises(ValueError):
+                self.store.put(ref, b"x")
+
+    def test_put_many_is_all_or_nothing(self):
+        with self.assertRaises(ValueError):
+            self.store.put_many([(self.refs[0], b"ok"), ("not-a-ref", b"bad")])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.store.put_many([(self.refs[1], b"ok"), (self.refs[1], b"dup")])
+        self.assertEqual(self.store.count(), 0)
+        self.store.put(self.refs[2], b"still usable")
+        self.assertEqual(self.store.count(), 1)
+
+    def test_backend_is_chosen_by_settings(self):
+        for backend, cls in (("sqlite", keystore.SQLiteKeystore), ("json", keystore.JSONDirKeystore)):
+            with mock.patch.object(keystore, "_keystore", None), override_settings(
+                ST_WALLET_KEYSTORE=backend, ST_WALLET_STORE_DIR=self.root, ST_WALLET_KEYSTORE_PATH=self.root / "k.sqlite3",
+            ):
+                self.assertIsInstance(keystore.get_keystore(), cls)
+        with mock.patch.object(keystore, "_keystore", None), override_settings(ST_WALLET_KEYSTORE="redis"):
+            with self.assertRaises(ImproperlyConfigured):
+                keystore.get_keystore()
+
+
+class MigrateWalletStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = pathlib.Path(tmp.name)
+        self.legacy = keystore.JSONDirKeystore(root / "json")
+        self.store = keystore.SQLiteKeystore(root / "keystore.sqlite3", fallback=self.legacy)
+        self.enterContext(mock.patch.object(keystore, "_keystore", self.store))
+        self.records = {uuid.uuid4().hex: f"record-{i}".encode() for i in range(3)}
+        for ref, blob in self.records.items():
+            self.legacy.put(ref, blob)
+
+    def _migrate(self, *args):
+        out = io.StringIO()
+        call_command("migrate_wallet_store", *args, stdout=out)
+        return out.getvalue()
+
+    def test_copy_verify_then_delete(self):
+        self.assertIn("copied 3, already present 0, JSON files removed 0", self._migrate())
+        self.assertEqual(sorted(self.legacy.refs()), sorted(self.records))
+        self.assertIn("copied 0, already present 3, JSON files removed 3", self._migrate("--delete", "--compact"))
+        self.assertEqual(list(self.legacy.refs()), [])
+        self.assertEqual({ref: self.store.get(ref) for ref in self.store.refs()}, self.records)
+
+    def test_differing_record_aborts_and_keeps_the_json_file(self):
+        ref = sorted(self.records)[0]
+        self.store.put(ref, b"something else")
+        with self.assertRaisesMessage(CommandError, "record differs"):
+            self._migrate("--delete")
+        self.assertIn(ref, set(self.legacy.refs()))
+        self.assertEqual(self.store.get(ref), b"something else")
+
+    def test_refuses_to_run_on_the_json_backend(self):
+        with mock.patch.object(keystore, "_keystore", self.legacy):
+            with self.assertRaises(CommandError):
+                self._migrate()
+
+
+@override_settings(ST_PROVIDER="privy", ST_WALLET_MODE="keystore", ST_WALLET_POOL=True)
+class WalletPoolTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, StatCounter)
+    chain_id = 8453
+
+    def setUp(self):
+        call_command("apply_sql", "0010", stdout=io.StringIO())
+        self.user = AppUser.objects.create(email="guest@example.com", created_at=timezone.now())
+
+    def _fake_wallets(self, n):
+        return [
+            {"provider_ref": uuid.uuid4().hex, "address_bytes": os.urandom(20), "exportable": False}
+            for _ in range(n)
+        ]
+
+    def _fill(self, n):
+        with mock.patch.object(wallet_pool.WalletProviderAdapter, "create_wallets", side_effect=self._fake_wallets):
+            return wallet_pool.refill(self.chain_id, wallet_pool.size("privy", self.chain_id) + n)
+
+    def test_take_from_an_empty_pool_returns_none(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIsNone(wallet_pool.take(self.user, self.chain_id))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertFalse(Wallet.objects.exists())
+        self.assertEqual(counters.get_total("wallet"), 0)
+
+    def test_take_moves_the_oldest_row_and_bumps_the_counter(self):
+        self._fill(2)
+        with connection.cursor() as cur:
+            cur.execute("SELECT provider_ref, address FROM wallet_pool ORDER BY created_at, provider_ref LIMIT 1")
+            oldest_ref, address = cur.fetchone()
+            cur.execute("UPDATE wallet_pool SET created_at = created_at + interval '1 minute' WHERE provider_ref <> %s", [oldest_ref])
+        with CaptureQueriesContext(connection) as ctx:
+            wallet = wallet_pool.take(self.user, self.chain_id)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual((wallet.provider_ref, wallet.address), (oldest_ref, bytes(address)))
+        stored = Wallet.objects.get(user=self.user, chain_id=self.chain_id)
+        self.assertEqual((stored.id, stored.provider, stored.export_status), (wallet.id, "privy", "not_allowed"))
+        self.assertEqual(wallet_pool.size("privy", self.chain_id), 1)
+        self.assertEqual(counters.get_total("wallet"), 1)
+
+    def test_take_leaves_the_pool_alone_when_the_user_has_a_wallet(self):
+        self._fill(1)
+        Wallet.objects.create(user=self.user, provider="privy", provider_ref="own", chain_id=self.chain_id, address=os.urandom(20))
+        self.assertIsNone(wallet_pool.take(self.user, self.chain_id))
+        self.assertEqual(wallet_pool.size("privy", self.chain_id), 1)
+        self.assertEqual(Wallet.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(counters.get_total("wallet"), 0)
+
+    def test_one_custodial_wallet_per_user_and_chain(self):
+        Wallet.objects.create(user=self.user, provider="privy", provider_ref="a", chain_id=self.chain_id, address=os.urandom(20))
+        # External transfer targets may share the user's chain.
+        Wallet.objects.create(user=self.user, provider="external", provider_ref="b", chain_id=self.chain_id, address=os.urandom(20))
+        Wallet.objects.create(user=self.user, provider="privy", provider_ref="c", chain_id=1, address=os.urandom(20))
+        with self.assertRaises(IntegrityError):
+            Wallet.objects.create(user=self.user, provider="privy", provider_ref="d", chain_id=self.chain_id, address=os.urandom(20))
+
+    def test_get_or_create_wallet_uses_the_pool(self):
+        self._fill(1)
+        with mock.patch.object(services.WalletProviderAdapter, "create_wallet") as create_wallet:
+            wallet = services.get_or_create_wallet(self.user, self.chain_id)
+            self.assertEqual(services.get_or_create_wallet(self.user, self.chain_id).id, wallet.id)
+        create_wallet.assert_not_called()
+        self.assertEqual(wallet_pool.size("privy", self.chain_id), 0)
+
+    def test_refill_tops_up_to_the_target(self):
+        self._fill(3)
+        with mock.patch.object(wallet_pool.WalletProviderAdapter, "create_wallets", side_effect=self._fake_wallets) as create:
+            self.assertEqual(wallet_pool.refill(self.chain_id, 8, batch=2), 5)
+            self.assertEqual([c.args[0] for c in create.call_args_list], [2, 2, 1])
+            self.assertEqual(wallet_pool.refill(self.chain_id, 8), 0)
+        self.assertEqual(wallet_pool.size("privy", self.chain_id), 8)
+
+    def test_command_refills_only_below_the_low_watermark(self):
+        self._fill(3)
+        with mock.patch.object(wallet_pool.WalletProviderAdapter, "create_wallets", side_effect=self._fake_wallets):
+            out = io.StringIO()
+            call_command("refill_wallet_pool", chain_id=self.chain_id, target=6, low=3, stdout=out)
+            self.assertIn("nothing to do", out.getvalue())
+            self.assertEqual(wallet_pool.size("privy", self.chain_id), 3)
+            with connection.cursor() as cur:
+                cur.execute("DELETE FROM wallet_pool WHERE provider_ref IN (SELECT provider_ref FROM wallet_pool LIMIT 1)")
+            call_command("refill_wallet_pool", chain_id=self.chain_id, target=6, low=3, stdout=io.StringIO())
+        self.assertEqual(wallet_pool.size("privy", self.chain_id), 6)
+
+
+class ClaimCodePermutationTests(SimpleTestCase):
+    def test_unpermute_inverts_permute(self):
+        for n in (0, 1, 2, 1_000_000, (1 << 40) - 1):
+            p = claim_codes.permute(n)
+            self.assertLess(p, 1 << 40)
+            self.assertEqual(claim_codes.unpermute(p), n)
+
+    def test_permute_is_injective_on_consecutive_values(self):
+        values = [claim_codes.permute(n) for n in range(5000)]
+        self.assertEqual(len(set(values)), len(values))
+
+    def test_codes_encode_their_sequence_value(self):
+        codes = claim_codes.encode_codes([1, 2, 12345], prefix="SPA")
+        self.assertEqual([claim_codes.sequence_value(c) for c in codes], [1, 2, 12345])
+        self.assertTrue(all(c.startswith("SPA_") for c in codes))
+
+
+class ClaimCodeCheckCharsTests(SimpleTestCase):
+    def setUp(self):
+        self.code = claim_codes.encode_codes([42], prefix="SPA")[0]
+
+    def test_generated_code_verifies(self):
+        body, check = self.code[:-claim_codes.CHECK_CHARS], self.code[-claim_codes.CHECK_CHARS:]
+        self.assertEqual(len(check), claim_codes.CHECK_CHARS)
+        self.assertEqual(claim_codes.check_chars(body), check)
+        self.assertTrue(claim_codes.verify(self.code))
+
+    def test_single_character_changes_fail(self):
+        for i in range(len("SPA_"), len(self.code)):
+            for ch in "A7":
+                if self.code[i] != ch:
+                    self.assertFalse(claim_codes.verify(self.code[:i] + ch + self.code[i + 1:]))
+
+    def test_malformed_codes_fail(self):
+        for code in ("", "SPA_", self.code.lower(), self.code[:-1], self.code + "A", None, "x" * 200):
+            self.assertFalse(claim_codes.verify(code))
+
+    @override_settings(ST_CLAIM_CODE_ACCEPT_LEGACY=False)
+    def test_legacy_codes_rejected_without_legacy_mode(self):
+        self.assertTrue(claim_codes.is_acceptable(self.code))
+        self.assertFalse(claim_codes.is_acceptable("spa_a1b2c3d4"))
+
+    @override_settings(ST_CLAIM_CODE_ACCEPT_LEGACY=True)
+    def test_legacy_codes_looked_up_in_legacy_mode(self):
+        self.assertTrue(claim_codes.is_acceptable("spa_a1b2c3d4"))
+        self.assertFalse(claim_codes.is_acceptable("../etc/passwd"))
+
+
+class ClaimCodePrefixTests(SimpleTestCase):
+    def test_prefix_validation(self):
+        for prefix in ("", "SPA", "SPA-30OFF", "A" * 16):
+            self.assertEqual(claim_codes.clean_prefix(prefix), prefix)
+        for prefix in ("spa", "SPA_30", "A" * 17, "SPA 30", None, 7):
+            with self.assertRaises(ValueError, msg=repr(prefix)):
+                claim_codes.clean_prefix(prefix)
+
+    def test_default_prefix_fits_the_pattern(self):
+        self.assertEqual(claim_codes.default_prefix("spa-30off"), "SPA-30OFF")
+        self.assertEqual(claim_codes.default_prefix("spa_summer_special_2025"), "SPA-SUMMER-SPECI")
+        code = claim_codes.encode_codes([1], prefix=claim_codes.default_prefix("spa_x"))[0]
+        self.assertTrue(code.startswith("SPA-X_"))
+        self.assertTrue(claim_codes.verify(code))
+
+
+class BulkCodeGenerationTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, QRClaim, VoucherCodeStats)
+
+    def setUp(self):
+        call_command("apply_sql", "0008", stdout=io.StringIO())
+        self.voucher = VoucherType.objects.create(slug="spa_30off", name="Spa", erc1155_contract="0x0", token_id=1)
+        self.url = "/adv1/admin/vouchers/spa_30off/generate-codes"
+        self.login_staff()
+
+    def _post(self, **body):
+        return self.client.post(self.url, json.dumps(body), content_type="application/json")
+
+    def test_endpoint_creates_counted_codes_with_the_default_prefix(self):
+        response = self._post(count=25)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.json()["codes"]), 10)
+        codes = list(QRClaim.objects.values_list("code", flat=True))
+        self.assertEqual(len(set(codes)), 25)
+        self.assertTrue(all(c.startswith("SPA-30OFF_") and claim_codes.verify(c) for c in codes))
+        self.assertEqual(counters.get_code_stats([self.voucher.id])[str(self.voucher.id)]["new_codes"], 25)
+
+    def test_endpoint_rejects_bad_prefix_and_count(self):
+        for body in ({"count": 1, "prefix": "spa"}, {"count": 1, "prefix": "SPA_1"}, {"count": 1, "prefix": "X" * 17},
+                     {"count": 0}, {"count": claim_codes.HTTP_MAX_CODES + 1}):
+            self.assertEqual(self._post(**body).status_code, 400, body)
+        self.assertEqual(self._post(count=1, prefix="").status_code, 200)
+        self.assertFalse(QRClaim.objects.exclude(code__regex=r"^[A-Z2-7]{11}$").exists())
+
+    def test_clashes_with_old_codes_are_topped_up_in_later_passes(self):
+        QRClaim.objects.create(code="OLD1", voucher_type=self.voucher, created_at=timezone.now())
+        batches = iter([["OLD1", "N1", "N2"], ["N3"]])
+        chunks = list(claim_codes.iter_create_codes(self.voucher.id, 3, make_codes=lambda n: next(batches)))
+        self.assertEqual(chunks, [["N1", "N2"], ["N3"]])
+        self.assertEqual(QRClaim.objects.count(), 4)
+
+    def test_create_claim_uses_the_same_default_prefix(self):
+        claim = claim_codes.create_claim(self.voucher)
+        self.assertTrue(claim.code.startswith("SPA-30OFF_"))
+        with self.assertRaises(ValueError):
+            claim_codes.create_claim(self.voucher, prefix="spa")
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_added_items_are_members(self):
+        bloom = code_filter.BloomFilter(1000)
+        codes = [f"SPA_{i:08d}" for i in range(1000)]
+        for code in codes:
+            bloom.add(code)
+        self.assertTrue(all(code in bloom for code in codes))
+
+    def test_false_positive_rate_near_target(self):
+        bloom = code_filter.BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"in-{i}")
+        hits = sum(f"out-{i}" in bloom for i in range(10_000))
+        self.assertLess(hits, 300)
+        self.assertLess(bloom.false_positive_rate(), 0.03)
+
+    def test_duplicates_are_not_counted(self):
+        bloom = code_filter.BloomFilter(100)
+        self.assertTrue(bloom.add("SPA_A"))
+        self.assertFalse(bloom.add("SPA_A"))
+        bloom.add("SPA_B")
+        self.assertEqual(bloom.count, 2)
+
+
+class KeysetCursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        ts = datetime.datetime(2025, 3, 1, 12, 30, 5, 123456, tzinfo=datetime.timezone.utc)
+        row_id = uuid.uuid4()
+        cursor = paging.encode_cursor(ts, row_id)
+        self.assertNotIn("=", cursor)
+        self.assertEqual(paging.decode_cursor(cursor), (ts, row_id))
+
+    def test_round_trip_without_timestamp(self):
+        row_id = uuid.uuid4()
+        self.assertEqual(paging.decode_cursor(paging.encode_cursor(None, row_id)), (None, row_id))
+
+    def test_malformed_cursors_raise_value_error(self):
+        valid = paging.encode_cursor(None, uuid.uuid4())
+        for cursor in ("", "!!!", valid[:-4], paging.encode_cursor(None, "not-a-uuid")):
+            with self.assertRaises(ValueError):
+                paging.decode_cursor(cursor)
+
+
+class KeysetPageSingleTests(SimpleTestCase):
+    def test_extra_row_marks_the_page_truncated(self):
+        page = paging.KeysetPage.single(range(51), limit=50)
+        self.assertEqual(len(page), 50)
+        self.assertTrue(page.truncated)
+        self.assertIsNone(page.total)
+
+    def test_short_result_is_complete(self):
+        page = paging.KeysetPage.single(range(50), limit=50)
+        self.assertFalse(page.truncated)
+        self.assertEqual(page.total, 50)
+        self.assertFalse(paging.KeysetPage.single(range(3)).truncated)
+
+
+class ByteRangeTests(SimpleTestCase):
+    def test_satisfiable_ranges(self):
+        cases = {
+            "bytes=0-99": (0, 99),
+            "bytes=100-": (100, 999),
+            "bytes=-100": (900, 999),
+            "bytes=900-5000": (900, 999),
+            "bytes=-5000": (0, 999),
+            " bytes=0-0 ": (0, 0),
+        }
+        for header, expected in cases.items():
+            self.assertEqual(exports._parse_range(header, 1000), expected, header)
+
+    def test_unsatisfiable_ranges_give_416(self):
+        for header in ("bytes=1000-", "bytes=1000-1001", "bytes=50-10"):
+            self.assertIs(exports._parse_range(header, 1000), False, header)
+
+    def test_ignored_ranges_send_the_whole_file(self):
+        for header in ("", "bytes=-", "bytes=0-1,5-9", "items=0-9", "bytes=a-b"):
+            self.assertIsNone(exports._parse_range(header, 1000), header)
+
+    def test_file_response_statuses(self):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(bytes(range(100)))
+        factory = RequestFactory()
+
+        def fetch(**headers):
+            return exports.file_response(factory.get("/", headers=headers), path, "x.bin", "application/octet-stream", '"v1"')
+
+        partial = fetch(Range="bytes=10-19")
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(b"".join(partial.streaming_content), bytes(range(10, 20)))
+
+        unsatisfiable = fetch(Range="bytes=100-")
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable["Content-Range"], "bytes */100")
+
+        stale = fetch(Range="bytes=10-19", If_Range='"v0"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(len(b"".join(stale.streaming_content)), 100)
+
+
+class QREncoderTests(SimpleTestCase):
+    def setUp(self):
+        self.matrix = qrcode_utils.qr_matrix("https://example.com/claim/SPA_ABCDEFGHJKL/", border=4)
+
+    def _png_pixels(self, png):
+        self.assertEqual(png[:8], b"\x89PNG\r\n\x1a\n")
+        chunks, pos = {}, 8
+        while pos < len(png):
+            length = int.from_bytes(png[pos:pos + 4], "big")
+            kind, body = png[pos + 4:pos + 8], png[pos + 8:pos + 8 + length]
+            self.assertEqual(int.from_bytes(png[pos + 8 + length:pos + 12 + length], "big"), zlib.crc32(kind + body))
+            chunks[kind] = body
+            pos += 12 + length
+        ihdr = chunks[b"IHDR"]
+        width, height = int.from_bytes(ihdr[:4], "big"), int.from_bytes(ihdr[4:8], "big")
+        self.assertEqual((ihdr[8], ihdr[9]), (1, 0))  # 1-bit grayscale
+        raw = zlib.decompress(chunks[b"IDAT"])
+        stride = 1 + (width + 7) // 8
+        rows = []
+        for y in range(height):
+            line = raw[y * stride:(y + 1) * stride]
+            self.assertEqual(line[0], 0)  # filter type None
+            bits = "".join(f"{b:08b}" for b in line[1:])[:width]
+            rows.append([bit == "0" for bit in bits])  # 0 = black
+        return width, height, rows
+
+    def test_png_pixels_match_the_matrix(self):
+        box = 3
+        width, height, rows = self._png_pixels(qrcode_utils.matrix_to_png(self.matrix, box))
+        n = len(self.matrix)
+        self.assertEqual((width, height), (n * box, n * box))
+        for y in range(height):
+            for x in range(width):
+                self.assertEqual(rows[y][x], self.matrix[y // box][x // box])
+
+    def test_svg_paths_cover_the_dark_modules(self):
+        svg = ET.fromstring(qrcode_utils.matrix_to_svg(self.matrix, 6))
+        n = len(self.matrix)
+        self.assertEqual(svg.get("viewBox"), f"0 0 {n} {n}")
+        self.assertEqual(svg.get("width"), str(n * 6))
+        path = svg.find("{http://www.w3.org/2000/svg}path").get("d")
+        dark = set()
+        for run in path.split("z")[:-1]:
+            start, rest = run[1:].split(" ")
+            y, length = int(rest.split("h")[0]), int(rest.split("h")[1].split("v")[0])
+            dark.update((int(start) + i, y) for i in range(length))
+        expected = {(x, y) for y, row in enumerate(self.matrix) for x, cell in enumerate(row) if cell}
+        self.assertEqual(dark, expected)
+
+    def test_profiles_and_formats(self):
+        screen = qrcode_utils.render_qr("hello", "png", "screen")
+        printed = qrcode_utils.render_qr("hello", "png", "print")
+        self.assertGreater(int.from_bytes(printed[16:20], "big"), int.from_bytes(screen[16:20], "big"))
+        self.assertTrue(qrcode_utils.render_qr("hello", "svg").startswith(b"<svg"))
+        with self.assertRaises(ValueError):
+            qrcode_utils.render_qr("hello", "gif")
+        with self.assertRaises(ValueError):
+            qrcode_utils.render_qr("hello", "png", "poster")
+
+    def test_cached_names(self):
+        name = qrcode_utils.cached_name("wallet_0xabc", "svg", "print")
+        self.assertEqual(name, "wallet_0xabc-print.svg")
+        self.assertTrue(qrcode_utils.is_cached_name(name))
+        self.assertFalse(qrcode_utils.is_cached_name("wallet_0xabc.png"))
+
+
+class QRSingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def test_concurrent_misses_render_once(self):
+        store = qr_cache.QRCacheStore(self.root)
+        calls = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.2)
+            return b"png"
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            paths = list(pool.map(lambda _: store.get_or_create("k-screen.png", render), range(8)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({str(p) for p in paths}, {str(store.path_for("k-screen.png"))})
+        self.assertEqual(store.stats()["renders"], 1)
+
+    def test_waiter_renders_itself_when_the_leader_fails(self):
+        store = qr_cache.QRCacheStore(self.root)
+        leader_started, release = threading.Event(), threading.Event()
+
+        def failing_render():
+            leader_started.set()
+            release.wait(5)
+            raise RuntimeError("render failed")
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(store.get_or_create, "k-screen.png", failing_render)
+            leader_started.wait(5)
+            follower = pool.submit(store.get_or_create, "k-screen.png", lambda: b"png")
+            time.sleep(0.05)
+            release.set()
+            with self.assertRaises(RuntimeError):
+                leader.result()
+            self.assertEqual(follower.result().read_bytes(), b"png")
+
+    @skipIf(qr_cache.fcntl is None, "no flock on this platform")
+    def test_another_process_holding_the_file_lock_is_waited_for(self):
+        # Two stores on one root stand in for two worker processes.
+        first, second = qr_cache.QRCacheStore(self.root), qr_cache.QRCacheStore(self.root)
+        renders = []
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with first._file_lock("k-screen.png"):
+                waiting = pool.submit(second.get_or_create, "k-screen.png", lambda: renders.append(1) or b"late")
+                time.sleep(0.1)
+                self.assertFalse(waiting.done())
+                first.put("k-screen.png", b"png")
+            self.assertEqual(waiting.result().read_bytes(), b"png")
+        self.assertEqual(renders, [])
+
+
+@override_settings(ST_QR_CACHE_MAX_AGE=600)
+class QRConditionalGetTests(SimpleTestCase):
+    url = "/qr/wallet/0x" + "ab" * 20 + ".png"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(mock.patch.object(qr_cache, "_store", qr_cache.QRCacheStore(tmp.name)))
+
+    def test_first_response_carries_etag_and_revalidating_cache_control(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["ETag"], qrcode_utils.qr_etag("wallet:0x" + "ab" * 20, "png"))
+        cache_control = {d.strip() for d in response["Cache-Control"].split(",")}
+        self.assertEqual(cache_control, {"public", "max-age=600"})
+        self.assertIn("Accept", response["Vary"])
+
+    def test_matching_if_none_match_is_304_without_touching_the_cache(self):
+        etag = self.client.get(self.url)["ETag"]
+        with mock.patch("core.views_qr.cached_qr_path") as cached:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        cached.assert_not_called()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_etag_changes_with_format_profile_and_render_version(self):
+        data = "wallet:0x" + "ab" * 20
+        tags = {qrcode_utils.qr_etag(data, "png"), qrcode_utils.qr_etag(data, "svg"), qrcode_utils.qr_etag(data, "png", "print")}
+        self.assertEqual(len(tags), 3)
+        with mock.patch.object(qrcode_utils, "QR_RENDER_VERSION", qrcode_utils.QR_RENDER_VERSION + "-next"):
+            self.assertNotIn(qrcode_utils.qr_etag(data, "png"), tags)
+        svg = self.client.get(self.url, {"format": "svg"})
+        self.assertEqual(svg["Content-Type"], "image/svg+xml")
+        self.assertNotIn("Vary", svg)
+        self.assertEqual(svg["ETag"], qrcode_utils.qr_etag(data, "svg"))
+
+    def test_admin_voucher_qr_is_private(self):
+        response = self.client.get("/qr/admin/voucher/spa.png")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+
+
+class QRSheetsTests(SimpleTestCase):
+    @staticmethod
+    def _pages(pdf: bytes) -> int:
+        return len(re.findall(rb"/Type /Page\b", pdf))
+
+    def test_pool_rendering_keeps_input_order(self):
+        codes = [f"CODE{i:02d}" for i in range(7)]
+        expected = qr_sheets.render_batch(codes)
+        for workers in (1, 2):
+            rendered = list(qr_sheets.iter_rendered(iter(codes), workers=workers, batch_size=2))
+            self.assertEqual(rendered, list(zip(codes, expected)), f"workers={workers}")
+
+    def test_sheets_fill_pages_of_cols_by_rows(self):
+        png = qr_sheets.render_batch(["X"])[0]
+        out = io.BytesIO()
+        seen = []
+        pages = qr_sheets.write_sheets(((f"C{i}", png) for i in range(13)), out, title="Spa", progress=seen.append)
+        self.assertEqual(pages, 2)
+        self.assertEqual(self._pages(out.getvalue()), 2)
+        self.assertEqual(seen, list(range(1, 14)))
+
+    def test_volumes_close_a_pdf_every_n_pages(self):
+        png = qr_sheets.render_batch(["X"])[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = qr_sheets.write_volumes(((f"C{i}", png) for i in range(9)), tmp, "spa", cols=2, rows=2, pages_per_file=1)
+            self.assertEqual([p.name for p in paths], ["spa_001.pdf", "spa_002.pdf", "spa_003.pdf"])
+            self.assertEqual([self._pages(p.read_bytes()) for p in paths], [1, 1, 1])
+
+
+class QRPrewarmTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, QRClaim)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = pathlib.Path(tmp.name)
+        self.enterContext(override_settings(ST_QR_CACHE_DIR=self.root))
+        self.enterContext(mock.patch.object(qr_cache, "_store", qr_cache.QRCacheStore(self.root)))
+        self.enterContext(mock.patch("core.management.commands.prewarm_qr_cache.MARKER_EVERY", 2))
+        user = AppUser.objects.create(email="a@example.com", created_at=timezone.now())
+        self.wallets = sorted(
+            str(Wallet.objects.create(user=user, provider="local", provider_ref=f"r{i}", chain_id=i + 1, address=bytes([i]) * 20).id)
+            for i in range(5)
+        )
+
+    def _prewarm(self, *args):
+        out = io.StringIO()
+        call_command("prewarm_qr_cache", "--sources", "wallets", "--workers", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def _marker(self):
+        return json.loads((self.root / ".prewarm.json").read_text())
+
+    def test_interrupted_run_resumes_after_the_marker(self):
+        real_iter_cached = qr_batch.iter_cached
+
+        def interrupted(items, **kwargs):
+            for n, item in enumerate(real_iter_cached(items, **kwargs), start=1):
+                yield item
+                if n == 3:
+                    raise KeyboardInterrupt
+
+        with mock.patch.object(qr_batch, "iter_cached", interrupted), self.assertRaises(KeyboardInterrupt):
+            self._prewarm()
+        self.assertEqual(self._marker(), {"wallets:png:screen": self.wallets[1]})
+
+        with mock.patch.object(qr_batch, "wallet_items", wraps=qr_batch.wallet_items) as source:
+            with mock.patch.dict(qr_batch.SOURCES, wallets=source):
+                output = self._prewarm()
+        source.assert_called_once_with(self.wallets[1])
+        self.assertIn(f"resuming after {self.wallets[1]}", output)
+        # The third wallet was rendered before the interruption, so only two are new.
+        self.assertIn("done: 3 checked, 2 rendered", output)
+        self.assertEqual(self._marker(), {})
+
+    def test_reset_ignores_the_marker(self):
+        (self.root / ".prewarm.json").write_text(json.dumps({"wallets:png:screen": self.wallets[3]}))
+        output = self._prewarm("--reset")
+        self.assertIn("done: 5 checked, 5 rendered", output)
+        self.assertIn("done: 5 checked, 0 rendered", self._prewarm())
+
+    def test_claim_source_skips_used_and_expired_codes(self):
+        voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        past = timezone.now() - datetime.timedelta(days=1)
+        for code, status, expires_at in [("OPEN", "new", None), ("USED", "used", None), ("LATE", "new", past)]:
+            QRClaim.objects.create(code=code, voucher_type=voucher, status=status, expires_at=expires_at, created_at=timezone.now())
+        self.assertEqual([data for _, _, data in qr_batch.claim_items()], [qrcode_utils.claim_qr_spec("OPEN")[1]])
+
+
+class StreamingZipTests(SimpleTestCase):
+    def test_members_are_streamed_into_a_valid_zip(self):
+        consumed = []
+
+        def members():
+            for i in range(6):
+                consumed.append(i)
+                yield f"m{i}.png", os.urandom(exports.FILE_BLOCK_SIZE // 2), False
+            yield "m.svg", b"<svg/>" * 1000, True
+
+        chunks = exports.iter_zip(members())
+        first = next(chunks)
+        self.assertLess(len(consumed), 6)
+        data = first + b"".join(chunks)
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            infos = {i.filename: i for i in zf.infolist()}
+        self.assertEqual(sorted(infos), ["m.svg", *[f"m{i}.png" for i in range(6)]])
+        self.assertEqual(infos["m0.png"].compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(infos["m.svg"].compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_empty_zip_is_valid(self):
+        with zipfile.ZipFile(io.BytesIO(b"".join(exports.iter_zip([])))) as zf:
+            self.assertEqual(zf.namelist(), [])
+
+
+@override_settings(ST_QR_BULK_WORKERS=1)
+class CampaignQRZipTests(UnmanagedModelsTestCase):
+    models = (AppUser, VoucherType, QRClaim)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(mock.patch.object(qr_cache, "_store", qr_cache.QRCacheStore(tmp.name)))
+        self.login_staff()
+        voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        for code, status in [("NEW1", "new"), ("NEW2", "new"), ("USED1", "used")]:
+            QRClaim.objects.create(code=code, voucher_type=voucher, status=status, created_at=timezone.now())
+
+    def _zip(self, **params):
+        response = self.client.get("/adv1/admin/vouchers/spa/export-qr-zip", params)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        return zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+
+    def test_zip_holds_one_image_per_code(self):
+        with self._zip() as zf:
+            self.assertEqual(sorted(zf.namelist()), ["NEW1.png", "NEW2.png"])
+            self.assertTrue(zf.read("NEW1.png").startswith(b"\x89PNG"))
+        with self._zip(status="", format="svg") as zf:
+            self.assertEqual(sorted(zf.namelist()), ["NEW1.svg", "NEW2.svg", "USED1.svg"])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({"status": "gone"}, {"format": "gif"}, {"profile": "huge"}):
+            self.assertEqual(self.client.get("/adv1/admin/vouchers/spa/export-qr-zip", params).status_code, 400)
+        self.assertEqual(self.client.get("/adv1/admin/vouchers/nope/export-qr-zip").status_code, 404)
+
+
+class QRSheetCodesTests(UnmanagedModelsTestCase):
+    models = (AppUser, VoucherType, QRClaim)
+
+    def test_campaign_codes_stream_in_creation_order(self):
+        voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        other = VoucherType.objects.create(slug="gym", name="Gym", erc1155_contract="0x0", token_id=2)
+        start = timezone.now()
+        for i, (code, vt, status) in enumerate([("B", voucher, "new"), ("A", voucher, "used"), ("C", voucher, "new"), ("D", other, "new")]):
+            QRClaim.objects.create(code=code, voucher_type=vt, status=status, created_at=start + datetime.timedelta(seconds=i))
+        self.assertEqual(list(qr_sheets.iter_campaign_codes(voucher)), ["B", "C"])
+        self.assertEqual(list(qr_sheets.iter_campaign_codes(voucher, status="")), ["B", "A", "C"])
+
+
+class QRCacheEvictionTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        # A strictly increasing clock, so access order is never a tie.
+        clock = itertools.count(1_000_000)
+        patcher = mock.patch.object(qr_cache.time, "time", side_effect=lambda: float(next(clock)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fill(self, store, n):
+        for i in range(n):
+            store.put(f"k{i}-screen.png", b"x" * 10)
+
+    def _remaining(self, store, n):
+        return {f"k{i}" for i in range(n) if store.path_for(f"k{i}-screen.png").exists()}
+
+    def test_lru_evicts_least_recently_used(self):
+        store = qr_cache.QRCacheStore(self.root, max_files=10, policy="lru")
+        self._fill(store, 10)
+        store.get("k0-screen.png")
+        store.get("k1-screen.png")
+        store.flush()
+        store.put("k10-screen.png", b"x" * 10)  # 11 > 10: evict down to 9 (EVICT_TO)
+        self.assertEqual(self._remaining(store, 11), {"k0", "k1", "k10"} | {f"k{i}" for i in range(4, 10)})
+        self.assertEqual(store.stats()["files"], 9)
+
+    def test_lfu_evicts_least_frequently_used(self):
+        store = qr_cache.QRCacheStore(self.root, max_files=10, policy="lfu")
+        self._fill(store, 10)
+        for i in range(2, 10):
+            for _ in range(i):
+                store.get(f"k{i}-screen.png")
+        store.get("k0-screen.png")
+        store.flush()
+        store.put("k10-screen.png", b"x" * 10)
+        # k10 (0 hits, newest) and k1 (0 hits) go first, before k0 (1 hit).
+        self.assertEqual(self._remaining(store, 11), {"k0"} | {f"k{i}" for i in range(2, 10)})
+
+    def test_byte_budget(self):
+        store = qr_cache.QRCacheStore(self.root, max_bytes=100, policy="lru")
+        self._fill(store, 10)
+        store.put("k10-screen.png", b"x" * 30)  # 130 > 100: evict down to 90 bytes
+        self.assertLessEqual(store.stats()["bytes"], 90)
+        self.assertNotIn("k0", self._remaining(store, 11))
+        self.assertIn("k10", self._remaining(store, 11))
+
+
+class CountersTests(UnmanagedModelsTestCase):
+    models = (AppUser, StatCounter)
+
+    def _add_users(self, n, created_at=None):
+        for _ in range(n):
+            AppUser.objects.create(email=f"{uuid.uuid4().hex}@example.com", created_at=created_at or timezone.now())
+
+    def test_stripes_are_summed(self):
+        for _ in range(50):
+            counters.bump("app_user")
+        counters.bump("app_user", -5)
+        self.assertEqual(counters.get_total("app_user"), 45)
+        self.assertGreater(StatCounter.objects.filter(key="app_user").count(), 1)
+
+    def test_bump_many_and_zero_deltas(self):
+        counters.bump_many({"voucher_balance": 3, "pos_redemption:reserved": 2, "pos_redemption:committed": 0})
+        counters.bump_many({"voucher_balance": -1})
+        totals = counters.get_totals("voucher_balance", "pos_redemption:reserved", "pos_redemption:committed")
+        self.assertEqual(totals, {"voucher_balance": 2, "pos_redemption:reserved": 2, "pos_redemption:committed": 0})
+        self.assertFalse(StatCounter.objects.filter(key="pos_redemption:committed").exists())
+
+    def test_recent_total_counts_local_days(self):
+        counters.bump("app_user", daily=True)
+        counters.bump("app_user", daily=True)
+        old = counters.daily_key("app_user", timezone.localdate() - datetime.timedelta(days=10))
+        StatCounter.objects.create(key=old, stripe=0, value=7)
+        self.assertEqual(counters.recent_total("app_user", 7), 2)
+        self.assertEqual(counters.recent_total("app_user", 11), 9)
+
+    def test_rebuild_recounts_exactly(self):
+        self._add_users(3)
+        self._add_users(2, created_at=timezone.now() - datetime.timedelta(days=3))
+        counters.bump("app_user", 100)
+        self.assertEqual(counters.rebuild(["app_user"]), {"app_user": 5})
+        self.assertEqual(counters.get_total("app_user"), 5)
+        self.assertEqual(counters.recent_total("app_user", 1), 3)
+        self.assertEqual(counters.recent_total("app_user", 4), 5)
+        with self.assertRaises(ValueError):
+            counters.rebuild(["qr_claim"])
+
+    def test_apply_sql_seeds_unseeded_counters_once(self):
+        self._add_users(4)
+        call_command("apply_sql", "0001", stdout=io.StringIO())
+        self.assertEqual(counters.get_total("app_user"), 4)
+        self.assertEqual(counters.recent_total("app_user", 1), 4)
+        counters.bump("app_user", daily=True)
+        call_command("apply_sql", "0001", stdout=io.StringIO())
+        self.assertEqual(counters.get_total("app_user"), 5)
+
+
+class StreamingCSVTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, POSRedemption)
+
+    def test_iter_csv_flushes_in_row_batches(self):
+        rows = [[i, f"r{i}"] for i in range(exports.FLUSH_ROWS * 2 + 10)]
+        chunks = list(exports.iter_csv(["n", "name"], rows))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0].count("\r\n"), exports.FLUSH_ROWS)
+        self.assertEqual("".join(chunks).splitlines(), ["n,name", *[f"{i},r{i}" for i in range(len(rows))]])
+
+    def test_stream_query_reads_a_named_cursor_in_batches(self):
+        for hold in (False, True):
+            rows = list(exports.stream_query("SELECT g FROM generate_series(1, 25) g ORDER BY g", itersize=4, hold=hold))
+            self.assertEqual(rows, [(g,) for g in range(1, 26)])
+
+    def test_redemption_csv_is_streamed_newest_first(self):
+        voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        user = AppUser.objects.create(email="a@example.com", created_at=timezone.now())
+        wallet = Wallet.objects.create(user=user, provider="local", provider_ref="r", chain_id=1, address=b"\x00" * 20)
+        now = timezone.now()
+        for age in (1, 0, 2, 40):
+            POSRedemption.objects.create(
+                voucher_type=voucher, wallet=wallet, amount=age + 1, pos_terminal="SPA01",
+                reserved_at=now - datetime.timedelta(days=age),
+            )
+        response = exports.csv_response("r.csv", exports.REDEMPTION_HEADER, exports.redemption_rows(now - datetime.timedelta(days=30)))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["X-Accel-Buffering"], "no")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ",".join(exports.REDEMPTION_HEADER))
+        self.assertEqual([line.split(",")[2] for line in lines[1:]], ["1", "2", "3"])
+
+
+@override_settings(ST_EXPORT_SYNC_MAX_ROWS=3, ST_EXPORT_SYNC_MAX_VOUCHERS=1)
+class ExportJobFlowTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, QRClaim, POSRedemption, OnchainTx, VoucherCodeStats, StatCounter, ExportJob)
+
+    def setUp(self):
+        self.login_staff()
+        self.voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        user = AppUser.objects.create(email="a@example.com", created_at=timezone.now())
+        self.wallet = Wallet.objects.create(user=user, provider="local", provider_ref="r", chain_id=1, address=b"\x00" * 20)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.enterContext(override_settings(ST_EXPORT_DIR=self.tmp.name))
+
+    def _redemptions(self, n):
+        for _ in range(n):
+            POSRedemption.objects.create(voucher_type=self.voucher, wallet=self.wallet, pos_terminal="SPA01", reserved_at=timezone.now())
+
+    def test_small_quick_export_streams_in_the_request(self):
+        self._redemptions(3)
+        response = self.client.post("/adv1/console/quick/export-csv", {"days": 7})
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 4)
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertEqual(self.client.post("/adv1/console/quick/export-csv", {"days": "x"}).status_code, 400)
+
+    def test_oversized_sync_exports_are_queued_and_redirected(self):
+        self._redemptions(4)
+        for i in range(4):
+            QRClaim.objects.create(code=f"C{i}", voucher_type=self.voucher, created_at=timezone.now())
+        VoucherType.objects.create(slug="gym", name="Gym", erc1155_contract="0x0", token_id=2)
+        responses = [
+            self.client.post("/adv1/console/quick/export-csv", {"days": 7}),
+            self.client.get("/adv1/admin/vouchers/spa/export-codes", {"status": "new"}),
+            self.client.post("/adv1/admin/vouchers/export-qr-pdf", {"vouchers": ["spa", "gym"]}),
+        ]
+        jobs = list(ExportJob.objects.order_by("created_at"))
+        self.assertEqual([job.kind for job in jobs], ["redemptions_csv", "voucher_codes_csv", "voucher_qr_pdf"])
+        self.assertEqual(jobs[1].params, {"slug": "spa", "q": "", "status": "new"})
+        for response, job in zip(responses, jobs):
+            self.assertRedirects(response, f"/adv1/console/exports/{job.id}.json", fetch_redirect_response=False)
+
+    def test_queued_job_is_polled_and_downloaded_with_ranges(self):
+        self._redemptions(2)
+        response = self.client.post("/adv1/console/exports", {"kind": "redemptions_csv", "days": 7})
+        self.assertEqual(response.status_code, 202)
+        job = response.json()["job"]
+        self.assertIsNone(job["download_url"])
+        export_jobs.run(export_jobs.claim_next())
+
+        job = self.client.get(job["status_url"]).json()["job"]
+        self.assertEqual((job["status"], job["rows_done"], job["progress"]), ("done", 2, 100.0))
+        self.assertEqual([j["id"] for j in self.client.get("/adv1/console/exports.json").json()["jobs"]], [job["id"]])
+        full = b"".join(self.client.get(job["download_url"]).streaming_content)
+        self.assertTrue(full.startswith(b"reservation_id,"))
+        partial = self.client.get(job["download_url"], HTTP_RANGE="bytes=5-")
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b"".join(partial.streaming_content), full[5:])
+
+    def test_admin_pages_wire_their_buttons_to_export_jobs(self):
+        for url in ("/adv1/console", "/adv1/admin/vouchers", "/adv1/admin/vouchers/spa/codes"):
+            self.assertContains(self.client.get(url), "startExport(", msg_prefix=url)
+
+
+class AnalyticsExportTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, POSRedemption)
+
+    def setUp(self):
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TABLE analytics_watermark (
+                    dataset TEXT PRIMARY KEY, last_ts TIMESTAMPTZ, last_id UUID,
+                    rows_total BIGINT NOT NULL DEFAULT 0, updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+                """
+            )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.enterContext(override_settings(ST_ANALYTICS_DIR=self.tmp.name))
+        voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        user = AppUser.objects.create(email="a@example.com", created_at=timezone.now())
+        wallet = Wallet.objects.create(user=user, provider="local", provider_ref="r", chain_id=1, address=b"\x00" * 20)
+        start = timezone.now() - datetime.timedelta(hours=1)
+        self.rows = [
+            POSRedemption.objects.create(voucher_type=voucher, wallet=wallet, reserved_at=start + datetime.timedelta(seconds=i))
+            for i in range(8)
+        ]
+
+    def _exported_ids(self):
+        import pyarrow.parquet as pq
+
+        files = sorted(pathlib.Path(self.tmp.name, "redemptions").glob("day=*/*.parquet"))
+        return [i for f in files for i in pq.read_table(f).column("id").to_pylist()]
+
+    def test_rerun_after_a_crash_rewrites_uncommitted_parts_once(self):
+        real_save, calls = analytics_export._save_watermark, []
+
+        def save_then_crash(*args):
+            calls.append(args)
+            if len(calls) > 1:
+                raise RuntimeError("crash before the watermark update")
+            real_save(*args)
+
+        with mock.patch.object(analytics_export, "_save_watermark", side_effect=save_then_crash):
+            with self.assertRaises(RuntimeError):
+                analytics_export.export("redemptions", batch_size=3)
+        self.assertEqual(len(self._exported_ids()), 6)
+
+        # The first uncommitted row disappears before the rerun, so the rerun's parts start elsewhere.
+        self.rows[3].delete()
+        result = analytics_export.export("redemptions", batch_size=5)
+        self.assertEqual(result["rows"], 4)
+        expected = [str(r.id) for r in self.rows[:3] + self.rows[4:]]
+        self.assertEqual(sorted(self._exported_ids()), sorted(expected))
+
+    def test_clear_uncommitted_keeps_committed_and_legacy_parts(self):
+        analytics_export.export("redemptions", batch_size=3)
+        last_ts, last_id, total = analytics_export.get_watermark("redemptions")
+        self.assertEqual(total, 8)
+        part_dir = next(pathlib.Path(self.tmp.name, "redemptions").glob("day=*"))
+        (part_dir / "part-20000101T000000000000-0000abcd.parquet").write_bytes(b"")
+        (part_dir / "part-99990101T000000000000-ffffffff.parquet").write_bytes(b"")
+        (part_dir / "part-x.parquet.tmp").write_bytes(b"")
+        self.assertEqual(analytics_export.clear_uncommitted("redemptions", last_ts, last_id), 1)
+        names = {p.name for p in part_dir.iterdir()}
+        self.assertIn("part-20000101T000000000000-0000abcd.parquet", names)
+        self.assertNotIn("part-99990101T000000000000-ffffffff.parquet", names)
+        self.assertFalse(any(n.endswith(".tmp") for n in names))
+        (part_dir / "part-20000101T000000000000-0000abcd.parquet").unlink()
+        self.assertEqual(sorted(self._exported_ids()), sorted(str(r.id) for r in self.rows))
+
+
+class CodeStatsTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, QRClaim, ClaimRequest, VoucherCodeStats)
+
+    def setUp(self):
+        self.spa = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        self.gym = VoucherType.objects.create(slug="gym", name="Gym", erc1155_contract="0x0", token_id=2)
+        self.request = RequestFactory().post("/admin/")
+        from django.contrib import admin as django_admin
+
+        self.admin = django_admin.site._registry[QRClaim]
+
+    def _stats(self, voucher):
+        return counters.get_code_stats([voucher.id])[str(voucher.id)]
+
+    def _code(self, voucher, status="new"):
+        return QRClaim.objects.create(code=uuid.uuid4().hex, voucher_type=voucher, status=status, created_at=timezone.now())
+
+    def test_service_writers_move_codes_between_buckets(self):
+        counters.codes_created(self.spa.id, 5)
+        counters.code_status_changed(self.spa.id, "new", "used")
+        counters.codes_removed(self.spa.id, 2, "new")
+        stats = self._stats(self.spa)
+        self.assertEqual((stats["total_codes"], stats["new_codes"], stats["used_codes"]), (3, 2, 1))
+        self.assertEqual(self._stats(self.gym)["total_codes"], 0)
+
+    def test_rebuild_recounts_from_qr_claim(self):
+        self._code(self.spa)
+        self._code(self.spa, "used")
+        counters.codes_created(self.spa.id, 40)
+        counters.rebuild_code_stats()
+        stats = self._stats(self.spa)
+        self.assertEqual((stats["total_codes"], stats["new_codes"], stats["used_codes"]), (2, 1, 1))
+
+    def test_admin_add_change_and_delete_keep_stats_exact(self):
+        obj = QRClaim(code="ADMIN1", voucher_type=self.spa, status="new")
+        self.admin.save_model(self.request, obj, None, False)
+        obj.status = "used"
+        self.admin.save_model(self.request, obj, None, True)
+        self.assertEqual((self._stats(self.spa)["new_codes"], self._stats(self.spa)["used_codes"]), (0, 1))
+
+        obj.voucher_type = self.gym
+        self.admin.save_model(self.request, obj, None, True)
+        self.assertEqual(self._stats(self.spa)["total_codes"], 0)
+        self.assertEqual((self._stats(self.gym)["total_codes"], self._stats(self.gym)["used_codes"]), (1, 1))
+
+        self.admin.delete_model(self.request, obj)
+        self.assertEqual(self._stats(self.gym)["total_codes"], 0)
+
+    def test_admin_bulk_delete_decrements_per_campaign_and_status(self):
+        for voucher, status in [(self.spa, "new"), (self.spa, "new"), (self.spa, "used"), (self.gym, "expired")]:
+            self.admin.save_model(self.request, QRClaim(code=uuid.uuid4().hex, voucher_type=voucher, status=status), None, False)
+        keep = self._code(self.spa)
+        counters.codes_created(self.spa.id, 1)
+        self.admin.delete_queryset(self.request, QRClaim.objects.exclude(pk=keep.pk))
+        stats = self._stats(self.spa)
+        self.assertEqual((stats["total_codes"], stats["new_codes"], stats["used_codes"]), (1, 1, 0))
+        self.assertEqual(self._stats(self.gym)["total_codes"], 0)
+
+    def test_apply_sql_seeds_campaigns_without_a_row(self):
+        self._code(self.spa)
+        self._code(self.spa, "used")
+        counters.codes_created(self.gym.id, 9)
+        call_command("apply_sql", "0003", stdout=io.StringIO())
+        stats = self._stats(self.spa)
+        self.assertEqual((stats["total_codes"], stats["new_codes"], stats["used_codes"]), (2, 1, 1))
+        self.assertEqual(self._stats(self.gym)["total_codes"], 9)
+
+
+class SearchTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, QRClaim, VoucherCodeStats)
+
+    def setUp(self):
+        self.voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+
+    def _codes(self, *codes):
+        for code in codes:
+            QRClaim.objects.create(code=code, voucher_type=self.voucher, status="new", created_at=timezone.now())
+
+    def test_exact_code_wins_over_prefix_matches(self):
+        self._codes("SPA-AAAA", "SPA-AAAAB", "SPA-AAAAC")
+        self.assertEqual([c.code for c in search.search_codes(self.voucher.id, "spa-aaaa")], ["SPA-AAAA"])
+        self.assertEqual([c.code for c in search.search_codes(self.voucher.id, "SPA-AAA")], ["SPA-AAAA", "SPA-AAAAB", "SPA-AAAAC"])
+
+    def test_status_filter_applies_to_exact_and_prefix_lookups(self):
+        self._codes("SPA-1")
+        QRClaim.objects.create(code="SPA-2", voucher_type=self.voucher, status="used", created_at=timezone.now())
+        self.assertEqual([c.code for c in search.search_codes(self.voucher.id, "SPA-", status="used")], ["SPA-2"])
+        self.assertEqual([c.code for c in search.search_codes(self.voucher.id, "SPA-2", status="used")], ["SPA-2"])
+        self.assertEqual(search.search_codes(self.voucher.id, "SP", status="expired"), [])
+
+    def test_users_by_exact_email_and_phone_prefix(self):
+        now = timezone.now()
+        alice = AppUser.objects.create(email="alice@example.com", phone="0901234567", created_at=now)
+        AppUser.objects.create(email="bob@example.com", phone="0907654321", created_at=now - datetime.timedelta(days=1))
+        self.assertEqual(search.search_users("alice@example.com"), [alice])
+        self.assertEqual([u.email for u in search.search_users("090")], ["alice@example.com", "bob@example.com"])
+        self.assertEqual(search.search_users("090 123"), [alice])
+
+    def test_codes_page_flags_capped_results(self):
+        self.login_staff()
+        self._codes(*[f"SPA-{i:03d}" for i in range(search.DEFAULT_LIMIT + 1)])
+        response = self.client.get("/adv1/admin/vouchers/spa/codes", {"q": "SPA-"})
+        self.assertEqual(len(response.context["page_obj"]), search.DEFAULT_LIMIT)
+        self.assertContains(response, "refine your search")
+        response = self.client.get("/adv1/admin/vouchers/spa/codes", {"q": "SPA-00"})
+        self.assertNotContains(response, "refine your search")
+
+
+class POSDirectoryTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, Merchant, POSTerminal, POSRedemption)
+
+    def setUp(self):
+        cache.clear()
+        self.spa = Merchant.objects.create(name="Spa")
+        self.grill = Merchant.objects.create(name="Grill")
+        self.spa1 = POSTerminal.objects.create(merchant=self.spa, code="SPA01", api_key="k-spa1")
+        POSTerminal.objects.create(merchant=self.spa, code="SPA02", api_key="k-spa2")
+        POSTerminal.objects.create(merchant=self.grill, code="REST01", api_key="k-rest1")
+
+    def test_directory_is_cached_until_invalidated(self):
+        directory = pos_utils.get_terminal_directory()
+        self.assertEqual(directory["by_code"]["SPA01"]["merchant"], "Spa")
+        self.assertTrue(directory["by_code"]["SPA01"]["active"])
+        Merchant.objects.filter(pk=self.spa.pk).update(active=False)
+        with self.assertNumQueries(0):
+            self.assertTrue(pos_utils.get_terminal_directory()["by_code"]["SPA01"]["active"])
+        pos_utils.invalidate_terminal_directory()
+        self.assertFalse(pos_utils.get_terminal_directory()["by_code"]["SPA01"]["active"])
+
+    def test_api_key_lookup_reads_the_database(self):
+        pos_utils.get_terminal_directory()
+        self.assertEqual(pos_utils.get_terminal_by_api_key("k-spa1")["code"], "SPA01")
+        POSTerminal.objects.filter(pk=self.spa1.pk).update(active=False)
+        self.assertIsNone(pos_utils.get_terminal_by_api_key("k-spa1"))
+        Merchant.objects.filter(pk=self.grill.pk).update(active=False)
+        self.assertIsNone(pos_utils.get_terminal_by_api_key("k-rest1"))
+        self.assertIsNone(pos_utils.get_terminal_by_api_key(""))
+
+    def test_merchant_totals_group_terminals_in_sql(self):
+        voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        user = AppUser.objects.create(email="a@example.com", created_at=timezone.now())
+        wallet = Wallet.objects.create(user=user, provider="local", provider_ref="r", chain_id=1, address=b"\x00" * 20)
+        now = timezone.now()
+        for terminal, amount, status, age in [
+            ("SPA01", 3, "committed", 0), ("SPA02", 2, "committed", 0), ("SPA02", 5, "reserved", 0),
+            ("REST01", 4, "committed", 0), ("REST01", 9, "committed", 40), ("GONE", 1, "committed", 0),
+        ]:
+            POSRedemption.objects.create(
+                voucher_type=voucher, wallet=wallet, amount=amount, status=status, pos_terminal=terminal,
+                reserved_at=now - datetime.timedelta(days=age),
+            )
+        with self.assertNumQueries(1):
+            rows = pos_utils.merchant_redemption_totals(now - datetime.timedelta(days=30), limit=5)
+        by_name = {row["merchant"]: row for row in rows}
+        self.assertEqual([row["merchant"] for row in rows], ["Spa", "Grill", "Unknown merchant"])
+        self.assertEqual(by_name["Spa"]["terminal"], "SPA01, SPA02")
+        self.assertEqual((by_name["Spa"]["committed_amount"], by_name["Spa"]["total_amount"]), (5, 10))
+        self.assertEqual(by_name["Spa"]["redemption_count"], 3)
+        self.assertEqual(by_name["Grill"]["committed_amount"], 4)
+
+
+class AdminVouchersPageTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, VoucherBalance, POSRedemption, VoucherCodeStats, StatCounter)
+
+    def setUp(self):
+        self.login_staff()
+        for i in range(25):
+            VoucherType.objects.create(
+                slug=f"v{i}", name=f"V{i}", erc1155_contract="0x0", token_id=i,
+                created_at=timezone.now() - datetime.timedelta(minutes=i),
+            )
+        counters.bump_many({"voucher_type": 25, "voucher_balance": 40, "pos_redemption:committed": 7})
+
+    def test_stats_from_counters_without_scans(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/adv1/admin/vouchers")
+        self.assertEqual(response.status_code, 200)
+        stats = response.context["stats"]
+        self.assertEqual((stats["total_campaigns"], stats["circulating_balance"], stats["committed_amount"]), (25, 40, 7))
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("FROM \"pos_redemption\"", sql)
+        self.assertNotIn("FROM \"voucher_balance\"", sql)
+        unfiltered_counts = [q["sql"] for q in ctx.captured_queries if "COUNT(" in q["sql"] and "WHERE" not in q["sql"]]
+        self.assertEqual(unfiltered_counts, [])
+
+    def test_keyset_pages(self):
+        first = self.client.get("/adv1/admin/vouchers").context["page_obj"]
+        self.assertEqual([v.slug for v in first], [f"v{i}" for i in range(20)])
+        self.assertEqual(first.total, 25)
+        second = self.client.get("/adv1/admin/vouchers", {"after": first.next_cursor}).context["page_obj"]
+        self.assertEqual([v.slug for v in second], [f"v{i}" for i in range(20, 25)])
+        self.assertFalse(second.has_next)
+
+
+class TimeseriesTests(UnmanagedModelsTestCase):
+    models = (AppUser,)
+
+    def _user_at(self, day, hour, minute=0):
+        local = timezone.make_aware(datetime.datetime.combine(day, datetime.time(hour, minute)))
+        AppUser.objects.create(email=f"{uuid.uuid4().hex}@example.com", created_at=local)
+
+    def test_daily_series_fills_gaps_in_local_time(self):
+        today = timeseries.local_today()
+        two_days_ago = today - datetime.timedelta(days=2)
+        # 00:30 local is the previous day in UTC; it must land on the local day.
+        self._user_at(two_days_ago, 0, 30)
+        self._user_at(two_days_ago, 23, 59)
+        self._user_at(today, 12)
+        self._user_at(today - datetime.timedelta(days=9), 12)  # outside the range
+        points = timeseries.series("users", *timeseries.last_days(5))
+        self.assertEqual([p["value"] for p in points], [0, 0, 2, 0, 1])
+        self.assertEqual(points[-1]["label"], today.strftime("%d/%m"))
+
+    def test_hourly_buckets(self):
+        day = timeseries.local_today() - datetime.timedelta(days=1)
+        self._user_at(day, 9, 5)
+        self._user_at(day, 9, 55)
+        self._user_at(day, 11, 0)
+        points = timeseries.series("users", *timeseries.day_range(day), "hour")
+        self.assertEqual(len(points), 24)
+        self.assertEqual({p["label"][-5:]: p["value"] for p in points if p["value"]}, {"09:00": 2, "11:00": 1})
+
+    def test_count_between_is_half_open(self):
+        day = timeseries.local_today() - datetime.timedelta(days=1)
+        self._user_at(day, 0)
+        self._user_at(day + datetime.timedelta(days=1), 0)
+        self.assertEqual(timeseries.count_between("users", *timeseries.day_range(day)), 1)
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            timeseries.last_days(0)
+        with self.assertRaises(ValueError):
+            timeseries.last_days(timeseries.MAX_DAYS + 1)
+        with self.assertRaises(ValueError):
+            timeseries.series("users", *timeseries.last_days(60), "hour")
+        with self.assertRaises(ValueError):
+            timeseries.breakdown("users", "email", *timeseries.day_range())
+        with self.assertRaises(ValueError):
+            timeseries.count_between("qr_claim", *timeseries.day_range())
+
+    def test_endpoint_rejects_out_of_range_dates(self):
+        self.login_staff()
+        url = "/adv1/console/timeseries.json"
+        self.assertEqual(self.client.get(url, {"metric": "users", "days": 7}).status_code, 200)
+        for params in ({"days": 10**9}, {"start": "0001-01-01"}, {"start": "2025-01-01", "end": "9999-12-31"}):
+            response = self.client.get(url, {"metric": "users", **params})
+            self.assertEqual(response.status_code, 400, params)
+
+
+class ActivityStreamTests(UnmanagedModelsTestCase):
+    models = (AppUser, Wallet, VoucherType, QRClaim, ClaimRequest, POSRedemption, OnchainTx)
+
+    def setUp(self):
+        user = AppUser.objects.create(email="a@example.com", created_at=timezone.now())
+        voucher = VoucherType.objects.create(slug="spa", name="Spa", erc1155_contract="0x0", token_id=1)
+        wallet = Wallet.objects.create(user=user, provider="local", provider_ref="r", chain_id=1, address=b"\x00" * 20)
+        code = QRClaim.objects.create(code="SPA_1", voucher_type=voucher, created_at=timezone.now())
+        base = timezone.now() - datetime.timedelta(hours=1)
+        self.expected = []
+        for i in range(30):
+            ts = base + datetime.timedelta(minutes=i // 2)  # pairs share a timestamp
+            kind = ("user_register", "voucher_redeem", "onchain")[i % 3]
+            if kind == "user_register":
+                row = ClaimRequest.objects.create(qr_claim=code, email="a@example.com", consent=True, result="ok", created_at=ts)
+            elif kind == "voucher_redeem":
+                row = POSRedemption.objects.create(voucher_type=voucher, wallet=wallet, status="committed", reserved_at=ts)
+            else:
+                row = OnchainTx.objects.create(kind="mint1155", amount=1, status="sent", created_at=ts)
+            self.expected.append((ts, str(row.id), kind))
+        self.expected.sort(reverse=True)
+
+    def test_pages_merge_all_sources_in_order_without_gaps(self):
+        seen, cursor = [], None
+        for _ in range(10):
+            items, cursor = activity.page(cursor, limit=7)
+            seen.extend((it["ts"], it["ref"], it["type"]) for it in items)
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_queries_per_page_do_not_grow(self):
+        _, cursor = activity.page(None, limit=5)
+        with CaptureQueriesContext(connection) as ctx:
+            activity.page(cursor, limit=5)
+        self.assertEqual(len(ctx.captured_queries), len(activity._SOURCES))
+
+    def test_endpoint(self):
+        self.login_staff()
+        response = self.client.get("/adv1/console/recent.json", {"limit": 3})
+        body = response.json()
+        self.assertEqual([a["ref"] for a in body["activities"]], [ref for _, ref, _ in self.expected[:3]])
+        self.assertTrue(body["next_cursor"])
+        self.assertEqual(self.client.get("/adv1/console/recent.json", {"cursor": "junk"}).status_code, 400)
@@ -0,0 +1,151 @@
+"""Time-bucketed counts for the admin statistics.
+
+Every query filters with a half-open range on the raw timestamp column
+(``col >= start AND col < end``) so the ``created_at``/``reserved_at`` indexes stay
+usable, and buckets are computed in ``settings.TIME_ZONE`` (resort time) rather
+than the database server's date.
+"""
+import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+# metric -> (table, timestamp column, columns allowed for breakdowns)
+METRICS = {
+    "users": ("app_user", "created_at", ()),
+    "wallets": ("wallet", "created_at", ("provider",)),
+    "vouchers": ("voucher_type", "created_at", ("active",)),
+    "onchain_tx": ("onchain_tx", "created_at", ("status", "kind")),
+    "claims": ("claim_request", "created_at", ("result",)),
+    "redemptions": ("pos_redemption", "reserved_at", ("status",)),
+}
+
+GRANULARITIES = {
+    "hour": datetime.timedelta(hours=1),
+    "day": datetime.timedelta(days=1),
+    "week": datetime.timedelta(weeks=1),
+}
+
+LABEL_FORMATS = {
+    "hour": "%d/%m %H:00",
+    "day": "%d/%m",
+    "week": "%d/%m",
+}
+
+MAX_BUCKETS = 1000
+# Longest ``last_days`` range (weekly buckets at MAX_BUCKETS).
+MAX_DAYS = 7 * MAX_BUCKETS
+
+
+def _metric(metric: str):
+    try:
+        return METRICS[metric]
+    except KeyError:
+        raise ValueError(f"Unknown metric {metric}") from None
+
+
+def local_midnight(day: datetime.date) -> datetime.datetime:
+    """Aware datetime for 00:00 of ``day`` in resort time."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def local_today() -> datetime.date:
+    return timezone.localdate()
+
+
+def day_range(day: Optional[datetime.date] = None):
+    """Half-open [start, end) covering one resort-local day."""
+    day = day or local_today()
+    return local_midnight(day), local_midnight(day + datetime.timedelta(days=1))
+
+
+def _truncate(value: datetime.datetime, granularity: str) -> datetime.datetime:
+    """Floor a naive local datetime to its bucket start (matches Postgres date_trunc)."""
+    if granularity == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "week":
+        value -= datetime.timedelta(days=value.weekday())
+    return value
+
+
+def bucket_starts(start: datetime.datetime, end: datetime.datetime, granularity: str):
+    """Naive local bucket starts covering [start, end)."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity}")
+    step = GRANULARITIES[granularity]
+    current = _truncate(timezone.make_naive(start), granularity)
+    last = timezone.make_naive(end)
+    buckets = []
+    while current < last:
+        buckets.append(current)
+        if len(buckets) > MAX_BUCKETS:
+            raise ValueError("Range too large for granularity")
+        current += step
+    return buckets
+
+
+def count_between(metric: str, start: datetime.datetime, end: datetime.datetime) -> int:
+    table, column, _ = _metric(metric)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE {column} >= %s AND {column} < %s",
+            [start, end],
+        )
+        return cur.fetchone()[0]
+
+
+def breakdown(metric: str, field: str, start: datetime.datetime, end: datetime.datetime) -> dict:
+    """{value: count} grouped by ``field`` over [start, end)."""
+    table, column, fields = _metric(metric)
+    if field not in fields:
+        raise ValueError(f"Cannot break {metric} down by {field}")
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT {field}, COUNT(*)
+            FROM {table}
+            WHERE {column} >= %s AND {column} < %s
+            GROUP BY {field}
+            """,
+            [start, end],
+        )
+        return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def series(metric: str, start: datetime.datetime, end: datetime.datetime, granularity: str = "day"):
+    """List of {"start", "label", "value"} for every bucket in [start, end), gaps filled with 0."""
+    table, column, _ = _metric(metric)
+    buckets = bucket_starts(start, end, granularity)
+    tz_name = timezone.get_current_timezone_name() if settings.USE_TZ else "UTC"
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT date_trunc(%s, {column} AT TIME ZONE %s) AS bucket, COUNT(*)
+            FROM {table}
+            WHERE {column} >= %s AND {column} < %s
+            GROUP BY bucket
+            """,
+            [granularity, tz_name, start, end],
+        )
+        counts = {row[0]: row[1] for row in cur.fetchall() if row[0]}
+    fmt = LABEL_FORMATS[granularity]
+    return [
+        {
+            "start": timezone.make_aware(b).isoformat(),
+            "label": b.strftime(fmt),
+            "value": counts.get(b, 0),
+        }
+        for b in buckets
+    ]
+
+
+def last_days(days: int):
+    """Half-open range for the last ``days`` resort-local days, today included."""
+    if not 0 < days <= MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_DAYS}")
+    today = local_today()
+    start = local_midnight(today - datetime.timedelta(days=days - 1))
+    return start, local_midnight(today + datetime.timedelta(days=1))
@@ -4,6 +4,9 @@ from . import views_admin, views_auth, views_me, views_home, views_claim, views_
 urlpatterns = [
   path("adv1/console", views_admin.admin_dashboard, name="admin_console"),
   path("adv1/console/stats.json", views_admin.admin_stats_json, name="admin_stats_json"),
+  path("adv1/console/timeseries.json", views_admin.admin_timeseries_json, name="admin_timeseries_json"),
+  path("adv1/console/qr-cache.json", views_admin.admin_qr_cache_stats_json, name="admin_qr_cache_stats_json"),
+  path("adv1/console/code-filter.json", views_admin.admin_code_filter_stats_json, name="admin_code_filter_stats_json"),
   path("adv1/console/stats/<str:key>.json", views_admin.admin_stat_detail_json, name="admin_stat_detail_json"),
   path("adv1/console/stats/<str:key>", views_admin.admin_stat_detail_page, name="admin_stat_detail_page"),
   path("adv1/console/stats", views_admin.admin_stats_page, name="admin_stats_page"),
@@ -18,6 +21,7 @@ urlpatterns = [
   path("adv1/admin/vouchers/<str:slug>/generate-qr", views_admin.admin_voucher_generate_qr, name="admin_voucher_generate_qr"),
   path("adv1/admin/vouchers/<str:slug>/expire-code", views_admin.admin_voucher_expire_code, name="admin_voucher_expire_code"),
   path("adv1/admin/vouchers/<str:slug>/export-codes", views_admin.admin_voucher_export_codes, name="admin_voucher_export_codes"),
+  path("adv1/admin/vouchers/<str:slug>/export-qr-zip", views_admin.admin_voucher_export_qr_zip, name="admin_voucher_export_qr_zip"),
   path("adv1/admin/vouchers/export-qr-pdf", views_admin.admin_voucher_export_qr_pdf, name="admin_voucher_export_qr_pdf"),
   
   # POS Scanner
@@ -39,6 +43,10 @@ urlpatterns = [
   path("adv1/admin/merchants", views_admin.admin_merchants_page, name="admin_merchants_page"),
   path("adv1/console/quick/gen-qr", views_admin.quick_gen_qr, name="console_gen_qr"),
   path("adv1/console/quick/export-csv", views_admin.quick_export_csv, name="console_export_csv"),
+  path("adv1/console/exports", views_admin.admin_export_job_create, name="admin_export_job_create"),
+  path("adv1/console/exports.json", views_admin.admin_export_jobs_json, name="admin_export_jobs_json"),
+  path("adv1/console/exports/<uuid:job_id>.json", views_admin.admin_export_job_json, name="admin_export_job_json"),
+  path("adv1/console/exports/<uuid:job_id>/download", views_admin.admin_export_job_download, name="admin_export_job_download"),
   path("adv1/console/recent.json", views_admin.recent_activity_json, name="admin_recent_json"),
 
   path("auth/start", views_auth.auth_start, name="auth_start"),
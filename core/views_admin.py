@@ -1,4 +1,3 @@
-import csv
 import datetime
 import io
 import os
@@ -6,36 +5,34 @@ from io import BytesIO
 
 from django.conf import settings
 from django.core import management
-from django.db import connection
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect, render
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import json
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
 
 from .auth_utils import admin_required
+from . import activity, claim_codes, code_filter, counters, export_jobs, exports, qr_batch, timeseries
 from .models import (
     AppUser,
     VoucherType,
-    VoucherBalance,
     POSRedemption,
     Wallet,
     POSTerminal,
     Merchant,
+    ExportJob,
+    ExportJobStatus,
     OnchainTx,
     OnchainStatus,
 )
 from .forms import VoucherTypeForm, MerchantForm, POSTerminalForm
-from django.core.paginator import Paginator
+from .paging import KeysetPage, KeysetPaginator, estimate_count
+from .pos_utils import get_terminal_directory, invalidate_terminal_directory, merchant_redemption_totals
+from . import search
 from django.db import models
-from django.db.models import Count, Sum, Q, Max
+from django.db.models import Count, Exists, OuterRef, Sum, Q, Max
 
 
 @admin_required
@@ -142,26 +139,21 @@ def admin_stat_detail_page(request, key: str):
 @admin_required
 def admin_users_page(request):
     q = (request.GET.get('q') or '').strip()
-    qs = AppUser.objects.all().order_by('-created_at')
+    user_total = counters.get_total('app_user')
     if q == 'has_wallet':
-        qs = qs.filter(wallets__isnull=False).distinct()
+        qs = AppUser.objects.filter(Exists(Wallet.objects.filter(user=OuterRef('pk'))))
+        page_obj = KeysetPaginator(qs, 20, field='created_at', total='estimate').page_from_request(request)
     elif q:
-        qs = qs.filter(
-            models.Q(full_name__icontains=q) |
-            models.Q(email__icontains=q) |
-            models.Q(phone__icontains=q)
-        )
-    paginator = Paginator(qs, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
+        page_obj = KeysetPage.single(search.search_users(q, limit=search.DEFAULT_LIMIT + 1), limit=search.DEFAULT_LIMIT)
+    else:
+        page_obj = KeysetPaginator(AppUser.objects.all(), 20, field='created_at', total=user_total).page_from_request(request)
 
-    now = timezone.now()
-    last_7 = now - datetime.timedelta(days=7)
-    wallet_user_count = Wallet.objects.values('user_id').distinct().count()
+    # Counters and planner estimates only: no COUNT over app_user/wallet per page view
     stats = {
-        'total_users': AppUser.objects.count(),
-        'active_users': AppUser.objects.filter(is_active=True).count(),
-        'users_with_wallet': wallet_user_count,
-        'new_last_7d': AppUser.objects.filter(created_at__gte=last_7).count(),
+        'total_users': user_total,
+        'active_users': estimate_count(AppUser.objects.filter(is_active=True)),
+        'users_with_wallet': estimate_count(Wallet.objects.values('user_id').distinct()),
+        'new_last_7d': counters.recent_total('app_user', 7),
     }
 
     return render(request, 'admin_users.html', {
@@ -174,31 +166,23 @@ def admin_users_page(request):
 @admin_required
 def admin_vouchers_page(request):
     q = (request.GET.get('q') or '').strip()
-    qs = VoucherType.objects.all().order_by('-created_at')
+    totals = counters.get_totals('voucher_type', 'voucher_balance', 'pos_redemption:reserved', 'pos_redemption:committed')
+    qs = VoucherType.objects.all()
     if q:
         qs = qs.filter(models.Q(slug__icontains=q) | models.Q(name__icontains=q))
-    
-    # Add voucher code statistics
-    from .models import QRClaim
-    qs = qs.annotate(
-        total_codes=Count('qrclaim', distinct=True),
-        used_codes=Count('qrclaim', filter=Q(qrclaim__status='used'), distinct=True)
-    )
-    
-    paginator = Paginator(qs, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
+        page_obj = KeysetPaginator(qs, 20, field='created_at', total='estimate').page_from_request(request)
+    else:
+        page_obj = KeysetPaginator(qs, 20, field='created_at', total=totals['voucher_type']).page_from_request(request)
+
+    # Voucher code statistics come from voucher_code_stats, only for this page
+    page_items = list(page_obj.object_list)
+    code_stats = counters.get_code_stats(v.id for v in page_items)
+    for it in page_items:
+        stats = code_stats[str(it.id)]
+        it.total_codes = stats['total_codes']
+        it.used_codes = stats['used_codes']
+    page_obj.object_list = page_items
 
-    totals = VoucherType.objects.aggregate(
-        total=Count('id'),
-        active=Count('id', filter=Q(active=True)),
-    )
-    redemption_stats = POSRedemption.objects.aggregate(
-        committed_amount=Sum('amount', filter=Q(status='committed')),
-        reserved_amount=Sum('amount', filter=Q(status='reserved')),
-    )
-    balance_stats = VoucherBalance.objects.aggregate(
-        circulating=Sum('balance'),
-    )
     top_vouchers = (
         POSRedemption.objects.filter(status='committed')
         .values('voucher_type__slug', 'voucher_type__name')
@@ -209,12 +193,13 @@ def admin_vouchers_page(request):
     return render(request, 'admin_vouchers.html', {
         'page_obj': page_obj,
         'q': q,
+        # Maintained counters (core.counters) and a planner estimate: no scans per page view
         'stats': {
-            'total_campaigns': totals.get('total') or 0,
-            'active_campaigns': totals.get('active') or 0,
-            'committed_amount': redemption_stats.get('committed_amount') or 0,
-            'reserved_amount': redemption_stats.get('reserved_amount') or 0,
-            'circulating_balance': balance_stats.get('circulating') or 0,
+            'total_campaigns': totals['voucher_type'],
+            'active_campaigns': estimate_count(VoucherType.objects.filter(active=True)),
+            'committed_amount': totals['pos_redemption:committed'],
+            'reserved_amount': totals['pos_redemption:reserved'],
+            'circulating_balance': totals['voucher_balance'],
         },
         'top_vouchers': top_vouchers,
     })
@@ -252,7 +237,9 @@ def admin_voucher_new(request):
             voucher.created_at = now
             voucher.updated_at = now
             
-            voucher.save()
+            with transaction.atomic():
+                voucher.save()
+                counters.bump('voucher_type')
             request.session['console_msg'] = 'Voucher created.'
             return redirect('/adv1/admin/vouchers')
     else:
@@ -286,7 +273,9 @@ def admin_voucher_edit(request, slug: str):
 def admin_voucher_delete(request, slug: str):
     try:
         obj = VoucherType.objects.get(slug=slug)
-        obj.delete()
+        with transaction.atomic():
+            obj.delete()
+            counters.bump('voucher_type', -1)
         request.session['console_msg'] = 'Voucher deleted.'
     except VoucherType.DoesNotExist:
         pass
@@ -305,101 +294,15 @@ def admin_voucher_export_qr_pdf(request):
     vouchers = VoucherType.objects.filter(slug__in=voucher_slugs, active=True)
     if not vouchers.exists():
         return HttpResponseBadRequest("No active vouchers found")
+    if exports.exceeds(vouchers, settings.ST_EXPORT_SYNC_MAX_VOUCHERS):
+        return _queue_export(request, "voucher_qr_pdf", {"vouchers": voucher_slugs})
     
-    # Create PDF response
     response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="voucher_qr_codes_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-    
-    # Create PDF document
+    response['Content-Disposition'] = f'attachment; filename="{exports.voucher_qr_pdf_filename()}"'
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkgreen
-    )
-    
-    voucher_style = ParagraphStyle(
-        'VoucherTitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=10,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    # Build content
-    story = []
-    
-    # Title
-    story.append(Paragraph("Furama Resort - Voucher QR Codes", title_style))
-    story.append(Spacer(1, 20))
-    
-    # Generate QR codes for each voucher
-    from .qrcode_utils import render_qr_png
-    from .models import QRClaim
-    
-    for voucher in vouchers:
-        # Create a sample QR claim for this voucher
-        # In a real implementation, you might want to generate multiple QR codes per voucher
-        qr_data = f"voucher:{voucher.slug}:claim"
-        
-        # Generate QR code image
-        qr_png = render_qr_png(qr_data)
-        
-        # Use BytesIO instead of temporary file to avoid Windows path issues
-        qr_image_buffer = BytesIO(qr_png)
-        
-        try:
-            # Add voucher title
-            story.append(Paragraph(f"{voucher.name}", voucher_style))
-            story.append(Spacer(1, 10))
-            
-            # Add QR code image using BytesIO
-            qr_image = Image(qr_image_buffer, width=2*inch, height=2*inch)
-            qr_image.hAlign = 'CENTER'
-            story.append(qr_image)
-            story.append(Spacer(1, 10))
-            
-            # Add voucher details
-            details = [
-                ['Voucher Code:', voucher.slug],
-                ['Description:', voucher.description or 'StayToken reward'],
-                ['Token ID:', str(voucher.token_id)],
-                ['Status:', 'Active' if voucher.active else 'Inactive'],
-            ]
-            
-            details_table = Table(details, colWidths=[1.5*inch, 3*inch])
-            details_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ]))
-            
-            story.append(details_table)
-            story.append(Spacer(1, 20))
-            
-        finally:
-            # Close the BytesIO buffer
-            qr_image_buffer.close()
-    
-    # Build PDF
-    doc.build(story)
-    
-    # Get PDF content
-    pdf_content = buffer.getvalue()
+    exports.write_voucher_qr_pdf(vouchers, buffer)
+    response.write(buffer.getvalue())
     buffer.close()
-    
-    response.write(pdf_content)
     return response
 
 
@@ -418,6 +321,7 @@ def admin_merchant_new(request):
             from django.utils import timezone
             merchant.created_at = timezone.now()
             merchant.save()
+            invalidate_terminal_directory()
             request.session['console_msg'] = 'Merchant created successfully.'
             return redirect('/adv1/admin/merchants')
     else:
@@ -436,6 +340,7 @@ def admin_merchant_edit(request, pk: str):
         form = MerchantForm(request.POST, instance=obj)
         if form.is_valid():
             form.save()
+            invalidate_terminal_directory()
             request.session['console_msg'] = 'Merchant updated successfully.'
             return redirect('/adv1/admin/merchants')
     else:
@@ -448,6 +353,7 @@ def admin_merchant_delete(request, pk: str):
     try:
         obj = Merchant.objects.get(id=pk)
         obj.delete()
+        invalidate_terminal_directory()
         request.session['console_msg'] = 'Merchant deleted successfully.'
     except Merchant.DoesNotExist:
         pass
@@ -476,6 +382,7 @@ def admin_terminal_new(request):
             terminal.api_key = api_key
             terminal.created_at = timezone.now()
             terminal.save()
+            invalidate_terminal_directory()
             request.session['console_msg'] = 'Terminal created successfully.'
             return redirect('/adv1/admin/terminals')
     else:
@@ -494,6 +401,7 @@ def admin_terminal_edit(request, pk: str):
         form = POSTerminalForm(request.POST, instance=obj)
         if form.is_valid():
             form.save()
+            invalidate_terminal_directory()
             request.session['console_msg'] = 'Terminal updated successfully.'
             return redirect('/adv1/admin/terminals')
     else:
@@ -506,6 +414,7 @@ def admin_terminal_delete(request, pk: str):
     try:
         obj = POSTerminal.objects.get(id=pk)
         obj.delete()
+        invalidate_terminal_directory()
         request.session['console_msg'] = 'Terminal deleted successfully.'
     except POSTerminal.DoesNotExist:
         pass
@@ -517,11 +426,9 @@ def admin_pos_redemptions_page(request):
     status = (request.GET.get('status') or '').strip()
     days = int(request.GET.get('days') or 7)
     since = timezone.now() - datetime.timedelta(days=days)
-    qs = POSRedemption.objects.filter(reserved_at__gte=since).order_by('-reserved_at')
+    qs = POSRedemption.objects.filter(reserved_at__gte=since)
     if status:
         qs = qs.filter(status=status)
-    paginator = Paginator(qs, 25)
-    page_obj = paginator.get_page(request.GET.get('page'))
 
     summary = POSRedemption.objects.filter(reserved_at__gte=since).aggregate(
         total_count=Count('id'),
@@ -529,36 +436,26 @@ def admin_pos_redemptions_page(request):
         committed_amount=Sum('amount', filter=Q(status='committed')),
         cancelled_count=Count('id', filter=Q(status='cancelled')),
     )
+    # The summary already has exact totals for the range, so no extra COUNT(*)
+    status_totals = {
+        '': summary['total_count'],
+        'committed': summary['committed_count'],
+        'cancelled': summary['cancelled_count'],
+        'reserved': summary['total_count'] - summary['committed_count'] - summary['cancelled_count'],
+    }
+    page_obj = KeysetPaginator(
+        qs, 25, field='reserved_at', nullable=False, total=status_totals.get(status),
+    ).page_from_request(request)
 
-    terminal_map = POSTerminal.objects.select_related('merchant').in_bulk(field_name='code')
+    terminal_map = get_terminal_directory()['by_code']
     # Attach terminal and merchant metadata to each row for easy rendering
     page_items = list(page_obj.object_list)
     for entry in page_items:
         terminal = terminal_map.get(entry.pos_terminal)
         entry.display_terminal = entry.pos_terminal or 'Unknown'
-        entry.display_merchant = terminal.merchant.name if terminal and terminal.merchant_id else 'Unknown'
+        entry.display_merchant = terminal['merchant'] if terminal else 'Unknown'
     page_obj.object_list = page_items
-    top_merchants_raw = (
-        POSRedemption.objects.filter(reserved_at__gte=since, pos_terminal__isnull=False)
-        .values('pos_terminal')
-        .annotate(
-            total_amount=Sum('amount'),
-            committed_amount=Sum('amount', filter=Q(status='committed')),
-            redemption_count=Count('id'),
-        )
-        .order_by('-committed_amount')[:5]
-    )
-    top_merchants = []
-    for item in top_merchants_raw:
-        terminal = terminal_map.get(item['pos_terminal'])
-        merchant_name = terminal.merchant.name if terminal and terminal.merchant_id else 'Unknown merchant'
-        top_merchants.append({
-            'terminal': item['pos_terminal'],
-            'merchant': merchant_name,
-            'committed_amount': item['committed_amount'] or 0,
-            'total_amount': item['total_amount'] or 0,
-            'redemption_count': item['redemption_count'],
-        })
+    top_merchants = merchant_redemption_totals(since, limit=5)
 
     return render(request, 'admin_merchants.html', {
         'page_obj': page_obj,
@@ -570,30 +467,28 @@ def admin_pos_redemptions_page(request):
     })
 
 
+@admin_required
+def admin_qr_cache_stats_json(request):
+    from .qr_cache import get_store
+    return JsonResponse({"ok": True, "qr_cache": get_store().stats()})
+
+
+@admin_required
+def admin_code_filter_stats_json(request):
+    live = code_filter.get_filter()
+    return JsonResponse({"ok": True, "code_filter": live.stats() if live else None})
+
+
 @admin_required
 def admin_stats_json(request):
-    with connection.cursor() as cur:
-        cur.execute("SELECT COUNT(*) FROM app_user")
-        users = cur.fetchone()[0]
-
-        cur.execute("SELECT COUNT(*) FROM voucher_type")
-        voucher_campaigns = cur.fetchone()[0]
-
-        cur.execute("SELECT COUNT(*) FROM wallet")
-        wallets = cur.fetchone()[0]
-
-        cur.execute(
-            """
-            SELECT status, COUNT(*)
-            FROM onchain_tx
-            WHERE created_at::date = CURRENT_DATE
-            GROUP BY status
-            """
-        )
-        rows = cur.fetchall()
+    totals = counters.get_totals('app_user', 'voucher_type', 'wallet')
+    users = totals['app_user']
+    voucher_campaigns = totals['voucher_type']
+    wallets = totals['wallet']
 
-    tx_today_total = sum(r[1] for r in rows)
-    tx_failed = sum(r[1] for r in rows if r[0] == "failed")
+    tx_status = timeseries.breakdown("onchain_tx", "status", *timeseries.day_range())
+    tx_today_total = sum(tx_status.values())
+    tx_failed = tx_status.get("failed", 0)
 
     stats = [
         {
@@ -641,137 +536,102 @@ def admin_stat_detail_json(request, key: str):
         "chart": [],
     }
 
-    today = timezone.now().date()
-    last7 = [today - datetime.timedelta(days=i) for i in range(6, -1, -1)]
+    today = timeseries.day_range()
+    last7 = timeseries.last_days(7)
 
-    with connection.cursor() as cur:
-        if key == "users_total":
-            detail["title"] = "Platform users"
-            detail["subtitle"] = "Total accounts and new sign-ups"
+    if key == "users_total":
+        detail["title"] = "Platform users"
+        detail["subtitle"] = "Total accounts and new sign-ups"
 
-            cur.execute(
-                "SELECT COUNT(*) FROM app_user WHERE created_at::date = %s",
-                [today],
-            )
-            today_new = cur.fetchone()[0]
+        chart = timeseries.series("users", *last7)
+        detail["breakdown"] = [
+            {"label": "Sign-ups today", "value": timeseries.count_between("users", *today)},
+            {"label": "Sign-ups (last 7 days)", "value": sum(b["value"] for b in chart)},
+        ]
+        detail["chart"] = chart
 
-            cur.execute(
-                """
-                SELECT created_at::date, COUNT(*)
-                FROM app_user
-                WHERE created_at::date >= %s
-                GROUP BY created_at::date
-                """,
-                [last7[0]],
-            )
-            daily = {row[0]: row[1] for row in cur.fetchall() if row[0]}
-            detail["breakdown"] = [
-                {"label": "Sign-ups today", "value": today_new},
-                {"label": "Sign-ups (last 7 days)", "value": sum(daily.values())},
-            ]
-            detail["chart"] = [
-                {"label": d.strftime("%d/%m"), "value": daily.get(d, 0)} for d in last7
-            ]
-
-        elif key == "voucher_campaigns":
-            detail["title"] = "Voucher campaigns"
-            detail["subtitle"] = "Active versus paused campaigns"
+    elif key == "voucher_campaigns":
+        detail["title"] = "Voucher campaigns"
+        detail["subtitle"] = "Active versus paused campaigns"
 
+        with connection.cursor() as cur:
             cur.execute(
                 "SELECT active, COUNT(*) FROM voucher_type GROUP BY active"
             )
             rows = cur.fetchall()
-            active = sum(r[1] for r in rows if r[0])
-            inactive = sum(r[1] for r in rows if not r[0])
-            detail["breakdown"] = [
-                {"label": "Active", "value": active},
-                {"label": "Inactive", "value": inactive},
-            ]
-
-            cur.execute(
-                """
-                SELECT created_at::date, COUNT(*)
-                FROM voucher_type
-                WHERE created_at >= %s
-                GROUP BY created_at::date
-                """,
-                [last7[0]],
-            )
-            rows = cur.fetchall()
-            chart_lookup = {row[0]: row[1] for row in rows if row[0]}
-            detail["chart"] = [
-                {"label": d.strftime("%d/%m"), "value": chart_lookup.get(d, 0)} for d in last7
-            ]
-
-        elif key == "wallet_active":
-            detail['title'] = 'Custodial wallets'
-            detail["subtitle"] = "Wallet creation trend and totals"
-
-            cur.execute(
-                "SELECT COUNT(*) FROM wallet WHERE created_at::date = %s",
-                [today],
-            )
-            wallet_new_today = cur.fetchone()[0]
+        active = sum(r[1] for r in rows if r[0])
+        inactive = sum(r[1] for r in rows if not r[0])
+        detail["breakdown"] = [
+            {"label": "Active", "value": active},
+            {"label": "Inactive", "value": inactive},
+        ]
+        detail["chart"] = timeseries.series("vouchers", *last7)
+
+    elif key == "wallet_active":
+        detail['title'] = 'Custodial wallets'
+        detail["subtitle"] = "Wallet creation trend and totals"
+
+        chart = timeseries.series("wallets", *last7)
+        detail["breakdown"] = [
+            {"label": "Wallets created today", "value": timeseries.count_between("wallets", *today)},
+            {"label": "Wallets created (last 7 days)", "value": sum(b["value"] for b in chart)},
+        ]
+        detail["chart"] = chart
+
+    elif key == "tx_today":
+        detail["title"] = "On-chain transactions"
+        detail["subtitle"] = "Status distribution today"
+
+        status_map = timeseries.breakdown("onchain_tx", "status", *today)
+        detail["breakdown"] = [
+            {"label": "Sent", "value": status_map.get('sent', 0)},
+            {"label": "Confirmed", "value": status_map.get('confirmed', 0)},
+            {"label": "Queued", "value": status_map.get('queued', 0)},
+            {"label": "Failed", "value": status_map.get('failed', 0)},
+        ]
+        detail["chart"] = timeseries.series("onchain_tx", *last7)
+    else:
+        return JsonResponse({"ok": False, "error": "unknown_key"}, status=404)
 
-            cur.execute(
-                """
-                SELECT created_at::date, COUNT(*)
-                FROM wallet
-                WHERE created_at::date >= %s
-                GROUP BY created_at::date
-                """,
-                [last7[0]],
-            )
-            rows = cur.fetchall()
-            chart_lookup = {row[0]: row[1] for row in rows if row[0]}
-            detail["breakdown"] = [
-                {"label": "Wallets created today", "value": wallet_new_today},
-                {"label": "Wallets created (last 7 days)", "value": sum(chart_lookup.values())},
-            ]
-            detail["chart"] = [
-                {"label": d.strftime("%d/%m"), "value": chart_lookup.get(d, 0)} for d in last7
-            ]
-
-        elif key == "tx_today":
-            detail["title"] = "On-chain transactions"
-            detail["subtitle"] = "Status distribution today"
+    return JsonResponse({"ok": True, "detail": detail})
 
-            cur.execute(
-                """
-                SELECT status, COUNT(*)
-                FROM onchain_tx
-                WHERE created_at::date = %s
-                GROUP BY status
-                """,
-                [today],
-            )
-            rows = cur.fetchall()
-            status_map = {row[0] or 'unknown': row[1] for row in rows}
-            detail["breakdown"] = [
-                {"label": "Sent", "value": status_map.get('sent', 0)},
-                {"label": "Confirmed", "value": status_map.get('confirmed', 0)},
-                {"label": "Queued", "value": status_map.get('queued', 0)},
-                {"label": "Failed", "value": status_map.get('failed', 0)},
-            ]
 
-            cur.execute(
-                """
-                SELECT created_at::date, COUNT(*)
-                FROM onchain_tx
-                WHERE created_at::date >= %s
-                GROUP BY created_at::date
-                """,
-                [last7[0]],
-            )
-            rows = cur.fetchall()
-            chart_lookup = {row[0]: row[1] for row in rows if row[0]}
-            detail["chart"] = [
-                {"label": d.strftime("%d/%m"), "value": chart_lookup.get(d, 0)} for d in last7
-            ]
+@admin_required
+def admin_timeseries_json(request):
+    """Bucketed counts for any metric: ?metric=claims&granularity=hour&days=2
+    or an explicit &start=YYYY-MM-DD&end=YYYY-MM-DD (end inclusive, resort time)."""
+    metric = (request.GET.get("metric") or "").strip()
+    granularity = (request.GET.get("granularity") or "day").strip()
+    try:
+        start_param = request.GET.get("start")
+        end_param = request.GET.get("end")
+        if start_param:
+            start_day = datetime.date.fromisoformat(start_param)
+            end_day = datetime.date.fromisoformat(end_param) if end_param else timeseries.local_today()
+            if end_day < start_day:
+                raise ValueError("end is before start")
+            start = timeseries.local_midnight(start_day)
+            end = timeseries.local_midnight(end_day + datetime.timedelta(days=1))
         else:
-            return JsonResponse({"ok": False, "error": "unknown_key"}, status=404)
-
-    return JsonResponse({"ok": True, "detail": detail})
+            days = int(request.GET.get("days") or 7)
+            start, end = timeseries.last_days(days)
+        points = timeseries.series(metric, start, end, granularity)
+    except OverflowError:
+        # e.g. start=0001-01-01 or end=9999-12-31 shifted past the datetime range
+        return JsonResponse({"ok": False, "error": "Date out of range"}, status=400)
+    except ValueError as exc:
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+
+    return JsonResponse({
+        "ok": True,
+        "metric": metric,
+        "granularity": granularity,
+        "timezone": settings.TIME_ZONE,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total": sum(p["value"] for p in points),
+        "series": points,
+    })
 
 
 @admin_required
@@ -790,99 +650,88 @@ def quick_gen_qr(request):
 @admin_required
 @require_http_methods(["POST"])
 def quick_export_csv(request):
-    days = int(request.POST.get("days") or 30)
+    try:
+        days = int(request.POST.get("days") or 30)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid days")
+    if days < 1 or days > export_jobs.MAX_DAYS:
+        return HttpResponseBadRequest(f"days must be between 1 and {export_jobs.MAX_DAYS}")
     start = timezone.now() - datetime.timedelta(days=days)
+    if exports.exceeds(exports.redemption_queryset(start), settings.ST_EXPORT_SYNC_MAX_ROWS):
+        return _queue_export(request, "redemptions_csv", {"days": days})
 
-    with connection.cursor() as cur:
-        cur.execute(
-            """
-            SELECT pr.id, vt.slug, pr.amount, pr.status, pr.pos_terminal, pr.reserved_at, pr.committed_at
-            FROM pos_redemption pr
-            JOIN voucher_type vt ON vt.id = pr.voucher_type_id
-            WHERE pr.reserved_at >= %s
-            ORDER BY pr.reserved_at DESC
-            """,
-            [start],
-        )
-        rows = cur.fetchall()
+    return exports.csv_response(f"redemptions_{days}d.csv", exports.REDEMPTION_HEADER, exports.redemption_rows(start))
 
-    out = io.StringIO()
-    writer = csv.writer(out)
-    writer.writerow(["reservation_id", "voucher_slug", "amount", "status", "terminal", "reserved_at", "committed_at"])
-    for r in rows:
-        writer.writerow(r)
 
-    resp = HttpResponse(out.getvalue(), content_type="text/csv")
-    resp["Content-Disposition"] = f'attachment; filename="redemptions_{days}d.csv"'
-    return resp
+def _queue_export(request, kind: str, params: dict):
+    """Too big to stream within the request: queue a background job and redirect to its status."""
+    job = export_jobs.enqueue(kind, params, requested_by=request.user.get_username())
+    return redirect(export_jobs.as_dict(job)["status_url"])
 
 
 @admin_required
-def recent_activity_json(request):
-    items = []
-    with connection.cursor() as cur:
-        cur.execute(
-            """
-            SELECT cr.created_at, COALESCE(cr.email, cr.phone, 'unknown') AS who, cr.result
-            FROM claim_request cr
-            ORDER BY cr.created_at DESC LIMIT 10
-            """
-        )
-        for ts, who, result in cur.fetchall():
-            status = "success" if result == "ok" else "warning"
-            items.append({
-                "type": "user_register",
-                "user": who,
-                "action": f"Claim voucher ({result})",
-                "timestamp": ts,
-                "status": status,
-            })
+@require_http_methods(["POST"])
+def admin_export_job_create(request):
+    """Queue a background export; poll status_url, then fetch download_url."""
+    kind = request.POST.get("kind", "")
+    params = {
+        "days": request.POST.get("days"),
+        "slug": request.POST.get("slug"),
+        "q": request.POST.get("q"),
+        "status": request.POST.get("status"),
+        "vouchers": request.POST.getlist("vouchers"),
+    }
+    try:
+        job = export_jobs.enqueue(kind, params, requested_by=request.user.get_username())
+    except ValueError as exc:
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
+    return JsonResponse({"ok": True, "job": export_jobs.as_dict(job)}, status=202)
 
-        cur.execute(
-            """
-            SELECT pr.reserved_at, vt.slug, pr.status
-            FROM pos_redemption pr
-            JOIN voucher_type vt ON vt.id = pr.voucher_type_id
-            ORDER BY pr.reserved_at DESC LIMIT 10
-            """
-        )
-        for ts, slug, status in cur.fetchall():
-            items.append({
-                "type": "voucher_redeem",
-                "user": slug,
-                "action": f"POS redeem ({status})",
-                "timestamp": ts,
-                "status": "success" if status == "committed" else "warning",
-            })
 
-        cur.execute(
-            """
-            SELECT created_at, kind, status
-            FROM onchain_tx
-            ORDER BY created_at DESC LIMIT 10
-            """
-        )
-        for ts, kind, status in cur.fetchall():
-            items.append({
-                "type": "onchain",
-                "user": kind,
-                "action": f"On-chain tx ({status})",
-                "timestamp": ts,
-                "status": "success" if status in ("sent", "confirmed") else "warning",
-            })
+@admin_required
+def admin_export_jobs_json(request):
+    jobs = ExportJob.objects.order_by("-created_at")[:20]
+    return JsonResponse({"ok": True, "jobs": [export_jobs.as_dict(j) for j in jobs]})
+
+
+@admin_required
+def admin_export_job_json(request, job_id):
+    job = ExportJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"ok": False, "error": "Export not found"}, status=404)
+    return JsonResponse({"ok": True, "job": export_jobs.as_dict(job)})
+
+
+@admin_required
+def admin_export_job_download(request, job_id):
+    job = ExportJob.objects.filter(pk=job_id, status=ExportJobStatus.DONE).first()
+    path = export_jobs.job_path(job) if job else None
+    if path is None or not path.exists():
+        return JsonResponse({"ok": False, "error": "Export not ready"}, status=404)
+    return exports.file_response(request, path, job.file_name, export_jobs.content_type(job), export_jobs.etag(job))
+
+
+@admin_required
+def recent_activity_json(request):
+    """Newest-first activity. Pass ?cursor=<next_cursor> to scroll back, ?limit=N (max 100)."""
+    try:
+        limit = int(request.GET.get("limit") or activity.DEFAULT_LIMIT)
+        items, next_cursor = activity.page(request.GET.get("cursor") or None, limit)
+    except ValueError as exc:
+        return JsonResponse({"ok": False, "error": str(exc)}, status=400)
 
-    items.sort(key=lambda x: x["timestamp"], reverse=True)
     out = []
-    for idx, it in enumerate(items[:15], start=1):
+    for idx, it in enumerate(items, start=1):
         out.append({
             "id": idx,
+            "ref": it["ref"],
             "type": it["type"],
             "user": it["user"],
             "action": it["action"],
-            "timestamp": it["timestamp"].isoformat() if hasattr(it["timestamp"], "isoformat") else str(it["timestamp"]),
+            "timestamp": it["ts"].isoformat(),
             "status": it["status"],
         })
-    return JsonResponse({"ok": True, "activities": out})
+    return JsonResponse({"ok": True, "activities": out, "next_cursor": next_cursor})
 
 
 @admin_required
@@ -905,6 +754,20 @@ def admin_pos_validate_voucher(request):
                 "message": "Missing QR code"
             }, status=400)
         
+        # Check characters are verified in Python; mis-scans never reach the database
+        if not claim_codes.is_acceptable(qr_code):
+            return JsonResponse({
+                "success": False,
+                "message": "Invalid QR code"
+            })
+        
+        # In-memory filter of existing codes: a certain miss skips the lookup
+        if not code_filter.might_exist(qr_code):
+            return JsonResponse({
+                "success": False,
+                "message": "QR code not found"
+            })
+        
         # Get QRClaim by code
         from .models import QRClaim, VoucherBalance
         try:
@@ -987,6 +850,20 @@ def admin_pos_confirm_redemption(request):
                 "message": "Missing QR code"
             }, status=400)
         
+        # Check characters are verified in Python; mis-scans never reach the database
+        if not claim_codes.is_acceptable(qr_code):
+            return JsonResponse({
+                "success": False,
+                "message": "Invalid QR code"
+            })
+        
+        # In-memory filter of existing codes: a certain miss skips the lookup
+        if not code_filter.might_exist(qr_code):
+            return JsonResponse({
+                "success": False,
+                "message": "QR code not found"
+            })
+        
         # Get QRClaim
         from .models import QRClaim, VoucherBalance, POSRedemption
         try:
@@ -1035,11 +912,18 @@ def admin_pos_confirm_redemption(request):
                     "UPDATE voucher_balance SET balance = balance - 1, updated_at = NOW() WHERE wallet_id = %s AND voucher_type_id = %s",
                     [wallet.id, qr_claim.voucher_type.id]
                 )
+            counters.bump("voucher_balance", -1)
             
             # Update QRClaim status to used
+            previous_status = (
+                QRClaim.objects.select_for_update()
+                .values_list('status', flat=True)
+                .get(id=qr_claim.id)
+            )
             qr_claim.status = 'used'
             qr_claim.used_at = timezone.now()
             qr_claim.save()
+            counters.code_status_changed(qr_claim.voucher_type_id, previous_status, 'used')
             
             # Create POS redemption record
             try:
@@ -1052,6 +936,7 @@ def admin_pos_confirm_redemption(request):
                     reserved_at=timezone.now(),
                     committed_at=timezone.now()
                 )
+                counters.bump("pos_redemption:committed", 1)
                 print(f"Created POSRedemption: {pos_redemption.id}")
             except Exception as e:
                 print(f"Error creating POSRedemption: {e}")
@@ -1094,28 +979,33 @@ def admin_voucher_codes(request, slug: str):
     
     # Build queryset
     from .models import QRClaim
-    qs = QRClaim.objects.filter(voucher_type=voucher)
-    
-    if q:
-        qs = qs.filter(code__icontains=q)
+    qs = QRClaim.objects.filter(voucher_type=voucher).select_related('used_by_user')
     if status:
         qs = qs.filter(status=status)
     
-    # Order by created_at desc
-    qs = qs.order_by('-created_at')
-    
-    # Paginate
-    paginator = Paginator(qs, 50)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    
     # Calculate statistics
-    total_codes = QRClaim.objects.filter(voucher_type=voucher).count()
-    used_codes = QRClaim.objects.filter(voucher_type=voucher, status='used').count()
+    code_stats = counters.get_code_stats([voucher.id])[str(voucher.id)]
+    total_codes = code_stats['total_codes']
+    used_codes = code_stats['used_codes']
+    
+    if q:
+        # Ranked search results (exact / prefix / trigram), single page
+        page_obj = KeysetPage.single(
+            search.search_codes(voucher.id, q, status=status, limit=search.DEFAULT_LIMIT + 1), limit=search.DEFAULT_LIMIT,
+        )
+    else:
+        # Paginate (newest first); totals come straight from the counters
+        if status:
+            total = code_stats.get(counters.CODE_STATUS_COLUMNS.get(status, ''), 'estimate')
+        else:
+            total = total_codes
+        page_obj = KeysetPaginator(qs, 50, field='created_at', total=total).page_from_request(request)
     available_codes = total_codes - used_codes
     usage_rate = round((used_codes / total_codes * 100) if total_codes > 0 else 0, 1)
     
     return render(request, 'admin_voucher_codes.html', {
         'voucher': voucher,
+        'default_prefix': claim_codes.default_prefix(voucher.slug),
         'page_obj': page_obj,
         'q': q,
         'status': status,
@@ -1138,16 +1028,16 @@ def admin_voucher_generate_qr(request, slug: str):
         return JsonResponse({"success": False, "message": "Voucher not found"}, status=404)
     
     try:
-        from core.qrcode_utils import get_or_make_cached_png
+        from core.qrcode_utils import cached_qr_path
         from django.conf import settings
         import os
         
         # Generate QR code data
         qr_data = f"voucher:{slug}:claim"
         
-        # Create QR code PNG file
-        qr_filename = f"voucher_{slug}.png"
-        qr_path = get_or_make_cached_png(qr_filename, qr_data)
+        # Create QR code PNG file (same cache entry /qr/admin/voucher/<slug>.png serves)
+        qr_filename = f"voucher_{slug}"
+        qr_path = cached_qr_path(qr_filename, qr_data)
         
         # Check if file exists
         file_exists = os.path.exists(qr_path)
@@ -1186,46 +1076,37 @@ def admin_voucher_generate_codes(request, slug: str):
     try:
         data = json.loads(request.body)
         count = data.get('count', 10)
-        prefix = data.get('prefix', slug.upper())
+        prefix = data.get('prefix')
         expiry_days = data.get('expiry_days')
         
-        if count < 1 or count > 1000:
-            return JsonResponse({"success": False, "message": "Count must be between 1 and 1000"}, status=400)
-        
-        # Generate codes
-        from .models import QRClaim
-        from django.utils import timezone
-        from datetime import timedelta
-        import random
-        import string
+        if prefix is None:
+            prefix = claim_codes.default_prefix(slug)
+        try:
+            claim_codes.clean_prefix(prefix)
+        except ValueError as exc:
+            return JsonResponse({"success": False, "message": str(exc)}, status=400)
+        if not isinstance(count, int) or count < 1:
+            return JsonResponse({"success": False, "message": f"Count must be between 1 and {claim_codes.HTTP_MAX_CODES}"}, status=400)
+        if count > claim_codes.HTTP_MAX_CODES:
+            return JsonResponse({
+                "success": False,
+                "message": (
+                    f"At most {claim_codes.HTTP_MAX_CODES:,} codes per request; for larger batches run "
+                    f"python manage.py gen_claim_qr --slug {slug} --count {count} --no-qr"
+                ),
+            }, status=400)
         
-        codes_created = []
         expires_at = None
         if expiry_days:
-            expires_at = timezone.now() + timedelta(days=expiry_days)
+            expires_at = timezone.now() + datetime.timedelta(days=expiry_days)
         
-        for i in range(count):
-            # Generate unique code
-            while True:
-                suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-                code = f"{prefix}_{suffix}"
-                if not QRClaim.objects.filter(code=code).exists():
-                    break
-            
-            # Create QRClaim
-            qr_claim = QRClaim.objects.create(
-                code=code,
-                voucher_type=voucher,
-                status='new',
-                expires_at=expires_at,
-                created_at=timezone.now()
-            )
-            codes_created.append(code)
+        # COPY + INSERT ... ON CONFLICT DO NOTHING per chunk instead of two queries per code
+        created, preview = claim_codes.create_codes(voucher.id, count, prefix=prefix, expires_at=expires_at)
         
         return JsonResponse({
             "success": True,
-            "message": f"Generated {len(codes_created)} voucher codes",
-            "codes": codes_created[:10]  # Return first 10 for preview
+            "message": f"Generated {created} voucher codes",
+            "codes": preview  # Return first 10 for preview
         })
         
     except json.JSONDecodeError:
@@ -1252,12 +1133,15 @@ def admin_voucher_expire_code(request, slug: str):
         
         from .models import QRClaim
         try:
-            qr_claim = QRClaim.objects.get(code=code, voucher_type=voucher)
-            if qr_claim.status == 'used':
-                return JsonResponse({"success": False, "message": "Code is already used"}, status=400)
-            
-            qr_claim.status = 'expired'
-            qr_claim.save()
+            with transaction.atomic():
+                qr_claim = QRClaim.objects.select_for_update().get(code=code, voucher_type=voucher)
+                if qr_claim.status == 'used':
+                    return JsonResponse({"success": False, "message": "Code is already used"}, status=400)
+                
+                previous_status = qr_claim.status
+                qr_claim.status = 'expired'
+                qr_claim.save()
+                counters.code_status_changed(voucher.id, previous_status, 'expired')
             
             return JsonResponse({"success": True, "message": "Code expired successfully"})
             
@@ -1281,34 +1165,44 @@ def admin_voucher_export_codes(request, slug: str):
     # Get search parameters
     q = (request.GET.get('q') or '').strip()
     status = request.GET.get('status', '')
+    if exports.exceeds(exports.voucher_code_queryset(voucher, q, status), settings.ST_EXPORT_SYNC_MAX_ROWS):
+        return _queue_export(request, "voucher_codes_csv", {"slug": slug, "q": q, "status": status})
     
-    # Build queryset
-    from .models import QRClaim
-    qs = QRClaim.objects.filter(voucher_type=voucher)
-    
-    if q:
-        qs = qs.filter(code__icontains=q)
-    if status:
-        qs = qs.filter(status=status)
-    
-    # Order by created_at desc
-    qs = qs.order_by('-created_at')
-    
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{slug}_voucher_codes_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Code', 'Status', 'Used By', 'Used At', 'Expires At', 'Created At'])
-    
-    for code in qs:
-        writer.writerow([
-            code.code,
-            code.status,
-            code.used_by_user.email if code.used_by_user else '',
-            code.used_at.strftime('%Y-%m-%d %H:%M:%S') if code.used_at else '',
-            code.expires_at.strftime('%Y-%m-%d %H:%M:%S') if code.expires_at else '',
-            code.created_at.strftime('%Y-%m-%d %H:%M:%S') if code.created_at else ''
-        ])
-    
-    return response
+    return exports.csv_response(
+        f'{slug}_voucher_codes_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        exports.VOUCHER_CODE_HEADER,
+        exports.voucher_code_rows(voucher, q, status),
+    )
+
+
+@admin_required
+def admin_voucher_export_qr_zip(request, slug: str):
+    """Zip of every claim QR image of a voucher type (?status=new by default, '' for all; ?format=png|svg)."""
+    try:
+        voucher = VoucherType.objects.get(slug=slug)
+    except VoucherType.DoesNotExist:
+        raise Http404("Voucher not found")
+
+    status = request.GET.get("status", "new")
+    if status not in ("", "new", "used", "expired"):
+        return HttpResponseBadRequest("Invalid status")
+    fmt = request.GET.get("format", "png")
+    if fmt not in ("png", "svg"):
+        return HttpResponseBadRequest("Invalid format")
+    profile = request.GET.get("profile", "print")
+    if profile not in ("screen", "print"):
+        return HttpResponseBadRequest("Invalid profile")
+
+    images = qr_batch.claim_images(
+        voucher.id,
+        status=status,
+        fmt=fmt,
+        profile=profile,
+        workers=getattr(settings, "ST_QR_BULK_WORKERS", 2),
+    )
+    # PNGs are already deflated; only SVG text is worth compressing again.
+    members = ((f"{code}.{fmt}", image, fmt == "svg") for code, image in images)
+    return exports.zip_response(
+        f'{slug}_qr_{status or "all"}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.zip',
+        members,
+    )
@@ -7,7 +7,7 @@ import uuid
 from django.conf import settings
 from django.core.cache import cache
 from django.core.mail import send_mail
-from django.db import connection
+from django.db import connection, transaction
 from django.shortcuts import redirect, render
 from django.urls import reverse
 from django.utils import timezone
@@ -19,6 +19,7 @@ from .forms import OTPStartForm, ClaimProfileForm
 from .models import AppUser
 from .auth_utils import get_current_user
 from .services import get_or_create_wallet
+from . import counters
 
 OTP_TTL_MINUTES = 10
 OTP_LENGTH = 6
@@ -181,7 +182,7 @@ def auth_verify(request):
     except AppUser.DoesNotExist:
         new_id = uuid.uuid4()
         display_name = f"Khach Furama {get_random_string(4)}"
-        with connection.cursor() as cur:
+        with transaction.atomic(), connection.cursor() as cur:
             cur.execute(
                 """
                 INSERT INTO app_user (id, email, phone, full_name, is_active, created_at, updated_at)
@@ -189,6 +190,7 @@ def auth_verify(request):
                 """,
                 [str(new_id), email, display_name],
             )
+            counters.bump("app_user", daily=True)
         user = AppUser.objects.get(id=new_id)
 
     request.session["user_id"] = str(user.id)
@@ -5,12 +5,12 @@ from django.db import connection
 from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse
-from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 
 from .auth_utils import get_current_user
 from .forms import ClaimProfileForm, OTPStartForm
 from .models import QRClaim, VoucherType
+from . import claim_codes, code_filter
 from .services import (
     enqueue_onchain,
     finish_qr_claim,
@@ -59,30 +59,15 @@ def _process_claim(request, voucher_type, *, user):
             # Mint immediately instead of queuing
             tx_hash = mint_erc1155_now(wallet, voucher_type, amount=1, wait=True)
             
-            # Create QRClaim record for tracking
-            from .models import QRClaim
-            import time
-            
-            # Generate unique code for this claim (shorter format)
-            import hashlib
-            import time
-            
-            # Create a unique hash from user_id + timestamp + voucher_slug
-            timestamp = int(timezone.now().timestamp())
-            hash_input = f"{user.id}_{timestamp}_{voucher_type.slug}"
-            hash_short = hashlib.md5(hash_input.encode()).hexdigest()[:8]
-            
-            # Format: slug_8char_hash (max ~25 chars)
-            unique_code = f"{voucher_type.slug}_{hash_short}"
-            
-            qr_claim = QRClaim.objects.create(
-                code=unique_code,
-                voucher_type=voucher_type,
+            # Create QRClaim record for tracking (PREFIX_XXXXXXXXCCC, unique by construction;
+            # an old-format clash is retried in a savepoint, not by aborting the mint)
+            qr_claim = claim_codes.create_claim(
+                voucher_type,
                 used_by_user=user,
                 used_at=None,  # Chưa được sử dụng, sẽ set khi staff scan
                 status="new",  # Mới claim, chưa được redeem
-                created_at=timezone.now()  # Set created_at
             )
+            unique_code = qr_claim.code
             
             # Log the claim request
             log_claim_request(qr_claim, client_ip, ua, email, phone, consent, "ok")
@@ -297,9 +282,11 @@ def claim_mint_now(request, slug: str):
 
 
 def claim_done(request, code: str):
+    if not claim_codes.is_acceptable(code) or not code_filter.might_exist(code):
+        raise Http404
     try:
         qr = QRClaim.objects.get(code=code)
-    except VoucherType.DoesNotExist:
+    except QRClaim.DoesNotExist:
         raise Http404
     user = qr.used_by_user
     wallet = None
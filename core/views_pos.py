@@ -2,12 +2,13 @@ import json
 import uuid
 
 from django.conf import settings
-from django.db import connection
+from django.db import connection, transaction
 from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
 from django.urls import reverse
 
+from . import counters
 from .models import VoucherType, VoucherBalance, Wallet
 from .auth_utils import login_required, get_current_user
 from .pos_utils import get_terminal_by_api_key, terminal_allows_voucher
@@ -171,7 +172,7 @@ def api_reserve(request):
     if not wallet:
         return JsonResponse({"ok": False, "error": "Wallet not found"})
 
-    with connection.cursor() as cur:
+    with transaction.atomic(), connection.cursor() as cur:
         cur.execute(
             """
             SELECT balance FROM voucher_balance
@@ -202,6 +203,7 @@ def api_reserve(request):
             """,
             [str(reservation_id), str(voucher.id), str(wallet.id), amount, terminal["code"]],
         )
+        counters.bump_many({"voucher_balance": -amount, "pos_redemption:reserved": amount})
 
     return JsonResponse({"ok": True, "reservation_id": str(reservation_id), "pos": terminal["code"]})
 
@@ -221,7 +223,7 @@ def api_commit(request):
     except Exception:
         return HttpResponseBadRequest("Bad JSON")
 
-    with connection.cursor() as cur:
+    with transaction.atomic(), connection.cursor() as cur:
         cur.execute(
             """
             SELECT id, voucher_type_id, wallet_id, amount, status, pos_terminal
@@ -234,7 +236,7 @@ def api_commit(request):
         if not row:
             return JsonResponse({"ok": False, "error": "Reservation not found"})
 
-        _, _, _, _, status, pos_code = row
+        _, _, _, amount, status, pos_code = row
         if status != "reserved":
             return JsonResponse({"ok": False, "error": "Already finalized"})
         if pos_code != terminal["code"]:
@@ -248,5 +250,6 @@ def api_commit(request):
             """,
             [reservation_id],
         )
+        counters.bump_many({"pos_redemption:reserved": -amount, "pos_redemption:committed": amount})
 
     return JsonResponse({"ok": True})
@@ -1,9 +1,23 @@
 import re
 from pathlib import Path
 
-from django.http import FileResponse, Http404
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 
-from .qrcode_utils import get_or_make_cached_png
+from . import claim_codes, code_filter
+from .qrcode_utils import (
+    DEFAULT_PROFILE,
+    FORMATS,
+    PROFILES,
+    cached_qr_path,
+    claim_qr_spec,
+    qr_etag,
+    render_qr,
+    voucher_admin_qr_spec,
+    voucher_qr_spec,
+    wallet_qr_spec,
+)
 
 
 def _normalize_addr(addr: str) -> str:
@@ -15,34 +29,91 @@ def _normalize_addr(addr: str) -> str:
     return candidate
 
 
+def _accept_q(accept: str, media_type: str) -> float:
+    """q-value the Accept header gives ``media_type`` (exact match beats type/* beats */*)."""
+    best, best_rank = 0.0, -1
+    main = media_type.split("/")[0]
+    for item in accept.split(","):
+        parts = [p.strip() for p in item.split(";")]
+        rng = parts[0].lower()
+        rank = {media_type: 2, f"{main}/*": 1, "*/*": 0}.get(rng)
+        if rank is None or rank < best_rank:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        best, best_rank = q, rank
+    return best
+
+
+def _negotiate(request):
+    """Return (format, profile, varies_on_accept). ?format= wins; otherwise Accept, ties -> png."""
+    profile = request.GET.get("profile") or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise Http404("Unknown QR profile")
+    fmt = (request.GET.get("format") or "").lower()
+    if fmt:
+        if fmt not in FORMATS:
+            raise Http404("Unknown QR format")
+        return fmt, profile, False
+    accept = request.headers.get("Accept", "")
+    if accept and _accept_q(accept, "image/svg+xml") > _accept_q(accept, "image/png"):
+        return "svg", profile, True
+    return "png", profile, True
+
+
+def _qr_response(request, name: str, data: str, *, public: bool = True):
+    """Serve the cached render with a payload-derived ETag; revalidations get a 304 without touching disk."""
+    fmt, profile, varies = _negotiate(request)
+    etag = qr_etag(data, fmt, profile)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        path = Path(cached_qr_path(name, data, fmt, profile))
+        try:
+            response = FileResponse(path.open("rb"), content_type=FORMATS[fmt])
+        except FileNotFoundError:
+            # Evicted between caching and opening; serve a fresh render instead.
+            response = HttpResponse(render_qr(data, fmt, profile), content_type=FORMATS[fmt])
+    response["ETag"] = etag
+    if varies:
+        patch_vary_headers(response, ["Accept"])
+    # Not immutable: the URL carries no render version, so a QR_RENDER_VERSION bump must
+    # reach clients through ETag revalidation once max-age runs out.
+    max_age = getattr(settings, "ST_QR_CACHE_MAX_AGE", 3600)
+    if public:
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, max_age=max_age)
+    return response
+
+
 # QR cho ví (POS sẽ nhận ra dạng wallet:<addr_hex>)
 def wallet_qr_png(request, addr: str):
-    normalized = _normalize_addr(addr)
-    data = f"wallet:0x{normalized}"
-    path = Path(get_or_make_cached_png(f"wallet_{normalized}.png", data))
-    return FileResponse(path.open("rb"), content_type="image/png")
+    name, data = wallet_qr_spec(_normalize_addr(addr))
+    return _qr_response(request, name, data)
 
 # QR cho voucher cụ thể (voucher:<slug>:<addr_hex>)
 def voucher_qr_png(request, slug: str, addr: str):
     if not re.fullmatch(r"[A-Za-z0-9_-]+", slug or ""):
         raise Http404("Invalid voucher slug")
-    normalized = _normalize_addr(addr)
-    data = f"voucher:{slug}:0x{normalized}"
-    path = Path(get_or_make_cached_png(f"voucher_{slug}_{normalized}.png", data))
-    return FileResponse(path.open("rb"), content_type="image/png")
+    name, data = voucher_qr_spec(slug, _normalize_addr(addr))
+    return _qr_response(request, name, data)
 
 # QR cho QRClaim code (để POS scanner redeem)
 def qr_claim_png(request, code: str):
-    if not re.fullmatch(r"[A-Za-z0-9_-]+", code or ""):
+    if not claim_codes.is_acceptable(code) or not code_filter.might_exist(code):
         raise Http404("Invalid QR claim code")
-    data = code  # QRClaim code is the data itself
-    path = Path(get_or_make_cached_png(f"qr_claim_{code}.png", data))
-    return FileResponse(path.open("rb"), content_type="image/png")
+    name, data = claim_qr_spec(code)
+    # Claim codes are bearer tokens: keep them out of shared proxy caches.
+    return _qr_response(request, name, data, public=False)
 
 # QR cho voucher (admin export)
 def voucher_qr_png_admin(request, slug: str):
     if not re.fullmatch(r"[A-Za-z0-9_-]+", slug or ""):
         raise Http404("Invalid voucher slug")
-    data = f"voucher:{slug}:claim"
-    path = Path(get_or_make_cached_png(f"voucher_{slug}.png", data))
-    return FileResponse(path.open("rb"), content_type="image/png")
\ No newline at end of file
+    name, data = voucher_admin_qr_spec(slug)
+    return _qr_response(request, name, data, public=False)
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""Pre-generated custodial wallets.
+
+Key generation, encryption and the fsync'd keystore write happen ahead of
+time in ``refill`` (run by ``python manage.py refill_wallet_pool``); each
+generated wallet waits as a ``wallet_pool`` row (core/sql/0010). On first
+login ``take`` moves one row into ``wallet`` for the user in a single
+statement (``DELETE ... FOR UPDATE SKIP LOCKED ... RETURNING`` feeding the
+``INSERT`` and the ``stat_counter`` bump), so concurrent logins never wait on
+each other or get the same key. When the pool is empty the caller falls back
+to creating a key inline.
+
+``take`` takes no lock of its own. The ``NOT EXISTS`` guard skips users who
+already have a wallet, and the unique (user, chain) index (core/sql/0014)
+rejects the loser of two concurrent first logins of the same user, whose
+statement rolls back with its pool row intact. The inline path, which has
+slow key generation between its check and its INSERT, serializes on
+``lock_user`` instead.
+"""
+import logging
+import random
+import uuid
+
+from django.conf import settings
+from django.db import connection
+
+from . import counters
+from .adapters.wallet_provider import WalletProviderAdapter
+from .models import Wallet
+
+log = logging.getLogger(__name__)
+
+# Wallets generated and stored per keystore transaction while refilling.
+REFILL_BATCH = 100
+
+
+def size(provider: str, chain_id: int) -> int:
+    with connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM wallet_pool WHERE provider = %s AND chain_id = %s", [provider, chain_id])
+        return cur.fetchone()[0]
+
+
+def lock_user(user_id, chain_id: int) -> None:
+    """Hold the (user, chain) wallet-creation lock until the current transaction ends."""
+    with connection.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"wallet:{user_id}:{chain_id}"])
+
+
+def take(user, chain_id: int):
+    """Assign a pooled wallet to ``user``; None if the pool is empty or the user already has one.
+
+    One statement and no lock: the caller must either hold ``lock_user`` for
+    (user, chain) in its transaction or be ready for the IntegrityError the
+    unique (user, chain) index raises when a concurrent login won the race.
+    """
+    new_id = uuid.uuid4()
+    provider = settings.ST_PROVIDER
+    with connection.cursor() as cur:
+        # The last CTE is counters.bump("wallet") folded into the same statement.
+        cur.execute(
+            """
+            WITH picked AS (
+                DELETE FROM wallet_pool
+                WHERE provider_ref = (
+                    SELECT provider_ref FROM wallet_pool
+                    WHERE provider = %s AND chain_id = %s
+                    ORDER BY created_at
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                AND NOT EXISTS (SELECT 1 FROM wallet WHERE user_id = %s AND chain_id = %s)
+                RETURNING provider_ref, address, exportable
+            ),
+            inserted AS (
+                INSERT INTO wallet (id, user_id, provider, provider_ref, chain_id, address, exportable, export_status, created_at)
+                SELECT %s, %s, %s, provider_ref, %s, address, exportable, 'not_allowed', NOW()
+                FROM picked
+                RETURNING provider_ref, address, exportable, created_at
+            ),
+            bumped AS (
+                INSERT INTO stat_counter (key, stripe, value, updated_at)
+                SELECT 'wallet', %s, COUNT(*), NOW() FROM inserted HAVING COUNT(*) > 0
+                ON CONFLICT (key, stripe)
+                DO UPDATE SET value = stat_counter.value + EXCLUDED.value, updated_at = NOW()
+            )
+            SELECT provider_ref, address, exportable, created_at FROM inserted
+            """,
+            [
+                provider, chain_id, str(user.id), chain_id,
+                str(new_id), str(user.id), provider, chain_id,
+                random.randrange(counters.STRIPES),
+            ],
+        )
+        row = cur.fetchone()
+    if not row:
+        return None
+
+    provider_ref, address, exportable, created_at = row
+    # Everything is known from RETURNING; no re-SELECT.
+    return Wallet(
+        id=new_id,
+        user=user,
+        provider=provider,
+        provider_ref=provider_ref,
+        chain_id=chain_id,
+        address=bytes(address),
+        exportable=exportable,
+        export_status="not_allowed",
+        created_at=created_at,
+    )
+
+
+def refill(chain_id: int, target: int, *, batch: int = REFILL_BATCH, progress=None) -> int:
+    """Generate wallets until the pool for (ST_PROVIDER, ``chain_id``) holds ``target``; returns how many were added."""
+    provider = settings.ST_PROVIDER
+    adapter = WalletProviderAdapter(provider, chain_id)
+    added = 0
+    missing = target - size(provider, chain_id)
+    while missing > 0:
+        n = min(batch, missing)
+        # Keys are durable in the keystore before their pool rows become visible.
+        metas = adapter.create_wallets(n)
+        with connection.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO wallet_pool (provider_ref, provider, chain_id, address, exportable)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                [(m["provider_ref"], provider, chain_id, m["address_bytes"], m["exportable"]) for m in metas],
+            )
+        added += n
+        missing -= n
+        if progress:
+            progress(added)
+    return added
@@ -243,6 +243,9 @@ ST_OTP_WINDOW_SECONDS = int(os.getenv("ST_OTP_WINDOW_SECONDS", "300"))
 ST_DEMO_MODE = env_bool("ST_DEMO_MODE", False)
 ST_POS_VERIFY_ONCHAIN = env_bool("ST_POS_VERIFY_ONCHAIN", False)
 
+# Terminal/merchant directory cache for the admin pages (seconds); POS auth always reads the DB
+ST_TERMINAL_CACHE_SECONDS = int(os.getenv("ST_TERMINAL_CACHE_SECONDS", "60"))
+
 # POS API bảo vệ bằng khóa đơn giản
 ST_POS_API_KEY = os.getenv("ST_POS_API_KEY")
 if not ST_POS_API_KEY:
@@ -250,17 +253,63 @@ if not ST_POS_API_KEY:
 
 ST_WALLET_STORE_DIR = Path(os.getenv("ST_WALLET_STORE_DIR", BASE_DIR / "wallet_store")).resolve()
 ST_WALLET_STORE_DIR.mkdir(parents=True, exist_ok=True)
+# Custodial key records (core/adapters/keystore.py): "sqlite" = one indexed file, "json" = file per wallet.
+# The SQLite store still reads JSON files not yet moved by: python manage.py migrate_wallet_store
+ST_WALLET_KEYSTORE = os.getenv("ST_WALLET_KEYSTORE", "sqlite")
+ST_WALLET_KEYSTORE_PATH = Path(os.getenv("ST_WALLET_KEYSTORE_PATH", ST_WALLET_STORE_DIR / "keystore.sqlite3")).resolve()
 ST_WALLET_ENCRYPTION_KEY = os.getenv("ST_WALLET_ENCRYPTION_KEY")
+# "keystore": random key per wallet in the keystore above. "hd": keys derived (BIP-32/44) from one
+# master mnemonic, Fernet-encrypted with ST_WALLET_ENCRYPTION_KEY in ST_WALLET_HD_SEED_FILE
+# (create it with: python manage.py init_hd_seed). Wallets created in either mode keep working in both.
+ST_WALLET_MODE = os.getenv("ST_WALLET_MODE", "keystore")
+ST_WALLET_HD_SEED_FILE = Path(os.getenv("ST_WALLET_HD_SEED_FILE", ST_WALLET_STORE_DIR / "hd_seed.enc")).resolve()
+ST_WALLET_HD_CACHE_SIZE = int(os.getenv("ST_WALLET_HD_CACHE_SIZE", "1024"))
 ST_ALLOW_KEY_EXPORT = env_bool("ST_ALLOW_KEY_EXPORT", False)
+# Pre-generated wallets handed out on first login (core/wallet_pool.py); refilled by
+# python manage.py refill_wallet_pool [--loop] when fewer than LOW are left.
+ST_WALLET_POOL = env_bool("ST_WALLET_POOL", True)
+ST_WALLET_POOL_TARGET = int(os.getenv("ST_WALLET_POOL_TARGET", "500"))
+ST_WALLET_POOL_LOW = int(os.getenv("ST_WALLET_POOL_LOW", "100"))
 
 # Optional blockchain explorer prefixes (set in .env if you want clickable links)
 ST_EXPLORER_TX_PREFIX = os.getenv("ST_EXPLORER_TX_PREFIX", "")  # e.g. https://basescan.org/tx/
 ST_EXPLORER_ADDR_PREFIX = os.getenv("ST_EXPLORER_ADDR_PREFIX", "")  # e.g. https://basescan.org/address/
 
 
+# Key for the claim-code permutation and check characters (core/claim_codes.py). Required outside
+# DEBUG and never derived from SECRET_KEY (ephemeral in dev): codes issued under another key fail the check.
+ST_CLAIM_CODE_KEY = require_env_with_dev_default("ST_CLAIM_CODE_KEY", dev_default="dev-claim-code-key")
+# Still look up codes without check characters (md5/random formats issued before them).
+# Turn off once those have been redeemed or expired; junk scans are then rejected without a query.
+ST_CLAIM_CODE_ACCEPT_LEGACY = env_bool("ST_CLAIM_CODE_ACCEPT_LEGACY", True)
+# Per-process Bloom filter of existing codes (core/code_filter.py): junk scans miss without a query.
+ST_CLAIM_CODE_FILTER = env_bool("ST_CLAIM_CODE_FILTER", True)
+ST_CLAIM_CODE_FILTER_CAPACITY = int(os.getenv("ST_CLAIM_CODE_FILTER_CAPACITY", "1000000"))
+ST_CLAIM_CODE_FILTER_ERROR_RATE = float(os.getenv("ST_CLAIM_CODE_FILTER_ERROR_RATE", "0.001"))
+
 # QR image cache (tùy chọn)
 ST_QR_CACHE_DIR = Path(os.getenv("ST_QR_CACHE_DIR", BASE_DIR / "qr_cache")).resolve()
 ST_QR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# Budget for the sharded QR cache (core/qr_cache.py); 0 = unlimited. Policy: lru | lfu
+ST_QR_CACHE_MAX_BYTES = int(os.getenv("ST_QR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+ST_QR_CACHE_MAX_FILES = int(os.getenv("ST_QR_CACHE_MAX_FILES", "200000"))
+ST_QR_CACHE_POLICY = os.getenv("ST_QR_CACHE_POLICY", "lru")
+# Cache-Control max-age for /qr/*.png. URLs are not versioned, so keep it short: after it expires
+# clients revalidate with the ETag (a 304 without disk I/O) and pick up a QR_RENDER_VERSION bump.
+ST_QR_CACHE_MAX_AGE = int(os.getenv("ST_QR_CACHE_MAX_AGE", "3600"))
+# Render processes per request for bulk QR downloads (campaign zip)
+ST_QR_BULK_WORKERS = int(os.getenv("ST_QR_BULK_WORKERS", "2"))
+
+# Background export files (python manage.py run_export_jobs)
+ST_EXPORT_DIR = Path(os.getenv("ST_EXPORT_DIR", BASE_DIR / "exports")).resolve()
+ST_EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+# The synchronous export endpoints stream at most this many rows (QR PDF: vouchers);
+# anything larger is queued as a background job and the request redirected to its status.
+ST_EXPORT_SYNC_MAX_ROWS = int(os.getenv("ST_EXPORT_SYNC_MAX_ROWS", "20000"))
+ST_EXPORT_SYNC_MAX_VOUCHERS = int(os.getenv("ST_EXPORT_SYNC_MAX_VOUCHERS", "10"))
+
+# Day-partitioned Parquet files written by: python manage.py export_analytics
+ST_ANALYTICS_DIR = Path(os.getenv("ST_ANALYTICS_DIR", BASE_DIR / "analytics")).resolve()
 
 EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "no-reply@staytoken.local")